@@ -0,0 +1,109 @@
+"""
+Load test of answer autosave: `--students` students each clicking an answer
+about once per second (0.5-1.5 s apart) for `--duration` seconds.
+
+Serves the app with uvicorn in its own process and runs two client modes:
+
+- debounced: like exam.js, changed answers are sent as one delta after a
+  1 s pause in clicking, or 5 s after the oldest unsent change;
+- every-click: one request per click, as a naive autosave would send.
+
+Reports the request rate, errors, latency and server CPU time per request,
+and what the DraftBuffer made of the deltas: answers received, draft rows
+written and flushes. On a small machine the clients compete with the server
+for CPU, so rates and latencies are a lower bound; the CPU time per request
+is the server's own cost.
+
+    python bench/autosave_load.py --students 500 --duration 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from harness import ADMIN_HEADERS, add_exam, approve, cpu_seconds, load_worker, percentile, scratch_dir, serve
+
+DEBOUNCE = 1.0
+MAX_WAIT = 5.0
+
+async def student(client, student_id, questions, args, debounced, stats):
+    rng = random.Random(student_id)
+    delta, since = {}, None
+
+    async def send():
+        nonlocal delta, since
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/exam/draft", params={"student_id": student_id, "exam_id": "bench"}, json={"answers": delta}
+        )
+        stats["latencies"].append(time.perf_counter() - start)
+        if response.status_code != 204:
+            stats["errors"] += 1
+        delta, since = {}, None
+
+    loop = asyncio.get_running_loop()
+    end = loop.time() + args.duration
+    click = loop.time() + rng.uniform(0, 1)
+    while click < end:
+        await asyncio.sleep(max(0, click - loop.time()))
+        delta[str(rng.randint(1, questions))] = rng.choice("abcd")
+        since = since or click
+        if not debounced:
+            await send()
+        next_click = click + rng.uniform(0.5, 1.5)
+        due = min(click + DEBOUNCE, since + MAX_WAIT) if debounced else None
+        if due is not None and due <= next_click:
+            await asyncio.sleep(max(0, due - loop.time()))
+            await send()
+        click = next_click
+    if delta:
+        await send()
+
+async def run(args, base_url, server_pid, student_ids):
+    async with httpx.AsyncClient(base_url=base_url, trust_env=False, timeout=30,
+                                 limits=httpx.Limits(max_connections=100)) as client:
+        for debounced in (True, False):
+            stats = {"latencies": [], "errors": 0}
+            before = (await client.get("/metrics", headers=ADMIN_HEADERS)).json()["drafts"]
+            cpu = cpu_seconds(server_pid)
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                student(client, s, args.questions, args, debounced, stats) for s in student_ids
+            ))
+            elapsed = time.perf_counter() - start
+            cpu = cpu_seconds(server_pid) - cpu
+            # Let the last batch reach storage
+            await asyncio.sleep(args.flush_interval + 0.5)
+            after = (await client.get("/metrics", headers=ADMIN_HEADERS)).json()["drafts"]
+            latencies = stats["latencies"]
+            
+            print(f"{'debounced' if debounced else 'every-click'}: {len(student_ids)} students, {elapsed:.0f} s")
+            print(f"  {len(latencies) / elapsed:7.1f} requests/s, {stats['errors']} errors, "
+                  f"p50 {percentile(latencies, 0.5) * 1e3:.1f} ms, p99 {percentile(latencies, 0.99) * 1e3:.1f} ms")
+            print(f"  server CPU {cpu / len(latencies) * 1e3:.2f} ms per request")
+            print("  " + ", ".join(f"{after[k] - before[k]} {k}" for k in ("deltas", "answers", "written", "flushes")))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--flush-interval", type=float, default=2, help="DRAFT_FLUSH_INTERVAL of the server")
+    args = parser.parse_args()
+
+    with scratch_dir() as workdir:
+        worker = load_worker(workdir, DRAFT_FLUSH_INTERVAL=str(args.flush_interval))
+        # The server process loads the exam and the students from the database
+        worker.storage.open()
+        add_exam(worker, "bench", args.questions)
+        student_ids = [f"s{n}" for n in range(args.students)]
+        for student_id in student_ids:
+            approve(worker, student_id)
+        worker.storage.flush()
+        with serve(worker) as (base_url, server_pid):
+            asyncio.run(run(args, base_url, server_pid, student_ids))
+
+if __name__ == "__main__":
+    main()
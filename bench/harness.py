@@ -0,0 +1,160 @@
+"""
+Helpers shared by the benchmarks.
+
+Like the tests, every benchmark runs main.py in a scratch directory with its
+own SQLite database, and Telegram is replaced by a recorder. Run the scripts
+from the repository root, e.g. `python bench/storage_throughput.py`.
+"""
+import contextlib
+import importlib.util
+import itertools
+import logging
+import os
+import multiprocessing
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_module_ids = itertools.count()
+
+SECRET_KEY = "bench-secret"
+# For the admin endpoints, such as /metrics
+ADMIN_HEADERS = {"Authorization": f"Bearer {SECRET_KEY}"}
+
+def fake_telegram(worker):
+    """Keep the worker off the network and record what it would send."""
+    async def noop(*args, **kwargs):
+        pass
+
+    worker.init_telegram_bot = noop
+    worker.telegram_app = types.SimpleNamespace(
+        bot=types.SimpleNamespace(send_message=noop),
+        updater=types.SimpleNamespace(running=False),
+        running=False,
+        stop=noop,
+        shutdown=noop
+    )
+    worker.notifications = []
+    worker.send_telegram_message = worker.notifications.append
+
+@contextlib.contextmanager
+def scratch_dir():
+    """A temporary working directory with the app's templates and static files."""
+    previous = os.getcwd()
+    path = Path(tempfile.mkdtemp(prefix="exam-bench-"))
+    (path / "templates").symlink_to(ROOT / "templates")
+    (path / "static").symlink_to(ROOT / "static")
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(path, ignore_errors=True)
+
+def load_worker(workdir: Path, **settings):
+    """Load a fresh copy of main.py configured with `settings`, sharing workdir's database."""
+    env = {
+        "TELEGRAM_BOT_TOKEN": "123:bench",
+        "ADMIN_CHAT_ID": "-100",
+        "SECRET_KEY": SECRET_KEY,
+        "DATABASE_PATH": str(workdir / "exam.db"),
+        "STUDENT_SESSIONS": "false",
+        "RATE_LIMIT_ENABLED": "false"
+    }
+    env.update(settings)
+    os.environ.update(env)
+    spec = importlib.util.spec_from_file_location(f"exam_bench_{next(_module_ids)}", ROOT / "main.py")
+    worker = importlib.util.module_from_spec(spec)
+    # Registered so that PDF worker processes can unpickle its functions
+    sys.modules[spec.name] = worker
+    spec.loader.exec_module(worker)
+    fake_telegram(worker)
+    # Per-request info logs would dominate the timings
+    for name in (worker.__name__, "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    return worker
+
+def add_exam(worker, exam_id: str, question_count: int, answers=None):
+    """Publish a synthetic exam with `question_count` four-option questions."""
+    parsed = {
+        "questions": [
+            {"id": i, "text": f"{exam_id} question {i}", "options": [{"id": o, "text": o} for o in "abcd"]}
+            for i in range(1, question_count + 1)
+        ],
+        "page_offsets": [0]
+    }
+    pdf_path = os.path.join("uploads", f"{exam_id}.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(exam_id.encode())
+    digest = worker.hash_file(pdf_path)
+    worker.write_parse_cache(worker.parse_cache_path(digest), parsed)
+    exam = worker.Exam(exam_id, title=exam_id, pdf_path=pdf_path, digest=digest, answers=answers)
+    worker.exam_registry.add(exam)
+    worker.publish_exam(exam, parsed)
+    return exam
+
+def approve(worker, student_id: str):
+    student = {"student_id": student_id, "name": "Name", "surname": "Surname"}
+    worker.approved_students[student_id] = student
+    worker.storage.put("approved_students", student_id, student)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextlib.contextmanager
+def serve(worker):
+    """
+    Serve the worker's app with uvicorn in a forked process, so that load
+    generators in this process do not share its event loop. Yields the base
+    URL and the pid of the server process.
+    """
+    port = free_port()
+    config = uvicorn.Config(worker.app, port=port, log_level="warning", access_log=False)
+    process = multiprocessing.get_context("fork").Process(target=uvicorn.Server(config).run, daemon=True)
+    process.start()
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{base_url}/metrics", trust_env=False)
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline or not process.is_alive():
+                    raise RuntimeError("The server did not start")
+                time.sleep(0.1)
+        yield base_url, process.pid
+    finally:
+        process.terminate()
+        process.join()
+
+def cpu_seconds(pid: int) -> float:
+    """CPU time used so far by a process (Linux only)."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def percentile(samples, fraction: float) -> float:
+    """The sample at `fraction` (0-1) of the sorted samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def timed(function, *args, repeat: int = 1):
+    """Best wall-clock time of `repeat` calls, and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
@@ -0,0 +1,41 @@
+"""
+Question parser microbenchmark: the single-pass tokenizer against the old
+line-prefix parser on exams of 1k and 10k questions.
+
+Both parsers must give the same questions on these inputs; the old parser
+ignores questions numbered 100 and above, so its inputs are renumbered
+1-99 in a cycle, which it reads the same way.
+
+    python bench/parser.py --sizes 1000 10000
+"""
+import argparse
+import sys
+
+from harness import ROOT, load_worker, scratch_dir, timed
+
+sys.path.insert(0, str(ROOT / "tests"))
+import legacy_parser  # noqa: E402
+from parser_corpus import numbered_exam_text  # noqa: E402
+
+def cycled_exam_text(question_count: int) -> str:
+    """An exam of `question_count` questions numbered 1-99 over and over."""
+    return "\n".join(numbered_exam_text(min(99, question_count - start))
+                     for start in range(0, question_count, 99))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with scratch_dir() as workdir:
+        worker = load_worker(workdir)
+        for size in args.sizes:
+            text = cycled_exam_text(size)
+            new, questions = timed(worker.extract_questions_from_text, text, repeat=args.repeat)
+            old, expected = timed(legacy_parser.extract_questions_from_text, text, repeat=args.repeat)
+            assert questions == expected and len(questions) == size
+            print(f"{size:6d} questions: tokenizer {new:7.3f} s, old parser {old:7.3f} s ({old / new:.0f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+PDF parsing time of a synthetic 500-page exam with 1 to N worker processes.
+
+Builds the PDF with PyMuPDF (8 questions per page), then parses it with
+parse_pdf at each worker count. One worker parses the page ranges one after
+another; more workers parse all ranges at once and stitch them in order.
+Every run must give the same questions. Timings include starting the pool.
+
+    python bench/pdf_scaling.py --pages 500 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import fitz
+
+from harness import load_worker, scratch_dir
+
+def make_pdf(path: str, pages: int, per_page: int = 8):
+    doc = fitz.open()
+    n = 1
+    for _ in range(pages):
+        page = doc.new_page()
+        y = 40
+        for _ in range(per_page):
+            for line in [f"{n}. What is item {n} about?", "a) first", "b) second", "c) third", "d) fourth"]:
+                page.insert_text((40, y), line)
+                y += 14
+            n += 1
+    doc.save(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with scratch_dir() as workdir:
+        worker = load_worker(workdir, PDF_PARALLEL_MIN_PAGES="1")
+        pdf_path = str(workdir / "uploads" / "bench.pdf")
+        make_pdf(pdf_path, args.pages)
+        print(f"{args.pages} pages, {os.cpu_count()} CPUs")
+        expected = None
+        baseline = None
+        for workers in args.workers:
+            worker.PDF_WORKERS = workers
+            worker.pdf_executor = None
+            start = time.perf_counter()
+            exam = asyncio.run(worker.parse_pdf(pdf_path))
+            elapsed = time.perf_counter() - start
+            worker.pdf_executor.shutdown()
+            expected = expected or exam["questions"]
+            assert exam["questions"] == expected
+            baseline = baseline or elapsed
+            print(f"  {workers:2d} workers: {elapsed:6.2f} s, {len(exam['questions'])} questions "
+                  f"({baseline / elapsed:.1f}x)")
+
+if __name__ == "__main__":
+    main()
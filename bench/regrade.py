@@ -0,0 +1,56 @@
+"""
+Regrading benchmark: 10k stored results of a 200-question exam rescored when
+the answer key changes.
+
+Times building the answer matrix from the stored results, rescoring the
+matrix against a new key (what /answer does), the full regrade_results pass
+that updates and queues the changed results, and, for comparison, a plain
+loop over every result. The matrix scores must equal the loop's.
+
+    python bench/regrade.py --students 10000 --questions 200
+"""
+import argparse
+import operator
+import random
+
+from harness import add_exam, load_worker, scratch_dir, timed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--questions", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with scratch_dir() as workdir:
+        worker = load_worker(workdir)
+        exam = add_exam(worker, "bench", args.questions, answers=[rng.choice("abcd") for _ in range(args.questions)])
+        for n in range(args.students):
+            answers = [rng.choice("abcd") for _ in range(args.questions)]
+            exam.results[f"s{n}"] = {"correct": 0, "incorrect": 0, "total": args.questions, "answers": answers}
+        print(f"{args.students} students x {args.questions} questions")
+        
+        build, _ = timed(exam.load, exam.parsed)
+        print(f"  build the matrix from stored results: {build * 1e3:7.1f} ms")
+        
+        key = [rng.choice("abcd") for _ in range(args.questions)]
+        rescore, _ = timed(exam.apply_answers, key)
+        print(f"  rescore the matrix against a new key: {rescore * 1e3:7.1f} ms")
+        
+        regrade, changes = timed(worker.regrade_results, exam)
+        print(f"  regrade_results, {len(changes)} results changed: {regrade * 1e3:7.1f} ms")
+        
+        def loop():
+            return {
+                student_id: sum(map(operator.eq, result["answers"], key))
+                for student_id, result in exam.results.items()
+            }
+        
+        looped, expected = timed(loop, repeat=3)
+        matrix, scores = timed(exam.matrix.scores, exam.index.key, repeat=3)
+        assert scores == expected
+        print(f"  matrix scores:    {matrix * 1e3:7.1f} ms")
+        print(f"  per-result loop:  {looped * 1e3:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
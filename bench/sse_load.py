@@ -0,0 +1,117 @@
+"""
+Load test of students waiting for approval: polling against Server-Sent Events.
+
+Serves the app with uvicorn, registers `--students` pending students and
+lets them wait `--wait` seconds before every one is approved through
+handle_approval at once, as when an admin works through the list.
+
+- Polling: each student requests /check-approval/{student_id} every
+  `--interval` seconds, like loading.html without EventSource.
+- SSE: each student holds one /events/{student_id} stream.
+
+Reports the request rate while students wait, the latency of those
+requests, and the time from the approval to each student seeing it. The
+clients share the server's CPU, so on a small machine the numbers are
+a lower bound.
+
+    python bench/sse_load.py --students 300 --wait 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import types
+
+import httpx
+import uvicorn
+
+from harness import free_port, load_worker, percentile, scratch_dir
+
+async def approve_all(worker, student_ids):
+    """Approve every student through the Telegram callback handler."""
+    async def noop(*args, **kwargs):
+        pass
+
+    for student_id in student_ids:
+        query = types.SimpleNamespace(data=f"approve:{student_id}", answer=noop, edit_message_text=noop)
+        await worker.handle_approval(types.SimpleNamespace(callback_query=query), None)
+
+async def poll(client, base, student_id, interval, latencies, seen):
+    # Students opened the page at different times
+    await asyncio.sleep(random.uniform(0, interval))
+    while True:
+        start = time.perf_counter()
+        response = await client.get(f"{base}/check-approval/{student_id}")
+        latencies.append(time.perf_counter() - start)
+        if response.json().get("status") == "approved":
+            seen.append(time.perf_counter())
+            return
+        await asyncio.sleep(interval)
+
+async def listen(client, base, student_id, opened, seen):
+    async with client.stream("GET", f"{base}/events/{student_id}") as response:
+        opened.append(student_id)
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:") and event == "approval":
+                if json.loads(line[5:]).get("status") == "approved":
+                    seen.append(time.perf_counter())
+                    return
+
+async def run(args):
+    with scratch_dir() as workdir:
+        worker = load_worker(workdir)
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        server = uvicorn.Server(uvicorn.Config(worker.app, port=port, log_level="warning", access_log=False))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        limits = httpx.Limits(max_connections=args.students + 10)
+        async with httpx.AsyncClient(trust_env=False, timeout=60, limits=limits) as client:
+            for mode in ("polling", "sse"):
+                student_ids = [f"{mode}-{n}" for n in range(args.students)]
+                for student_id in student_ids:
+                    worker.pending_students[student_id] = {"student_id": student_id, "name": "Name", "surname": "S"}
+                latencies, seen, opened = [], [], []
+                if mode == "polling":
+                    tasks = [
+                        asyncio.create_task(poll(client, base, s, args.interval, latencies, seen))
+                        for s in student_ids
+                    ]
+                else:
+                    tasks = [asyncio.create_task(listen(client, base, s, opened, seen)) for s in student_ids]
+                    while len(opened) < len(student_ids):
+                        await asyncio.sleep(0.05)
+                
+                # Count the requests the waiting students make
+                before = len(latencies)
+                await asyncio.sleep(args.wait)
+                rate = (len(latencies) - before) / args.wait
+                approved_at = time.perf_counter()
+                await approve_all(worker, student_ids)
+                await asyncio.gather(*tasks)
+                delays = [t - approved_at for t in seen]
+                
+                print(f"{mode}: {args.students} students")
+                print(f"  requests while waiting: {rate:7.1f} req/s")
+                if latencies:
+                    print(f"  request latency:        p50 {percentile(latencies, 0.5) * 1e3:6.1f} ms, "
+                          f"p99 {percentile(latencies, 0.99) * 1e3:6.1f} ms")
+                print(f"  approval seen after:    p50 {percentile(delays, 0.5) * 1e3:6.1f} ms, "
+                      f"p99 {percentile(delays, 0.99) * 1e3:6.1f} ms")
+        server.should_exit = True
+        await serving
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--wait", type=float, default=10, help="seconds the students wait before the approvals")
+    parser.add_argument("--interval", type=float, default=2, help="polling interval of loading.html")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
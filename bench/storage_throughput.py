@@ -0,0 +1,95 @@
+"""
+Submission throughput with the SQLite store against the in-memory dict path.
+
+Submits one exam per student through POST /submit-exam twice: once with the
+store as configured, and once with every storage call replaced by a no-op,
+which is how state was kept before the store existed. Also times queuing a
+result write against a plain dict assignment, and one batched commit.
+
+    python bench/storage_throughput.py --students 2000 --questions 50
+"""
+import argparse
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from harness import add_exam, approve, load_worker, scratch_dir
+
+def without_storage(worker):
+    """Turn every storage write into a no-op, leaving only the dicts."""
+    async def claim(collection, key, taken, writes):
+        return None
+
+    async def sync():
+        pass
+
+    storage = worker.storage
+    storage.put = storage.delete = storage.clear = storage.send = lambda *args, **kwargs: None
+    storage.claim = claim
+    storage.sync = sync
+
+def submissions_per_second(students: int, questions: int, dict_only: bool) -> float:
+    with scratch_dir() as workdir:
+        worker = load_worker(workdir)
+        with TestClient(worker.app) as client:
+            add_exam(worker, "bench", questions, answers=["a"] * questions)
+            for n in range(students):
+                approve(worker, f"s{n}")
+            worker.storage.flush()
+            if dict_only:
+                without_storage(worker)
+            answers = json.dumps({str(q): "abcd"[q % 4] for q in range(1, questions + 1)})
+            start = time.perf_counter()
+            for n in range(students):
+                response = client.post(
+                    "/submit-exam",
+                    data={"student_id": f"s{n}", "answers": answers, "exam_id": "bench"},
+                    follow_redirects=False
+                )
+                assert response.status_code == 303, response.text
+            elapsed = time.perf_counter() - start
+        return students / elapsed
+
+def write_costs(rows: int, questions: int):
+    with scratch_dir() as workdir:
+        worker = load_worker(workdir)
+        worker.storage.open()
+        result = {"correct": 1, "answers": ["a"] * questions}
+        
+        start = time.perf_counter()
+        for n in range(rows):
+            worker.storage.put("student_results:bench", f"s{n}", result)
+        queued = (time.perf_counter() - start) / rows
+        
+        start = time.perf_counter()
+        worker.storage.flush()
+        commit = time.perf_counter() - start
+        
+        results = {}
+        start = time.perf_counter()
+        for n in range(rows):
+            results[f"s{n}"] = result
+        assigned = (time.perf_counter() - start) / rows
+        return queued, assigned, commit
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=50)
+    args = parser.parse_args()
+
+    with_store = submissions_per_second(args.students, args.questions, dict_only=False)
+    dict_only = submissions_per_second(args.students, args.questions, dict_only=True)
+    print(f"POST /submit-exam, {args.students} students x {args.questions} questions")
+    print(f"  dicts only:   {dict_only:8.0f} submissions/s")
+    print(f"  SQLite store: {with_store:8.0f} submissions/s ({dict_only / with_store:.1f}x slower)")
+
+    queued, assigned, commit = write_costs(args.students, args.questions)
+    print(f"Writing {args.students} results")
+    print(f"  dict assignment: {assigned * 1e6:6.1f} us each")
+    print(f"  queued write:    {queued * 1e6:6.1f} us each")
+    print(f"  batched commit:  {commit * 1e3:6.1f} ms for all")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, Request, Form, HTTPException, Query, Body, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, Form, HTTPException, Query, Body, Depends, Header
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,16 +8,45 @@ import os
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.error import BadRequest, NetworkError, RetryAfter
 import fitz  
 import json
+import math
+import hashlib
+import heapq
+import hmac
+import operator
+import re
+import gzip
+import csv
+import html
+import io
+import tempfile
 from pathlib import Path
+import urllib.parse
 import uuid
+import mimetypes
+import secrets
 import asyncio
+import contextlib
 import logging
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 from pydantic import BaseModel, Field
+from jose import JWTError, jwt
 from typing import Optional, Dict, Any, List, Union
 import datetime
 
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -43,6 +72,102 @@ if not SECRET_KEY:
 # Convert ADMIN_CHAT_ID to int for comparison
 ADMIN_CHAT_ID_INT = int(ADMIN_CHAT_ID)
 
+# SQLite database used to persist state across restarts
+DATABASE_PATH = os.getenv("DATABASE_PATH", "exam.db")
+
+# Worker processes used for PDF parsing, and how many pages each task extracts
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "10"))
+# PDFs with at least this many pages have their page ranges parsed in parallel
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "50"))
+
+# Parsed exams are cached next to the uploads, keyed by PDF hash and parser version.
+# Bump PARSER_VERSION whenever extraction output changes so stale sidecars are ignored.
+PARSE_CACHE_DIR = os.path.join("uploads", ".parsed")
+PARSER_VERSION = 3
+
+# Exams are kept by id. At most EXAM_CACHE_SIZE of them stay parsed in memory;
+# the others are read back from their parse cache sidecar when next used.
+EXAM_CACHE_SIZE = int(os.getenv("EXAM_CACHE_SIZE", "4"))
+
+# Keep the full document text in the loaded exam (off by default to bound memory)
+KEEP_RAW_TEXT = os.getenv("KEEP_RAW_TEXT", "false").lower() in ("1", "true", "yes")
+
+# Content-hashed static assets. The manifest mapping logical names to them is
+# kept in storage; older versions wrote it to ASSET_MANIFEST_PATH.
+ASSETS_DIR = "assets"
+ASSET_MANIFEST_PATH = os.path.join(ASSETS_DIR, "manifest.json")
+# Source files published as hashed assets at startup
+STATIC_ASSET_SOURCES = {
+    "exam.css": os.path.join("static", "css", "exam.css"),
+    "exam.js": os.path.join("static", "js", "exam.js")
+}
+
+# Outbound Telegram messages are queued and sent by a background dispatcher.
+# Telegram allows about one message per second in a private chat and 20 per
+# minute in a group; bursts beyond that are answered with 429 Retry-After.
+TELEGRAM_QUEUE_SIZE = int(os.getenv("TELEGRAM_QUEUE_SIZE", "1000"))
+TELEGRAM_GROUP_MESSAGES_PER_MINUTE = int(os.getenv("TELEGRAM_GROUP_MESSAGES_PER_MINUTE", "20"))
+TELEGRAM_MAX_ATTEMPTS = 5
+TELEGRAM_MESSAGE_LIMIT = 4096  # Maximum characters in one Telegram message
+
+# Accept-then-grade mode: submissions are stored in a durable queue and graded
+# in batches by a background worker instead of inside the request
+ASYNC_GRADING = os.getenv("ASYNC_GRADING", "false").lower() in ("1", "true", "yes")
+GRADING_BATCH_SIZE = int(os.getenv("GRADING_BATCH_SIZE", "100"))
+# Tries at grading a queued submission, with exponential backoff in between,
+# before it is given up and the student is asked to submit again
+GRADING_MAX_ATTEMPTS = int(os.getenv("GRADING_MAX_ATTEMPTS", "5"))
+
+# Request throttling: token buckets per client IP and per student. Each rule
+# is (requests per minute, burst). Per-IP limits are generous because a whole
+# classroom often shares one address; the per-student ones only apply to
+# requests with a valid student session. RATE_LIMITS (JSON) overrides any
+# rule, e.g. {"submit-student": {"ip": [30, 10]}}.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_RULES = {
+    "submit-student": {"ip": (60, 30)},
+    "submit-exam": {"ip": (120, 60), "student": (6, 5)},
+    "status": {"ip": (1200, 300), "student": (60, 20)},
+    "draft": {"ip": (12000, 2000), "student": (120, 30)}
+}
+for _rule, _limits in json.loads(os.getenv("RATE_LIMITS", "{}")).items():
+    RATE_LIMIT_RULES.setdefault(_rule, {}).update({scope: tuple(limit) for scope, limit in _limits.items()})
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+# Take the client address from X-Forwarded-For; enable only behind a proxy that sets it
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() in ("1", "true", "yes")
+
+# Multi-worker mode: WORKERS server processes share the SQLite database. Each
+# keeps its in-memory state current by tailing a change log the others write
+# to every WORKER_SYNC_INTERVAL seconds, and the worker holding the leader
+# lease polls Telegram and grades queued submissions.
+WORKERS = int(os.getenv("WORKERS", "1"))
+MULTI_WORKER = WORKERS > 1
+WORKER_SYNC_INTERVAL = float(os.getenv("WORKER_SYNC_INTERVAL", "0.05"))
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+CHANGE_LOG_RETENTION = 600  # Seconds of changes kept for workers that fall behind
+
+# Student sessions: approving a student issues a signed token (an HS256 JWT)
+# that is only valid together with the claim cookie of the browser that
+# registered. Student pages check it rather than trusting the student ID in
+# the URL; every worker derives the same signing key from SECRET_KEY.
+STUDENT_SESSIONS = os.getenv("STUDENT_SESSIONS", "true").lower() in ("1", "true", "yes")
+SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", str(4 * 3600)))
+SESSION_COOKIE = "exam_session"
+CLAIM_COOKIE = "exam_claim"
+
+# Timed exams (/timer): the clock of an attempt starts when the student first
+# opens the exam. An attempt still open DEADLINE_GRACE seconds after its
+# deadline is submitted by the server with the student's saved draft; the
+# grace leaves time for the page's own submission at the deadline to arrive.
+DEADLINE_GRACE = float(os.getenv("DEADLINE_GRACE", "10"))
+
+# Autosaved answers are merged into the draft in memory at once and written
+# to storage every DRAFT_FLUSH_INTERVAL seconds, one row per changed draft.
+# Keep it well below DEADLINE_GRACE so drafts saved on another worker reach
+# the leader before it auto-submits.
+DRAFT_FLUSH_INTERVAL = float(os.getenv("DRAFT_FLUSH_INTERVAL", "2"))
+
 app = FastAPI(
     title="Exam Management System",
     description="A system for managing student exams with Telegram integration",
@@ -55,6 +180,7 @@ app = FastAPI(
 Path("static").mkdir(exist_ok=True)
 Path("templates").mkdir(exist_ok=True)
 Path("uploads").mkdir(exist_ok=True)
+Path(ASSETS_DIR).mkdir(exist_ok=True)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -71,20 +197,1480 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage (replace with database in production)
+class ExamStorage:
+    """
+    Durable key/value storage backed by SQLite in WAL mode.
+
+    The module-level dicts remain the hot read path; every mutation is also
+    queued here and written behind in batches by a background flusher, so a
+    request never waits for a disk commit. Repeated writes to the same key
+    between two flushes are coalesced into one row update. With several
+    workers, each batch is also appended to a change log in the same
+    transaction, which the other workers tail (see ChangeFeed).
+    """
+
+    # Statements are kept as constants so sqlite3 reuses its prepared statements
+    # Every written row takes the next `seq`, so rows changed after a known
+    # point can be read back in commit order whatever their timestamps say.
+    # A removed row leaves a tombstone numbered the same way; writing the key
+    # again drops it.
+    UPSERT_SQL = (
+        "INSERT INTO kv (collection, key, value, seq) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(collection, key) DO UPDATE SET value = excluded.value, seq = excluded.seq"
+    )
+    LAST_SEQ_SQL = (
+        "SELECT MAX((SELECT COALESCE(MAX(seq), 0) FROM kv), (SELECT COALESCE(MAX(seq), 0) FROM tombstones))"
+    )
+    CHANGED_SQL = (
+        "SELECT seq, key, value FROM kv WHERE collection = ? AND seq > ? AND seq <= ? "
+        "UNION ALL SELECT seq, key, NULL FROM tombstones WHERE collection = ? AND seq > ? AND seq <= ? "
+        "ORDER BY seq LIMIT ?"
+    )
+    TOMBSTONE_SQL = (
+        "INSERT INTO tombstones (collection, key, seq) SELECT collection, key, ? FROM kv "
+        "WHERE collection = ? AND key = ? ON CONFLICT(collection, key) DO UPDATE SET seq = excluded.seq"
+    )
+    REVIVE_SQL = "DELETE FROM tombstones WHERE collection = ? AND key = ?"
+    KEYS_SQL = "SELECT key FROM kv WHERE collection = ? ORDER BY seq"
+    DELETE_SQL = "DELETE FROM kv WHERE collection = ? AND key = ?"
+    SELECT_SQL = "SELECT key, value FROM kv WHERE collection = ?"
+    # Change log read by the other workers: a NULL value is a delete, a NULL key a clear
+    LOG_SQL = "INSERT INTO changes (origin, collection, key, value, created) VALUES (?, ?, ?, ?, ?)"
+    CHANGES_SQL = "SELECT seq, origin, collection, key, value FROM changes WHERE seq > ? ORDER BY seq LIMIT ?"
+    LAST_CHANGE_SQL = "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+    VALUE_SQL = "SELECT value FROM kv WHERE collection = ? AND key = ?"
+    PRUNE_SQL = "DELETE FROM changes WHERE created < ?"
+    LEASE_SQL = (
+        "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+        "WHERE leases.owner = excluded.owner OR leases.expires < ?"
+    )
+
+    def __init__(self, path: str, flush_interval: float = 0.05, batch_size: int = 500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.origin = None  # This worker's id in the change log; None while no other worker reads it
+        self._conn = None
+        self._reader = None  # Separate connection for tailing the change log
+        self._conn_lock = threading.Lock()
+        self._pending = {}  # (collection, key) -> JSON value, or None for a delete
+        self._clears = set()
+        self._messages = []  # (collection, key, JSON value) only written to the change log
+        self._wakeup = None
+        self._flusher_task = None
+        self._commit_waiter = None  # Resolved when the next batch is committed
+
+    def open(self):
+        """Open the database, enable WAL mode and create the schema."""
+        # Other workers may hold the write lock for a commit; wait for them
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "seq INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (collection, key))"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(kv)")]
+        if "seq" not in columns:
+            # Databases from before `seq`; their rows count as written before any new one
+            self._conn.execute("ALTER TABLE kv ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_seq ON kv (seq)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_collection_seq ON kv (collection, seq)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tombstones ("
+            "collection TEXT NOT NULL, key TEXT NOT NULL, seq INTEGER NOT NULL, PRIMARY KEY (collection, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tombstones_seq ON tombstones (seq)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tombstones_collection_seq ON tombstones (collection, seq)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, collection TEXT NOT NULL, "
+            "key TEXT, value TEXT, created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        logger.info(f"Opened SQLite storage at {self.path}")
+
+    def load(self, collection: str) -> Dict[str, Any]:
+        """Read every entry of a collection."""
+        with self._conn_lock:
+            rows = self._conn.execute(self.SELECT_SQL, (collection,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def put(self, collection: str, key, value=True):
+        """Queue an insert or update of a single entry."""
+        self._pending[(collection, str(key))] = json.dumps(value, ensure_ascii=False)
+        self._schedule()
+
+    def delete(self, collection: str, key):
+        """Queue the removal of a single entry."""
+        self._pending[(collection, str(key))] = None
+        self._schedule()
+
+    def clear(self, collection: str):
+        """Queue the removal of every entry of a collection."""
+        self._pending = {k: v for k, v in self._pending.items() if k[0] != collection}
+        self._clears.add(collection)
+        self._schedule()
+
+    def send(self, collection: str, key, value):
+        """
+        Queue a message for the other workers, such as a student event. It is
+        written to the change log with the next batch, which is committed at once.
+        """
+        if self.origin is None:
+            return
+        self._messages.append((collection, str(key), json.dumps(value, ensure_ascii=False)))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _schedule(self):
+        if self._wakeup and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _take_batch(self):
+        batch = self._clears, self._pending, self._messages
+        self._clears, self._pending, self._messages = set(), {}, []
+        return batch
+
+    def _change_rows(self, clears, pending, messages):
+        """Change log rows of a batch, in the order the batch applies them."""
+        now = time.time()
+        rows = [(self.origin, c, None, None, now) for c in clears]
+        rows.extend((self.origin, c, k, v, now) for (c, k), v in pending.items())
+        rows.extend((self.origin, c, k, v, now) for c, k, v in messages)
+        return rows
+
+    def _upsert(self, rows):
+        """Write (collection, key, value) rows inside an open transaction, numbering them in order."""
+        last = self._conn.execute(self.LAST_SEQ_SQL).fetchone()[0]
+        self._conn.executemany(self.UPSERT_SQL, [(c, k, v, last + i) for i, (c, k, v) in enumerate(rows, 1)])
+        self._conn.executemany(self.REVIVE_SQL, [(c, k) for c, k, _ in rows])
+
+    def _remove(self, rows):
+        """Delete (collection, key) rows inside an open transaction, numbering a tombstone for each stored one."""
+        last = self._conn.execute(self.LAST_SEQ_SQL).fetchone()[0]
+        self._conn.executemany(self.TOMBSTONE_SQL, [(last + i, c, k) for i, (c, k) in enumerate(rows, 1)])
+        self._conn.executemany(self.DELETE_SQL, rows)
+
+    def _write_batch(self, clears, pending, messages):
+        upserts = [(c, k, v) for (c, k), v in pending.items() if v is not None]
+        deletes = [(c, k) for (c, k), v in pending.items() if v is None]
+        with self._conn_lock:
+            # Take the write lock up front so a busy database is waited for, not failed
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._remove([(c, k) for c in clears for (k,) in self._conn.execute(self.KEYS_SQL, (c,)).fetchall()])
+                self._upsert(upserts)
+                self._remove(deletes)
+                if self.origin is not None:
+                    self._conn.executemany(self.LOG_SQL, self._change_rows(clears, pending, messages))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def flush(self):
+        """Synchronously commit everything that is queued."""
+        clears, pending, messages = self._take_batch()
+        if clears or pending or messages:
+            self._write_batch(clears, pending, messages)
+
+    def _claim(self, collection: str, key: str, taken, writes):
+        rows = [(c, str(k), json.dumps(v, ensure_ascii=False)) for c, k, v in writes]
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(self.VALUE_SQL, (collection, key)).fetchone()
+                current = json.loads(row[0]) if row else None
+                if current is not None and taken(current):
+                    self._conn.execute("ROLLBACK")
+                    return current
+                self._upsert(rows)
+                if self.origin is not None:
+                    now = time.time()
+                    self._conn.executemany(self.LOG_SQL, [(self.origin, c, k, v, now) for c, k, v in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None
+
+    async def claim(self, collection: str, key, taken, writes):
+        """
+        Compare-and-set across workers: commit `writes`, a list of (collection,
+        key, value), in one transaction unless the stored value of `key` in
+        `collection` satisfies `taken`. Returns None if the writes were
+        committed, or the stored value that was found taken.
+        
+        Writes queued before the call are committed first, so the check sees
+        this worker's own latest state and no older write of these entries is
+        left to land on top of them.
+        """
+        await self.sync()
+        return await asyncio.to_thread(self._claim, collection, str(key), taken, writes)
+
+    def changed_since(self, collection: str, seq: int, until: int, limit: int):
+        """
+        Up to `limit` committed entries of a collection written or removed
+        after `seq` and no later than `until`, as (seq, key, value) in write
+        order; the value of a removed entry is None.
+        """
+        with self._conn_lock:
+            rows = self._conn.execute(self.CHANGED_SQL, (collection, seq, until, collection, seq, until, limit)).fetchall()
+        return [(row_seq, key, None if value is None else json.loads(value)) for row_seq, key, value in rows]
+
+    def last_seq(self) -> int:
+        """Sequence number of the latest committed write or removal, 0 if there was none."""
+        with self._conn_lock:
+            return self._conn.execute(self.LAST_SEQ_SQL).fetchone()[0]
+
+    def last_change(self) -> int:
+        """Sequence number of the latest change log entry, 0 if there was none."""
+        with self._conn_lock:
+            row = self._conn.execute(self.LAST_CHANGE_SQL).fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, seq: int, limit: int):
+        """Up to `limit` change log entries after `seq` as (seq, origin, collection, key, value)."""
+        if self._reader is None:
+            self._reader = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        return self._reader.execute(self.CHANGES_SQL, (seq, limit)).fetchall()
+
+    def prune_changes(self, before: float):
+        """Drop change log entries written before the `before` timestamp."""
+        with self._conn_lock:
+            self._conn.execute(self.PRUNE_SQL, (before,))
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew a lease for `ttl` seconds; False if another owner holds it."""
+        now = time.time()
+        with self._conn_lock:
+            self._conn.execute(self.LEASE_SQL, (name, owner, now + ttl, now))
+            row = self._conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == owner
+
+    def release_lease(self, name: str, owner: str):
+        with self._conn_lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    async def run_flusher(self):
+        """Commit queued writes every flush_interval seconds, or sooner when a batch fills up."""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            clears, pending, messages = self._take_batch()
+            waiter, self._commit_waiter = self._commit_waiter, None
+            if not clears and not pending and not messages:
+                if waiter:
+                    waiter.set_result(None)
+                continue
+            try:
+                await asyncio.to_thread(self._write_batch, clears, pending, messages)
+            except Exception as e:
+                logger.error(f"Failed to flush storage batch: {str(e)}")
+                # Put the batch back without overwriting newer writes
+                pending.update(self._pending)
+                self._pending = pending
+                self._clears |= clears
+                self._messages[:0] = messages
+                if waiter:
+                    waiter.set_exception(e)
+                continue
+            if waiter:
+                waiter.set_result(None)
+
+    async def sync(self):
+        """
+        Wait until every write queued so far is committed.
+        
+        The flusher is woken at once rather than after its interval. Callers
+        arriving while a commit is in progress share the next one, so a burst
+        of durable writes costs a few transactions rather than one each.
+        """
+        if self._flusher_task is None:
+            self.flush()
+            return
+        if self._commit_waiter is None:
+            self._commit_waiter = asyncio.get_running_loop().create_future()
+        self._wakeup.set()
+        # Shielded so a cancelled request does not cancel the commit other callers wait for
+        await asyncio.shield(self._commit_waiter)
+
+    def start(self):
+        self._flusher_task = asyncio.create_task(self.run_flusher())
+
+    async def close(self):
+        if self._flusher_task:
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+        self.flush()
+        if self._commit_waiter and not self._commit_waiter.done():
+            self._commit_waiter.set_result(None)
+        if self._reader:
+            self._reader.close()
+        self._conn.close()
+        logger.info("SQLite storage closed")
+
+storage = ExamStorage(DATABASE_PATH)
+
+class StudentEventHub:
+    """
+    Fan out status changes to the event streams a student has open.
+    
+    Each open stream owns a small queue; publishing never blocks, and a
+    stream that falls behind simply misses intermediate events (the next one
+    carries the full status anyway).
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # student_id -> set of queues
+        self.relay = None  # Called with every published event to pass it on to the other workers
+
+    def subscribe(self, student_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=16)
+        self._subscribers.setdefault(student_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, student_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(student_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[student_id]
+
+    def publish(self, student_id: str, event: str, data: Dict[str, Any]):
+        self.deliver(student_id, event, data)
+        if self.relay:
+            self.relay(student_id, event, data)
+
+    def deliver(self, student_id: str, event: str, data: Dict[str, Any]):
+        """Hand an event to the streams open on this worker only."""
+        for queue in self._subscribers.get(student_id, ()):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping {event} event for slow stream of student {student_id}")
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+student_events = StudentEventHub()
+
+class StudentLocks:
+    """
+    One asyncio lock per student, created on demand and dropped once no
+    request holds or waits for it.
+    """
+
+    def __init__(self):
+        self._locks = {}  # student_id -> [lock, holders and waiters]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, student_id: str):
+        entry = self._locks.setdefault(student_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[student_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+student_locks = StudentLocks()
+
+EVENTS_COLLECTION = "~events"  # Change log entries carrying student events rather than state
+
+class ChangeFeed:
+    """
+    Keep this worker's in-memory state in step with the other workers.
+    
+    In multi-worker mode every worker logs what it commits (see
+    ExamStorage.origin) and tails what the others log, applying their changes
+    to its own dicts and handing their student events to the streams it
+    serves. The position is taken before state is loaded at startup, so
+    nothing committed in between is missed; applying a change the load
+    already saw is harmless.
+    """
+
+    def __init__(self, interval: float, batch_size: int = 1000):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.position = 0
+        self._lock = None
+        self._task = None
+        self.applied = 0
+        self.resyncs = 0
+
+    def begin(self):
+        self.position = storage.last_change()
+        self._lock = asyncio.Lock()
+
+    async def catch_up(self):
+        """Apply everything the other workers have committed so far."""
+        if self._lock is None:
+            return
+        async with self._lock:
+            while True:
+                rows = storage.changes_since(self.position, self.batch_size)
+                if not rows:
+                    return
+                if rows[0][0] != self.position + 1:
+                    # Entries this worker never saw were pruned; start over from storage
+                    logger.warning(f"Change log pruned past position {self.position}, reloading state")
+                    position = storage.last_change()
+                    reload_shared_state()
+                    self.position = position
+                    self.resyncs += 1
+                    return
+                for seq, origin, collection, key, value in rows:
+                    self.position = seq
+                    if origin == storage.origin:
+                        continue
+                    try:
+                        apply_shared_change(collection, key, None if value is None else json.loads(value))
+                        self.applied += 1
+                    except Exception as e:
+                        logger.error(f"Failed to apply change {seq} to {collection}: {str(e)}")
+                if len(rows) < self.batch_size:
+                    return
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.catch_up()
+            except Exception as e:
+                logger.error(f"Failed to read the change log: {str(e)}")
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"position": self.position, "applied": self.applied, "resyncs": self.resyncs}
+
+change_feed = ChangeFeed(WORKER_SYNC_INTERVAL)
+
+class LeaderLease:
+    """
+    A lease in the shared database naming the one worker that polls Telegram
+    and grades queued submissions.
+    
+    The holder renews it every third of `ttl` and prunes the change log while
+    at it. If the holder dies, another worker takes over once the lease
+    expires; a clean shutdown releases it at once.
+    """
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.held = False
+        self.expires = 0.0
+        self.changes = 0
+        self._task = None
+
+    async def renew(self):
+        started = time.time()
+        try:
+            held = await asyncio.to_thread(storage.acquire_lease, self.name, storage.origin, self.ttl)
+        except Exception as e:
+            logger.error(f"Failed to renew the {self.name} lease: {str(e)}")
+            # Keep what we have until it runs out rather than risk two leaders
+            held = self.held and time.time() < self.expires
+        else:
+            if held:
+                self.expires = started + self.ttl
+        if held != self.held:
+            self.held = held
+            self.changes += 1
+            logger.info(f"Worker {storage.origin} {'is now' if held else 'is no longer'} the leader")
+            await sync_telegram_polling()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self.renew()
+            if self.held:
+                try:
+                    await asyncio.to_thread(storage.prune_changes, time.time() - CHANGE_LOG_RETENTION)
+                except Exception as e:
+                    logger.error(f"Failed to prune the change log: {str(e)}")
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.held:
+            self.held = False
+            await sync_telegram_polling()
+            storage.release_lease(self.name, storage.origin)
+
+leader_lease = LeaderLease("leader", LEADER_LEASE_SECONDS)
+
+def is_leader() -> bool:
+    """Whether this worker polls Telegram and grades queued submissions; always true with one worker."""
+    return not MULTI_WORKER or leader_lease.held
+
+class SubmissionQueue:
+    """
+    Durable queue of accepted but not yet graded submissions.
+    
+    Every entry is committed to the "submission_queue" storage collection
+    before the request returns, and deleted once graded, so entries left over
+    after a crash are restored and graded on the next start. A single worker
+    grades in batches of up to `batch_size`, yielding to the event loop
+    between batches; with several server workers, only the leader grades.
+    
+    An entry whose grading raises is retried with exponential backoff. After
+    `max_attempts` it is given up: the attempt is reopened with the submitted
+    answers as its draft, so the student can submit again, and the receipt
+    reports the failure.
+    """
+
+    def __init__(self, batch_size: int, max_attempts: int):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._pending = {}  # receipt -> entry, in arrival order
+        self._graded = {}  # receipt -> (exam_id, student_id) of graded and failed entries
+        self._retries = {}  # receipt -> (failed tries, monotonic time of the next one)
+        self._wakeup = None
+        self._worker_task = None
+        self.accepted = 0
+        self.graded = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = 0
+
+    def restore(self):
+        """Reload ungraded entries and receipts of graded ones after a restart."""
+        entries = sorted(storage.load("submission_queue").values(), key=lambda entry: entry["received_at"])
+        self._pending = {entry["receipt"]: entry for entry in entries}
+        self._graded = {
+            receipt: (exam.exam_id, student_id)
+            for exam in exam_registry.exams.values()
+            for student_id, attempt in exam.attempts.items()
+            for receipt in (attempt.get("receipt"), attempt.get("failed_receipt"))
+            if receipt and receipt not in self._pending
+        }
+        if self._pending:
+            logger.info(f"Restored {len(self._pending)} ungraded submissions")
+
+    @staticmethod
+    def entry(receipt: str, exam_id: str, student_id: str, answers_data: Dict[str, Any],
+              submission_key: Optional[str]) -> Dict[str, Any]:
+        """A queue entry, committed to storage together with the attempt it completes (see record_submission)."""
+        return {
+            "receipt": receipt,
+            "exam_id": exam_id,
+            "student_id": student_id,
+            "answers": answers_data,
+            "submission_key": submission_key,
+            "received_at": datetime.datetime.now().isoformat()
+        }
+
+    def add(self, entry: Dict[str, Any]):
+        """Queue an entry that is already committed to storage."""
+        self._pending[entry["receipt"]] = entry
+        self.accepted += 1
+        if self._wakeup:
+            self._wakeup.set()
+
+    def status(self, receipt: str) -> Optional[Dict[str, Any]]:
+        if receipt in self._pending:
+            entry = self._pending[receipt]
+            return {
+                "receipt": receipt,
+                "exam_id": entry.get("exam_id", DEFAULT_EXAM_ID),
+                "student_id": entry["student_id"],
+                "status": "queued"
+            }
+        exam_id, student_id = self._graded.get(receipt, (None, None))
+        exam = exam_registry.exams.get(exam_id)
+        attempt = exam.attempts.get(student_id, {}) if exam else {}
+        if attempt.get("failed_receipt") == receipt:
+            return {
+                "receipt": receipt,
+                "exam_id": exam_id,
+                "student_id": student_id,
+                "status": "failed",
+                "detail": "Your submission could not be graded. Your answers were kept; please submit them again.",
+                "exam_url": exam_url(f"/exam?student_id={urllib.parse.quote(student_id)}", exam_id)
+            }
+        result = exam.results.get(student_id) if exam else None
+        if result is None or attempt.get("receipt") != receipt:
+            return None
+        return {
+            "receipt": receipt,
+            "exam_id": exam_id,
+            "student_id": student_id,
+            "status": "graded",
+            "correct": result["correct"],
+            "incorrect": result["incorrect"],
+            "total": result["total"],
+            "results_url": exam_url(f"/results/{student_id}", exam_id)
+        }
+
+    def is_pending(self, receipt: Optional[str]) -> bool:
+        return receipt in self._pending
+
+    def apply(self, receipt: Optional[str], entry: Optional[Dict[str, Any]]):
+        """Mirror an entry another worker queued, or graded and deleted."""
+        if receipt is None:
+            self._pending.clear()
+        elif entry is not None:
+            self._pending[receipt] = entry
+            if self._wakeup:
+                self._wakeup.set()
+        else:
+            entry = self._pending.pop(receipt, None)
+            if entry:
+                self._graded[receipt] = (entry.get("exam_id", DEFAULT_EXAM_ID), entry["student_id"])
+
+    def _drop(self, receipt: str):
+        del self._pending[receipt]
+        self._retries.pop(receipt, None)
+        storage.delete("submission_queue", receipt)
+
+    def _grading_failed(self, entry: Dict[str, Any], error: Exception):
+        """Schedule another try at an entry whose grading raised, or give it up after max_attempts."""
+        receipt, student_id = entry["receipt"], entry["student_id"]
+        tries = self._retries.get(receipt, (0, 0))[0] + 1
+        if tries < self.max_attempts:
+            delay = min(60, 2 ** (tries - 1))
+            self._retries[receipt] = (tries, time.monotonic() + delay)
+            self.retried += 1
+            logger.error(f"Failed to grade submission {receipt} (try {tries}), retrying in {delay}s: {str(error)}")
+            return
+        
+        logger.error(f"Giving up on submission {receipt} of student {student_id} after {tries} tries: {str(error)}")
+        exam_id = entry.get("exam_id", DEFAULT_EXAM_ID)
+        exam = exam_registry.exams.get(exam_id)
+        attempt = exam.attempts.get(student_id) if exam else None
+        if attempt and attempt.get("receipt") == receipt:
+            # Reopen the attempt with the submitted answers, for the student to send again
+            attempt["completed"] = False
+            attempt["submission_id"] = None
+            attempt["failed_receipt"] = attempt.pop("receipt")
+            exam.put_attempt(student_id)
+            exam.apply_draft(student_id, entry["answers"])
+            storage.put(exam.collection("exam_drafts"), student_id, entry["answers"])
+        self._graded[receipt] = (exam_id, student_id)
+        self.failed += 1
+        self._drop(receipt)
+        status = self.status(receipt)
+        if status:
+            student_events.publish(student_id, "result", status)
+
+    async def _grade(self, entry: Dict[str, Any]) -> bool:
+        """Grade one entry; returns False if its exam cannot be loaded right now."""
+        student_id = entry["student_id"]
+        exam = exam_registry.exams.get(entry.get("exam_id", DEFAULT_EXAM_ID))
+        if exam is None:
+            logger.error(f"Dropping queued submission {entry['receipt']} of a deleted exam")
+            self._drop(entry["receipt"])
+            return True
+        try:
+            await exam_registry.load(exam)
+        except Exception as e:
+            logger.error(f"Cannot load exam {exam.exam_id} to grade queued submissions: {str(e)}")
+            return False
+        async with student_locks.hold(student_id):
+            index = exam.index
+            if index is None or entry["receipt"] not in self._pending:
+                # The exam was unloaded or its entries cleared while this one waited
+                return True
+            if student_id not in approved_students:
+                # The student was removed while the entry waited
+                logger.error(f"Dropping queued submission of unknown student {student_id}")
+                attempt = exam.attempts.get(student_id)
+                if attempt and attempt.get("receipt") == entry["receipt"]:
+                    attempt["completed"] = False
+                    exam.put_attempt(student_id)
+            else:
+                grade_submission(exam, student_id, entry["answers"], entry["submission_key"], index, entry["receipt"])
+                self._graded[entry["receipt"]] = (exam.exam_id, student_id)
+                self.graded += 1
+            self._drop(entry["receipt"])
+        status = self.status(entry["receipt"])
+        if status:
+            student_events.publish(student_id, "result", status)
+        return True
+
+    def clear(self, exam_id: str):
+        """Drop the ungraded submissions of an exam, e.g. when it is deleted."""
+        for receipt, entry in list(self._pending.items()):
+            if entry.get("exam_id", DEFAULT_EXAM_ID) == exam_id:
+                self._drop(receipt)
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            if not self._pending or not is_leader():
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            graded = 0
+            unavailable = set()  # Exams that failed to load in this batch
+            now = time.monotonic()
+            for entry in list(self._pending.values()):
+                if graded >= self.batch_size:
+                    break
+                exam_id = entry.get("exam_id", DEFAULT_EXAM_ID)
+                if exam_id in unavailable or self._retries.get(entry["receipt"], (0, 0))[1] > now:
+                    continue
+                try:
+                    if await self._grade(entry):
+                        graded += 1
+                    else:
+                        unavailable.add(exam_id)
+                except Exception as e:
+                    if entry["receipt"] in self._pending:
+                        self._grading_failed(entry, e)
+            self.batches += 1
+            # Let requests run between batches; entries whose exam cannot be
+            # loaded, e.g. before its PDF is back, or that wait for a retry
+            # are tried again later
+            await asyncio.sleep(0 if graded else 1)
+
+    def start(self):
+        self._worker_task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._worker_task:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+        if self._pending:
+            logger.info(f"{len(self._pending)} submissions left in the queue for the next start")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": ASYNC_GRADING,
+            "queue_depth": len(self._pending),
+            "accepted": self.accepted,
+            "graded": self.graded,
+            "batches": self.batches,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+submission_queue = SubmissionQueue(GRADING_BATCH_SIZE, GRADING_MAX_ATTEMPTS)
+
+class DeadlineScheduler:
+    """
+    Auto-submit timed attempts whose deadline has passed.
+    
+    The due times of all open attempts are kept in one min-heap of
+    (due, exam_id, student_id) watched by a single task, which sleeps until
+    the earliest one instead of one sleeping task per student. Rescheduling
+    or cancelling only updates `_due`; heap entries that no longer match it
+    are skipped when they surface, and the heap is rebuilt once they
+    outnumber the live ones. Every worker tracks every attempt, so a new
+    leader takes the schedule over as it is; only the leader submits.
+    """
+
+    def __init__(self, batch_size: int = 100):
+        self.batch_size = batch_size
+        self._heap = []
+        self._due = {}  # (exam_id, student_id) -> due time
+        self._wakeup = None
+        self._task = None
+        self.fired = 0
+        self.retries = 0
+        self.max_lateness = 0.0
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, exam_id: str, student_id: str, due: float):
+        key = (exam_id, student_id)
+        if self._due.get(key) == due:
+            return
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, exam_id, student_id))
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._compact()
+        if self._wakeup and self._heap[0][0] == due:
+            self._wakeup.set()
+
+    def cancel(self, exam_id: str, student_id: str):
+        self._due.pop((exam_id, student_id), None)
+
+    def cancel_exam(self, exam_id: str):
+        for key in [key for key in self._due if key[0] == exam_id]:
+            del self._due[key]
+
+    def clear(self):
+        self._due.clear()
+        self._heap.clear()
+
+    def _compact(self):
+        self._heap = [(due, exam_id, student_id) for (exam_id, student_id), due in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def _next_due(self) -> Optional[float]:
+        """The earliest live due time, dropping stale entries on the way."""
+        while self._heap:
+            due, exam_id, student_id = self._heap[0]
+            if self._due.get((exam_id, student_id)) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now: float) -> List[tuple]:
+        """Take up to `batch_size` live entries due by `now`, earliest first."""
+        entries = []
+        while len(entries) < self.batch_size:
+            due = self._next_due()
+            if due is None or due > now:
+                break
+            entry = heapq.heappop(self._heap)
+            del self._due[(entry[1], entry[2])]
+            entries.append(entry)
+        return entries
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            due = self._next_due()
+            now = time.time()
+            if not is_leader() or due is None or due > now:
+                # Wake for the earliest deadline, an earlier one being added,
+                # or every second while another worker leads
+                timeout = 1 if not is_leader() else (None if due is None else min(due - now, 60))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for due, exam_id, student_id in self._pop_due(now):
+                self.max_lateness = max(self.max_lateness, now - due)
+                try:
+                    submitted = await submit_on_deadline(exam_id, student_id)
+                except Exception as e:
+                    logger.error(f"Failed to submit the timed-out attempt of {student_id} in exam {exam_id}: {str(e)}")
+                    submitted = True
+                if submitted:
+                    self.fired += 1
+                elif (exam_id, student_id) not in self._due:
+                    # The exam cannot be loaded right now; try again shortly
+                    self.retries += 1
+                    self.schedule(exam_id, student_id, time.time() + 5)
+            # Let requests run between batches
+            await asyncio.sleep(0)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "timers": len(self._due),
+            "heap": len(self._heap),
+            "fired": self.fired,
+            "retries": self.retries,
+            "max_lateness_ms": round(self.max_lateness * 1000, 1)
+        }
+
+deadline_scheduler = DeadlineScheduler()
+
+class DraftBuffer:
+    """
+    Coalesce autosaved answers before they are written to storage.
+    
+    Each delta (question id -> option id, None to clear) is merged into
+    Exam.drafts at once, so the exam page and the deadline auto-submission
+    always see the latest answers. Storage only gets the drafts that changed,
+    every `interval` seconds: one row per student however many deltas
+    arrived. The deltas themselves are kept until then, so a draft another
+    worker wrote meanwhile is merged with them instead of overwriting them.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending = {}  # (exam_id, student_id) -> answers changed since the last flush
+        self._task = None
+        self.deltas = 0
+        self.answers = 0
+        self.written = 0
+        self.flushes = 0
+
+    @staticmethod
+    def _merge(draft: Dict[str, Any], delta: Dict[str, Optional[str]]) -> Dict[str, Any]:
+        for question_id, option_id in delta.items():
+            if option_id is None:
+                draft.pop(question_id, None)
+            else:
+                draft[question_id] = option_id
+        return draft
+
+    def update(self, exam: "Exam", student_id: str, delta: Dict[str, Optional[str]]):
+        """Merge a delta into the student's draft and queue the draft for the next flush."""
+        self._merge(exam.drafts.setdefault(student_id, {}), delta)
+        self._pending.setdefault((exam.exam_id, student_id), {}).update(delta)
+        self.deltas += 1
+        self.answers += len(delta)
+
+    def discard(self, exam_id: str, student_id: str):
+        self._pending.pop((exam_id, student_id), None)
+
+    def apply(self, exam: "Exam", student_id: Optional[str], draft: Optional[Dict[str, Any]]):
+        """Take over a draft another worker wrote, keeping this worker's deltas not written yet."""
+        if student_id is None:
+            for key in [key for key in self._pending if key[0] == exam.exam_id]:
+                del self._pending[key]
+        elif draft is None:
+            self.discard(exam.exam_id, student_id)
+        elif (exam.exam_id, student_id) in self._pending:
+            draft = self._merge(dict(draft), self._pending[(exam.exam_id, student_id)])
+        exam.apply_draft(student_id, draft)
+
+    def reapply(self):
+        """Merge the deltas not written yet into drafts just reloaded from storage."""
+        for (exam_id, student_id), delta in self._pending.items():
+            exam = exam_registry.exams.get(exam_id)
+            if exam:
+                self._merge(exam.drafts.setdefault(student_id, {}), delta)
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        for exam_id, student_id in pending:
+            exam = exam_registry.exams.get(exam_id)
+            draft = exam.drafts.get(student_id) if exam else None
+            if draft is not None:
+                storage.put(exam.collection("exam_drafts"), student_id, draft)
+                self.written += 1
+        if pending:
+            self.flushes += 1
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write autosaved drafts: {str(e)}")
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "deltas": self.deltas,
+            "answers": self.answers,
+            "written": self.written,
+            "flushes": self.flushes
+        }
+
+draft_buffer = DraftBuffer(DRAFT_FLUSH_INTERVAL)
+
+class TokenBucket:
+    """Allow `rate` events per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait(self) -> float:
+        """Return 0 if a token is available, otherwise the seconds until one is."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> float:
+        """Take a token; return 0 on success, otherwise the seconds until one is available."""
+        wait = self.wait()
+        if not wait:
+            self.tokens -= 1
+        return wait
+
+class TelegramDispatcher:
+    """
+    Send outbound Telegram messages from a bounded background queue.
+    
+    Request handlers enqueue and return immediately. A single sender drains
+    the queue in order, paces each chat with a token bucket, retries on 429
+    and network errors with backoff, and merges plain messages that pile up
+    for the same chat into one send while the chat is throttled.
+    """
+
+    def __init__(self, maxsize: int, group_messages_per_minute: float):
+        self.maxsize = maxsize
+        self.group_rate = group_messages_per_minute / 60
+        self._queue = deque()
+        self._buckets = {}  # chat_id -> TokenBucket
+        self._wakeup = None
+        self._sender_task = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._latencies = deque(maxlen=1000)  # Seconds from enqueue to delivery
+
+    def enqueue(self, chat_id: int, text: str, parse_mode: Optional[str] = None,
+                reply_markup=None, on_failure=None):
+        """
+        Queue a message for delivery. Raises asyncio.QueueFull when the queue
+        is full. `on_failure` is called if the message is finally given up on.
+        """
+        parts = split_telegram_text(text)
+        if len(self._queue) + len(parts) > self.maxsize:
+            self.dropped += 1
+            raise asyncio.QueueFull()
+        now = time.monotonic()
+        for i, part in enumerate(parts):
+            self._queue.append({
+                "chat_id": chat_id,
+                "text": part,
+                "parse_mode": parse_mode,
+                # Buttons belong under the last part of a split message
+                "reply_markup": reply_markup if i == len(parts) - 1 else None,
+                "on_failure": [on_failure] if on_failure else [],
+                "enqueued_at": now
+            })
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Negative ids are groups and channels; positive ids are private chats
+            rate = self.group_rate if chat_id < 0 else 1.0
+            bucket = self._buckets[chat_id] = TokenBucket(rate, capacity=3)
+        return bucket
+
+    def _coalesce(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge the queued plain messages that directly follow `message` for the same chat."""
+        if message["reply_markup"] is not None:
+            return message
+        while self._queue:
+            following = self._queue[0]
+            if (following["chat_id"] != message["chat_id"]
+                    or following["parse_mode"] != message["parse_mode"]
+                    or following["reply_markup"] is not None
+                    or len(message["text"]) + len(following["text"]) + 2 > TELEGRAM_MESSAGE_LIMIT):
+                break
+            self._queue.popleft()
+            message = dict(message)
+            message["text"] += "\n\n" + following["text"]
+            message["on_failure"] = message["on_failure"] + following["on_failure"]
+            message.setdefault("merged_enqueued_at", []).append(following["enqueued_at"])
+            self.coalesced += 1
+        return message
+
+    async def _deliver(self, message: Dict[str, Any]) -> bool:
+        for attempt in range(1, TELEGRAM_MAX_ATTEMPTS + 1):
+            try:
+                await telegram_app.bot.send_message(
+                    chat_id=message["chat_id"],
+                    text=message["text"],
+                    parse_mode=message["parse_mode"],
+                    reply_markup=message["reply_markup"]
+                )
+                return True
+            except RetryAfter as e:
+                error, delay = "rate limited", e.retry_after
+            except BadRequest as e:
+                # Malformed message or unknown chat; retrying will not help
+                logger.error(f"Failed to send Telegram message: {str(e)}")
+                return False
+            except NetworkError as e:
+                error, delay = str(e), min(2 ** attempt, 30)
+            except Exception as e:
+                logger.error(f"Failed to send Telegram message: {str(e)}")
+                return False
+            if attempt == TELEGRAM_MAX_ATTEMPTS:
+                break
+            logger.warning(f"Telegram send failed ({error}), retrying in {delay}s")
+            self.retried += 1
+            await asyncio.sleep(delay)
+        logger.error(f"Giving up on Telegram message after {TELEGRAM_MAX_ATTEMPTS} attempts: {error}")
+        return False
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            if not self._queue or telegram_app is None:
+                self._wakeup.clear()
+                try:
+                    # Wake up periodically while the bot is still starting
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            # Wait for the head's chat to have capacity; messages that arrive
+            # meanwhile can be merged into the same send
+            delay = self._bucket(self._queue[0]["chat_id"]).take()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            
+            message = self._coalesce(self._queue.popleft())
+            if await self._deliver(message):
+                now = time.monotonic()
+                for enqueued_at in [message["enqueued_at"]] + message.get("merged_enqueued_at", []):
+                    self._latencies.append(now - enqueued_at)
+                    self.sent += 1
+            else:
+                self.failed += 1
+                for callback in message["on_failure"]:
+                    try:
+                        callback()
+                    except Exception as e:
+                        logger.error(f"Telegram failure callback raised: {str(e)}")
+
+    def start(self):
+        self._sender_task = asyncio.create_task(self.run())
+
+    async def close(self, timeout: float = 5):
+        """Give queued messages a few seconds to go out, then stop the sender."""
+        deadline = time.monotonic() + timeout
+        while self._queue and telegram_app is not None and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._sender_task:
+            self._sender_task.cancel()
+            try:
+                await self._sender_task
+            except asyncio.CancelledError:
+                pass
+        if self._queue:
+            logger.warning(f"Dropping {len(self._queue)} undelivered Telegram messages")
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3) if latencies else None
+        return {
+            "queue_depth": len(self._queue),
+            "queue_capacity": self.maxsize,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "send_latency_seconds": {
+                "p50": percentile(0.5),
+                "p90": percentile(0.9),
+                "p99": percentile(0.99),
+                "max": round(latencies[-1], 3) if latencies else None
+            }
+        }
+
+def split_telegram_text(text: str) -> List[str]:
+    """Split text into parts that fit one Telegram message, breaking at line ends."""
+    if len(text) <= TELEGRAM_MESSAGE_LIMIT:
+        return [text]
+    parts, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > TELEGRAM_MESSAGE_LIMIT:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:TELEGRAM_MESSAGE_LIMIT])
+            line = line[TELEGRAM_MESSAGE_LIMIT:]
+        if len(current) + len(line) > TELEGRAM_MESSAGE_LIMIT:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+# Every worker sends its own messages, so the group rate is shared between them
+telegram_dispatcher = TelegramDispatcher(TELEGRAM_QUEUE_SIZE, TELEGRAM_GROUP_MESSAGES_PER_MINUTE / WORKERS)
+
+class RateLimiter:
+    """Token buckets keyed by (rule, scope, client), evicting the least recently used."""
+
+    def __init__(self, rules: dict, max_buckets: int):
+        self.rules = rules
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self.allowed = 0
+        self.rejected = {}  # "rule:scope" -> count
+        self.evicted = 0
+
+    def _bucket(self, key: tuple, per_minute: float, burst: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+            return bucket
+        bucket = self._buckets[key] = TokenBucket(per_minute / 60, burst)
+        if len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+            self.evicted += 1
+        return bucket
+
+    def check(self, rule: str, clients: dict) -> float:
+        """
+        Take a token for every scope of `rule` if each has one; return 0, or
+        the seconds to wait without taking any, so a rejected request costs
+        none of its buckets a token.
+        """
+        buckets = {
+            scope: self._bucket((rule, scope, client), *self.rules[rule][scope])
+            for scope, client in clients.items()
+            if client is not None and scope in self.rules[rule]
+        }
+        waits = {scope: bucket.wait() for scope, bucket in buckets.items()}
+        wait = max(waits.values(), default=0)
+        if wait:
+            for scope, scope_wait in waits.items():
+                if scope_wait:
+                    name = f"{rule}:{scope}"
+                    self.rejected[name] = self.rejected.get(name, 0) + 1
+            return wait
+        for bucket in buckets.values():
+            bucket.take()
+        self.allowed += 1
+        return 0
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": RATE_LIMIT_ENABLED,
+            "buckets": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": dict(self.rejected),
+            "evicted": self.evicted
+        }
+
+rate_limiter = RateLimiter(RATE_LIMIT_RULES, RATE_LIMIT_MAX_BUCKETS)
+
+# (method, path pattern, rule)
+RATE_LIMITED_ROUTES = [
+    ("POST", re.compile(r"/submit-student"), "submit-student"),
+    ("POST", re.compile(r"/submit-exam"), "submit-exam"),
+    ("GET", re.compile(r"/check-approval/[^/]+"), "status"),
+    ("GET", re.compile(r"/check-retake-approval/[^/]+"), "status"),
+    ("GET", re.compile(r"/events/[^/]+"), "status"),
+    ("GET", re.compile(r"/api/submissions/[^/]+"), "status"),
+    ("POST", re.compile(r"/api/exam/draft"), "draft")
+]
+
+class RateLimitMiddleware:
+    """Answer 429 with Retry-After when a client or student exceeds its rule.
+    
+    The student is the one whose session cookies the request carries, never
+    a student ID taken from the path, query or form: anyone can name another
+    student there and would drain that student's bucket. Requests without a
+    valid session, and every request with STUDENT_SESSIONS off, are limited
+    per IP only. Plain ASGI rather than BaseHTTPMiddleware, so streamed
+    responses pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        
+        for method, pattern, rule in RATE_LIMITED_ROUTES:
+            if scope["method"] == method and pattern.fullmatch(scope["path"]):
+                break
+        else:
+            await self.app(scope, receive, send)
+            return
+        
+        student_id = session_student(Request(scope)) if STUDENT_SESSIONS else None
+        wait = rate_limiter.check(rule, {"ip": self._client_ip(scope), "student": student_id})
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+        
+        retry_after = math.ceil(wait)
+        logger.warning(f"Rate limited {scope['method']} {scope['path']} (student {student_id}), retry in {retry_after}s")
+        response = JSONResponse(
+            status_code=429,
+            content={"detail": f"Too many requests. Please try again in {retry_after} seconds."},
+            headers={"Retry-After": str(retry_after)}
+        )
+        await response(scope, receive, send)
+
+    @staticmethod
+    def _client_ip(scope) -> Optional[str]:
+        if RATE_LIMIT_TRUST_PROXY:
+            forwarded = dict(scope["headers"]).get(b"x-forwarded-for")
+            if forwarded:
+                return forwarded.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else None
+
+app.add_middleware(RateLimitMiddleware)
+
+def claim_hash(claim: str) -> str:
+    """What a session token records of the claim cookie it is bound to."""
+    return hashlib.sha256(claim.encode()).hexdigest()[:32]
+
+class SessionTokens:
+    """
+    Issue and verify student session tokens.
+    
+    A token is a JWT naming the student (`sub`), its expiry and the hash of
+    the claim cookie set on the browser that registered (`cnf`). It is
+    useless without that cookie, so it may travel in approval events and
+    status responses. Verifying needs nothing but the key. Pairs of token
+    and claim that verified are remembered until they expire, so the hot
+    path is a dict lookup instead of a signature check; failures are not
+    cached, so made-up tokens cannot flush the cache.
+    """
+
+    def __init__(self, key: str, ttl: int, cache_size: int = 10000):
+        self.key = key
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._verified = OrderedDict()  # (token, claim) -> (student_id, expires), least recently used first
+        self.issued = 0
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def issue(self, student_id: str, claim: Optional[str]) -> str:
+        """Sign a token for a student, bound to a claim hash (see claim_hash)."""
+        self.issued += 1
+        return jwt.encode(
+            {"sub": student_id, "exp": int(time.time()) + self.ttl, "cnf": claim or ""},
+            self.key,
+            algorithm="HS256"
+        )
+
+    def verify(self, token: Optional[str], claim: Optional[str]) -> Optional[str]:
+        """The student a token was issued to, if it is valid and `claim` is the cookie it is bound to."""
+        if not token or not claim:
+            return None
+        key = (token, claim)
+        cached = self._verified.get(key)
+        if cached is not None:
+            if time.time() < cached[1]:
+                self.hits += 1
+                self._verified.move_to_end(key)
+                return cached[0]
+            del self._verified[key]
+        self.misses += 1
+        try:
+            claims = jwt.decode(token, self.key, algorithms=["HS256"])
+        except JWTError:
+            self.rejected += 1
+            return None
+        if not hmac.compare_digest(str(claims.get("cnf", "")), claim_hash(claim)):
+            self.rejected += 1
+            return None
+        self._verified[key] = (claims["sub"], claims["exp"])
+        if len(self._verified) > self.cache_size:
+            self._verified.popitem(last=False)
+        return claims["sub"]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": STUDENT_SESSIONS,
+            "issued": self.issued,
+            "cached": len(self._verified),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected
+        }
+
+session_tokens = SessionTokens(
+    hmac.new(SECRET_KEY.encode(), b"student-session", hashlib.sha256).hexdigest(), SESSION_TOKEN_TTL
+)
+
+def session_student(request: Request) -> Optional[str]:
+    """The student whose valid session the request carries, if any."""
+    return session_tokens.verify(request.cookies.get(SESSION_COOKIE), request.cookies.get(CLAIM_COOKIE))
+
+def authorized(request: Request, student_id: str) -> bool:
+    """Whether the request may act as `student_id`; always true with STUDENT_SESSIONS off."""
+    return not STUDENT_SESSIONS or session_student(request) == student_id
+
+# In-memory storage, persisted through `storage`
 pending_students = {}
 approved_students = {}
 rejected_students = set()  # Track rejected students
-current_exam = None
-correct_answers = []  # Store correct answers for the current exam
-student_results = {}  # Store student exam results
+asset_manifest = {}  # Logical asset name -> content-hashed file name in ASSETS_DIR
 
 # Global Telegram bot application
 telegram_app = None
 
+# Process pool for PDF parsing, created on first use
+pdf_executor = None
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_STREAM_KEEPALIVE = 15
+
+# Students shown per /studentlist page, and the sort orders it offers
+STUDENTLIST_PAGE_SIZE = 15
+STUDENTLIST_SORTS = {"score": "score", "id": "student ID"}
+# Columns of exported result files
+RESULT_EXPORT_FIELDS = [
+    "student_id", "name", "surname", "correct", "incorrect", "total", "percentage",
+    "submitted_at", "updated_at", "answers"
+]
+# Rows per chunk of a streamed results export
+RESULT_EXPORT_CHUNK = 200
+# Most questions in one /api/exam page, and the bytes per chunk of an NDJSON
+# exam stream after its first question
+EXAM_PAGE_LIMIT = 200
+EXAM_STREAM_CHUNK = 64 * 1024
+
 # Add this with other global variables
 verified_admins = set()  # Store verified admin user IDs
-student_attempts = {}  # Track student exam attempts
 
 # Pydantic models for API documentation
 class ErrorResponse(BaseModel):
@@ -120,6 +1706,21 @@ class ExamSubmission(BaseModel):
             }
         }
 
+class DraftDelta(BaseModel):
+    answers: Dict[str, Optional[str]] = Field(
+        ..., description="Answers changed since the last save, by question ID; null clears an answer"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "answers": {
+                    "3": "b",
+                    "7": None
+                }
+            }
+        }
+
 class ExamResponse(BaseModel):
     message: str = Field(..., description="A message indicating the status of the exam")
     student_id: str = Field(..., description="The student's ID")
@@ -170,11 +1771,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "Welcome back, Admin! 👋\n\n"
             "Available commands:\n"
-            "/upload - Upload a PDF exam file\n"
-            "/answer - Set correct answers for the exam\n"
-            "/delete - Delete current exam and results\n"
-            "/studentlist - View all student results\n"
-            "/deletelist - Delete all student results"
+            "/upload [exam] - Upload a PDF exam file\n"
+            "/exams - List the exams\n"
+            "/answer [exam] <answers> - Set correct answers for an exam\n"
+            "/timer [exam] <minutes> - Set the time limit of an exam (0 for none)\n"
+            "/extend [exam] <student_id> <minutes> - Give a student more time\n"
+            "/delete [exam] - Delete an exam and its results\n"
+            "/studentlist [exam] - View student results\n"
+            "/stats [exam] - View question difficulty and score distribution\n"
+            "/deletelist [exam] - Delete the student results of an exam\n\n"
+            "Without an exam id, commands use the latest uploaded exam."
         )
         return
     
@@ -201,17 +1807,23 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('expecting_key', False):
         if message_text == SECRET_KEY:
             verified_admins.add(user_id)
+            storage.put("verified_admins", user_id)
             context.user_data['expecting_key'] = False
             
            
             success_message = (
                 "✅ Verification successful! You now have admin access.\n\n"
                 "Available commands:\n"
-                "/upload - Upload a PDF exam file\n"
-                "/answer - Set correct answers for the exam\n"
-                "/delete - Delete current exam and results\n"
-                "/studentlist - View all student results\n"
-                "/deletelist - Delete all student results"
+                "/upload [exam] - Upload a PDF exam file\n"
+                "/exams - List the exams\n"
+                "/answer [exam] <answers> - Set correct answers for an exam\n"
+                "/timer [exam] <minutes> - Set the time limit of an exam (0 for none)\n"
+                "/extend [exam] <student_id> <minutes> - Give a student more time\n"
+                "/delete [exam] - Delete an exam and its results\n"
+                "/studentlist [exam] - View student results\n"
+                "/stats [exam] - View question difficulty and score distribution\n"
+                "/deletelist [exam] - Delete the student results of an exam\n\n"
+                "Without an exam id, commands use the latest uploaded exam."
             )
             await update.message.reply_text(success_message)
             
@@ -224,196 +1836,1269 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         f"Username: @{update.effective_user.username if update.effective_user.username else 'N/A'}\n"
                         f"User ID: {user_id}"
                     )
-                    await telegram_app.bot.send_message(
-                        chat_id=ADMIN_CHAT_ID_INT,
-                        text=group_message,
-                        parse_mode='HTML'
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send group notification: {str(e)}")
+                    telegram_dispatcher.enqueue(ADMIN_CHAT_ID_INT, group_message, parse_mode='HTML')
+                except asyncio.QueueFull:
+                    logger.error("Telegram queue is full, dropping group notification")
         else:
             await update.message.reply_text("❌ Invalid admin key. Please try again.")
         return
 
 
-async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle the /upload command."""
-    user_id = update.effective_user.id
-    if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
-        await update.message.reply_text("You need admin access to use this command.")
-        return
-    await update.message.reply_text("Please send the exam PDF file.")
+async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle the /upload command. `/upload <exam id>` sets the id of the exam the
+    next PDF is for; otherwise the id is derived from the file name.
+    """
+    user_id = update.effective_user.id
+    if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
+        await update.message.reply_text("You need admin access to use this command.")
+        return
+    if context.args:
+        exam_id = context.args[0]
+        if not EXAM_ID_RE.fullmatch(exam_id):
+            await update.message.reply_text(
+                "Exam ids may only contain letters, digits, - and _, up to 32 characters."
+            )
+            return
+        context.user_data['upload_exam_id'] = exam_id
+        await update.message.reply_text(f"Please send the PDF file for exam {exam_id}.")
+        return
+    context.user_data.pop('upload_exam_id', None)
+    await update.message.reply_text("Please send the exam PDF file.")
+
+def exam_id_from_filename(file_name: str) -> str:
+    """Derive an exam id from an uploaded file name, e.g. "Math Final.pdf" -> "Math-Final"."""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    return re.sub(r"[^A-Za-z0-9_-]+", "-", stem).strip("-")[:32] or "exam"
+
+def split_exam_arg(args: List[str]):
+    """Split an optional leading exam id off command arguments: (exam or None, remaining args)."""
+    if args and args[0] in exam_registry.exams:
+        return exam_registry.exams[args[0]], args[1:]
+    return exam_registry.get(), args
+
+async def handle_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle PDF file uploads and extract questions.
+    """
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    
+    
+    if user_id not in verified_admins and chat_id != ADMIN_CHAT_ID_INT:
+        logger.warning(f"Unauthorized PDF upload attempt by user {user_id} in chat {chat_id}")
+        await update.message.reply_text("You are not authorized to upload PDFs.")
+        return
+    
+
+    if not update.message.document or not update.message.document.mime_type == 'application/pdf':
+        await update.message.reply_text("Please upload a PDF file.")
+        return
+    
+    try:
+     
+        os.makedirs("uploads", exist_ok=True)
+
+        file_name = update.message.document.file_name or "exam.pdf"
+        exam_id = context.user_data.pop('upload_exam_id', None) or exam_id_from_filename(file_name)
+        file = await context.bot.get_file(update.message.document.file_id)
+        pdf_path = os.path.join("uploads", f"{exam_id}.pdf")
+        # Download and parse beside the live PDF; it is only replaced once
+        # the upload parses, so a bad re-upload leaves the exam as it was
+        upload_path = f"{pdf_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            await file.download_to_drive(upload_path)
+            
+            logger.info(f"PDF downloaded to: {upload_path}")
+            
+            progress_message = await update.message.reply_text("📄 PDF received, extracting questions...")
+            
+            last_progress_update = 0.0
+            
+            async def report_progress(done_pages, total_pages):
+                # Telegram rate-limits message edits, so update at most once a second
+                nonlocal last_progress_update
+                now = asyncio.get_running_loop().time()
+                if now - last_progress_update < 1.0 and done_pages < total_pages:
+                    return
+                last_progress_update = now
+                try:
+                    await progress_message.edit_text(f"📄 Extracting text: {done_pages}/{total_pages} pages")
+                except Exception as e:
+                    logger.warning(f"Failed to update progress message: {str(e)}")
+
+            digest = await asyncio.to_thread(hash_file, upload_path)
+            parsed = await load_parsed_exam(upload_path, progress=report_progress, digest=digest)
+            os.replace(upload_path, pdf_path)
+        except BaseException:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+            raise
+        
+        # A new id creates an exam; a known one gets its questions replaced and keeps its results
+        exam = exam_registry.exams.get(exam_id)
+        if exam is None:
+            exam = Exam(exam_id, title=file_name, pdf_path=pdf_path, digest=digest)
+        else:
+            exam.title, exam.pdf_path, exam.digest = file_name, pdf_path, digest
+            exam.created_at = datetime.datetime.now().isoformat()
+        exam_registry.add(exam)
+        publish_exam(exam, parsed)
+        questions = parsed["questions"]
+
+        await update.message.reply_text(
+            f"PDF processed successfully. Found {len(questions)} questions.\n"
+            f"Exam id: {exam_id}. Students register at /?exam_id={exam_id}"
+        )
+        
+
+        logger.info(f"Processed PDF: {file_name} as exam {exam_id}, found {len(questions)} questions")
+        
+    except Exception as e:
+        logger.error(f"Error processing PDF: {str(e)}")
+        await update.message.reply_text(f"Error processing PDF: {str(e)}")
+
+def get_pdf_executor():
+    """
+    Return the process pool used for PDF parsing, creating it on first use.
+    """
+    global pdf_executor
+    if pdf_executor is None:
+        pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return pdf_executor
+
+def count_pdf_pages(pdf_path):
+    """Return the number of pages in a PDF. Runs in a worker process."""
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+def iter_pdf_pages(pdf_path, start, end):
+    """Yield the text of each page in [start, end) of a PDF, one page at a time."""
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, end):
+            yield doc[page_num].get_text()
+
+def parse_pdf_pages(pdf_path, start, end, state, final, keep_raw_text=False):
+    """
+    Stream pages [start, end) of a PDF through the question parser. Runs in a worker process.
+    
+    `state` carries the unfinished line and open question over from the
+    previous page range; pass `final=True` for the last range of the document.
+    """
+    page_lengths = []
+    raw_parts = [] if keep_raw_text else None
+    
+    def pages():
+        for page_text in iter_pdf_pages(pdf_path, start, end):
+            page_lengths.append(len(page_text))
+            if raw_parts is not None:
+                raw_parts.append(page_text)
+            yield page_text
+    
+    questions = list(validate_questions(parse_question_tokens(
+        tokenize_exam_lines(iter_text_lines(pages(), state, final), state, final), state, final
+    )))
+    return {
+        "questions": questions,
+        "state": state,
+        "page_lengths": page_lengths,
+        "raw_text": "".join(raw_parts) if raw_parts is not None else None
+    }
+
+def split_pdf_range(pdf_path, start, end, final, keep_raw_text=False):
+    """
+    Parse pages [start, end) of a PDF without knowing the preceding pages. Runs in a worker process.
+    
+    Everything from the first question that starts on a new line is parsed
+    with a fresh state; the text before it (the "prefix") is returned as is,
+    because it may continue a line or a question from the previous range.
+    stitch_pdf_range merges the result into the document state in page order.
+    """
+    page_texts = list(iter_pdf_pages(pdf_path, start, end))
+    text = "".join(page_texts).replace('\r\n', '\n').replace('\r', '\n')
+    
+    # Find the first complete line that is a numbered question, skipping the
+    # first line (it may continue the previous page) and the last, unterminated one
+    first_question = None
+    pos = text.find('\n') + 1
+    while pos > 0:
+        line_end = text.find('\n', pos)
+        if line_end == -1:
+            break
+        line = text[pos:line_end].strip()
+        if QUESTION_LINE_RE.match(line):
+            first_question = line
+            break
+        pos = line_end + 1
+    
+    part = {
+        "prefix": text,
+        "first_question": first_question,
+        "questions": [],
+        "state": None,
+        "page_lengths": [len(page_text) for page_text in page_texts],
+        "raw_text": "".join(page_texts) if keep_raw_text else None
+    }
+    if first_question is not None:
+        state = ExamParseState()
+        part["prefix"] = text[:pos]
+        part["questions"] = list(validate_questions(parse_question_tokens(
+            tokenize_exam_lines(iter_text_lines([text[pos:]], state, final), state, final), state, final
+        )))
+        part["state"] = state
+    return part
+
+def stitch_pdf_range(state, part, final):
+    """
+    Merge a page range parsed by split_pdf_range into the document state.
+    
+    The prefix is parsed with the running state, which completes any question
+    left open by the previous range. The range's own questions are then
+    renumbered to follow on, and its end state becomes the running state.
+    Returns the questions completed by this range.
+    """
+    first_question = part["first_question"]
+    if first_question is None:
+        return list(validate_questions(parse_question_tokens(
+            tokenize_exam_lines(iter_text_lines([part["prefix"]], state, final), state, final), state, final
+        )))
+    
+    # Feed the first question line too, so the line before it sees the right
+    # look-ahead, and so its question token closes the open question
+    lines = iter_text_lines([part["prefix"] + first_question + '\n'], state, final=False)
+    tokens = chain(tokenize_exam_lines(lines, state, final=False), [(TOKEN_QUESTION, first_question, False)])
+    questions = list(validate_questions(parse_question_tokens(tokens, state, final=False)))
+    
+    id_offset = state.question_id - 1
+    for q in part["questions"]:
+        q["id"] += id_offset
+    questions.extend(part["questions"])
+    
+    range_state = part["state"]
+    state.carry = range_state.carry
+    state.pending_line = range_state.pending_line
+    state.current_question = range_state.current_question
+    state.current_options = range_state.current_options
+    state.question_id = range_state.question_id + id_offset
+    return questions
+
+async def parse_pdf(pdf_path, progress=None):
+    """
+    Extract questions from a PDF without blocking the event loop.
+    
+    Page ranges are streamed through the question parser in the PDF process
+    pool, so other requests keep being served while a large exam is parsed.
+    Small PDFs are parsed one range at a time; PDFs with at least
+    PDF_PARALLEL_MIN_PAGES pages have all ranges parsed concurrently and
+    stitched back in page order. `progress` is awaited with
+    (done_pages, total_pages) after each range. The raw text is only kept when
+    KEEP_RAW_TEXT is enabled.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_pdf_executor()
+    
+    page_count = await loop.run_in_executor(executor, count_pdf_pages, pdf_path)
+    ranges = [
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+    parallel = PDF_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES
+    if parallel:
+        logger.info(f"Parsing {page_count} pages in parallel across {PDF_WORKERS} workers")
+        futures = [
+            loop.run_in_executor(executor, split_pdf_range, pdf_path, start, end, end == page_count, KEEP_RAW_TEXT)
+            for start, end in ranges
+        ]
+    
+    state = ExamParseState()
+    questions = []
+    page_offsets = []  # Character offset at which each page starts in the document text
+    raw_parts = []
+    offset = 0
+    try:
+        for i, (start, end) in enumerate(ranges):
+            final = end == page_count
+            if parallel:
+                chunk = await futures[i]
+                questions.extend(stitch_pdf_range(state, chunk, final))
+            else:
+                chunk = await loop.run_in_executor(
+                    executor, parse_pdf_pages, pdf_path, start, end, state, final, KEEP_RAW_TEXT
+                )
+                state = chunk["state"]
+                questions.extend(chunk["questions"])
+            for length in chunk["page_lengths"]:
+                page_offsets.append(offset)
+                offset += length
+            if KEEP_RAW_TEXT:
+                raw_parts.append(chunk["raw_text"])
+            logger.info(f"Parsed pages {start+1}-{end} of {page_count}, {len(questions)} questions so far")
+            if progress:
+                await progress(end, page_count)
+    finally:
+        if parallel:
+            for future in futures:
+                future.cancel()
+    
+    logger.info(f"Total extracted text length: {offset}")
+    
+    if not questions:
+        logger.warning("No valid questions found in the PDF, creating a default question")
+        questions = no_questions_placeholder()
+    
+    exam = {
+        "questions": questions,
+        "page_offsets": page_offsets
+    }
+    if KEEP_RAW_TEXT:
+        exam["raw_text"] = "".join(raw_parts)
+    return exam
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parse_cache_path(digest):
+    suffix = ".raw" if KEEP_RAW_TEXT else ""
+    return os.path.join(PARSE_CACHE_DIR, f"{digest}.v{PARSER_VERSION}{suffix}.json")
+
+def read_parse_cache(path):
+    """Return the parsed exam stored in a sidecar, or None if there is none."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable parse cache {path}: {str(e)}")
+        return None
+
+def write_file_atomic(path, data: bytes):
+    """Write a file via a temporary file and a rename, so readers never see it half-written."""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_parse_cache(path, exam):
+    """Atomically write a parsed exam sidecar."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_file_atomic(path, json.dumps(exam, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+async def load_parsed_exam(pdf_path, progress=None, digest=None):
+    """
+    Return the parsed exam for a PDF, using the parse cache when possible.
+    
+    A cache hit costs one hash of the file (skipped when its `digest` is
+    known) and one sidecar read; on a miss the PDF is parsed with parse_pdf
+    and the result is stored for next time.
+    """
+    if digest is None:
+        digest = await asyncio.to_thread(hash_file, pdf_path)
+    cache_path = parse_cache_path(digest)
+    
+    exam = await asyncio.to_thread(read_parse_cache, cache_path)
+    if exam is not None:
+        logger.info(f"Loaded parsed exam for {pdf_path} from cache {cache_path}")
+        return exam
+    
+    exam = await parse_pdf(pdf_path, progress=progress)
+    try:
+        await asyncio.to_thread(write_parse_cache, cache_path, exam)
+        logger.info(f"Saved parsed exam to cache {cache_path}")
+    except OSError as e:
+        logger.warning(f"Failed to write parse cache {cache_path}: {str(e)}")
+    return exam
+
+# Line patterns recognised by the question tokenizer
+QUESTION_LINE_RE = re.compile(r"[1-9][0-9]*[.)]")  # "12." or "12)"
+OPTION_LINE_RE = re.compile(r"([a-gA-G])[.)]")  # "a." or "B)"
+FIRST_OPTION_LINE_RE = re.compile(r"[abAB][.)]")  # an option list starting on the next line
+
+TOKEN_QUESTION = "question"
+TOKEN_OPTION = "option"
+TOKEN_TEXT = "text"
+
+class ExamParseState:
+    """
+    Parser state carried between successive pieces of a document.
+    
+    Holds at most one partial line, one line waiting for its look-ahead and
+    one open question, so a document can be parsed page range by page range
+    (possibly in different worker processes) with bounded memory.
+    """
+
+    def __init__(self):
+        self.carry = ""  # Text after the last line break seen so far
+        self.pending_line = None  # Line whose successor has not been seen yet
+        self.current_question = None
+        self.current_options = []
+        self.question_id = 1
+
+def iter_text_lines(chunks, state=None, final=True):
+    """
+    Yield the stripped, non-empty lines of a stream of text chunks.
+    
+    Chunks are concatenated logically, so a line split across two pages is
+    yielded once. All line ending styles are treated alike.
+    """
+    state = state or ExamParseState()
+    for chunk in chunks:
+        chunk = (state.carry + chunk).replace('\r\n', '\n').replace('\r', '\n')
+        *lines, state.carry = chunk.split('\n')
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+    if final:
+        line = state.carry.strip()
+        state.carry = ""
+        if line:
+            yield line
+
+def classify_exam_line(line, next_line):
+    """Return the (kind, value, next_starts_options) token for one line."""
+    next_starts_options = next_line is not None and FIRST_OPTION_LINE_RE.match(next_line) is not None
+    
+    if QUESTION_LINE_RE.match(line):
+        return TOKEN_QUESTION, line, next_starts_options
+    
+    match = OPTION_LINE_RE.match(line)
+    option_content = line[2:].strip() if match else ""
+    # An option whose text looks like a numbered question is not an option
+    if option_content and not QUESTION_LINE_RE.match(option_content):
+        return TOKEN_OPTION, (match.group(1).lower(), option_content), next_starts_options
+    return TOKEN_TEXT, line, next_starts_options
+
+def tokenize_exam_lines(lines, state=None, final=True):
+    """
+    Classify exam lines in a single pass.
+    
+    Yields (kind, value, next_starts_options) tuples where kind is one of
+    TOKEN_QUESTION, TOKEN_OPTION or TOKEN_TEXT. Option values are
+    (letter, text) pairs. next_starts_options tells whether the following line
+    looks like the first option of a list, which the parser uses to detect
+    questions that are not numbered.
+    """
+    state = state or ExamParseState()
+    line = state.pending_line
+    for next_line in lines:
+        if line is not None:
+            yield classify_exam_line(line, next_line)
+        line = next_line
+    if final and line is not None:
+        yield classify_exam_line(line, None)
+        line = None
+    state.pending_line = line
+
+def parse_question_tokens(tokens, state=None, final=True):
+    """
+    Assemble tokens from tokenize_exam_lines into questions.
+    
+    Yields each question as soon as it is complete. Questions are numbered in
+    order of appearance, before any validation.
+    """
+    state = state or ExamParseState()
+    current_question = state.current_question
+    current_options = state.current_options
+    question_id = state.question_id
+    
+    for kind, value, next_starts_options in tokens:
+        if kind == TOKEN_QUESTION:
+            # If we have a previous question, emit it
+            if current_question and current_options:
+                yield {"id": question_id, "text": current_question, "options": current_options}
+                question_id += 1
+            current_question = value
+            current_options = []
+        elif kind == TOKEN_OPTION:
+            letter, option_content = value
+            current_options.append({"id": letter, "text": option_content})
+        elif current_question and current_options and next_starts_options:
+            # An unnumbered line followed by options starts a new question
+            yield {"id": question_id, "text": current_question, "options": current_options}
+            question_id += 1
+            current_question = value
+            current_options = []
+    
+    # Emit the last question if there is one
+    if final:
+        if current_question and current_options:
+            yield {"id": question_id, "text": current_question, "options": current_options}
+            question_id += 1
+        current_question = None
+        current_options = []
+    
+    state.current_question = current_question
+    state.current_options = current_options
+    state.question_id = question_id
+
+def validate_questions(questions):
+    """
+    Drop questions with fewer than 2 options and sort the options of the rest.
+    """
+    for q in questions:
+        if len(q["options"]) >= 2:
+            # Sort options by their ID to ensure they're in the correct order
+            q["options"] = sorted(q["options"], key=lambda x: x["id"])
+            yield q
+        else:
+            logger.warning(f"Skipping question {q['id']} due to insufficient options ({len(q['options'])})")
+
+def no_questions_placeholder():
+    """Return the question list shown when a PDF contains no valid questions."""
+    return [{
+        "id": 1,
+        "text": "No valid questions found in the PDF. Please upload a different file.",
+        "options": [
+            {"id": "a", "text": "Option A"},
+            {"id": "b", "text": "Option B"}
+        ]
+    }]
+
+def extract_questions_from_text(text):
+    """
+    Extract questions from the PDF text and generate multiple-choice options if needed.
+    """
+    logger.info("Starting question extraction from text")
+    
+    validated_questions = list(validate_questions(parse_question_tokens(tokenize_exam_lines(iter_text_lines([text])))))
+    
+    # If no valid questions were found, create a default question
+    if not validated_questions:
+        logger.warning("No valid questions found in the PDF, creating a default question")
+        validated_questions = no_questions_placeholder()
+    
+    logger.info(f"Extracted {len(validated_questions)} valid questions from the text")
+    return validated_questions
+
+def build_exam_payload(exam):
+    """
+    Serialize the public part of an exam once, in every encoding we serve.
+    
+    Only the questions are sent to browsers. The ETag is derived from the
+    content and suffixed per content-coding, as strong validators must differ
+    between encodings.
+    
+    `bounds[i]` is where question i starts in the identity body, so pages and
+    NDJSON streams are sliced out of it without serializing again; question
+    i ends one byte before `bounds[i + 1]`, at the comma or closing bracket.
+    """
+    prefix = b'{"questions":['
+    lines = [
+        json.dumps(question, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        for question in exam["questions"]
+    ]
+    body = prefix + b','.join(lines) + b']}'
+    bounds = [len(prefix)]
+    for line in lines:
+        bounds.append(bounds[-1] + len(line) + 1)
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    encodings = {"identity": body, "gzip": gzip.compress(body, compresslevel=9)}
+    if brotli:
+        encodings["br"] = brotli.compress(body, quality=11)
+    return {"digest": digest, "encodings": encodings, "bounds": bounds}
+
+# Placeholders in packed answer rows and answer keys; they never equal each other
+NO_ANSWER = "\0"
+NO_KEY = "\1"
+
+# Single latin-1 characters that may appear in a packed row as themselves
+PACKABLE_ANSWERS = {chr(code): chr(code) for code in range(256) if chr(code) not in (NO_ANSWER, NO_KEY)}
+
+def pack_answer(answer, placeholder: str) -> str:
+    """
+    Return a single-character latin-1 answer as is, anything else as `placeholder`,
+    so packed rows always encode to one byte per question.
+    """
+    return PACKABLE_ANSWERS.get(answer, placeholder) if isinstance(answer, str) else placeholder
+
+def pack_answers(answers, placeholder: str) -> str:
+    try:
+        return "".join([PACKABLE_ANSWERS.get(answer, placeholder) for answer in answers])
+    except TypeError:
+        # Unhashable values such as lists in a malformed submission
+        return "".join([pack_answer(answer, placeholder) for answer in answers])
+
+class ExamIndex:
+    """
+    Lookup tables compiled once per exam and answer key.
+    
+    A student's answers are packed into a string with one character per
+    question, so grading is a single `map(operator.eq, ...)` over the row
+    and the key instead of a walk over every question's options. Option
+    labels and the question lines of the admin report are rendered up front.
+    """
+
+    def __init__(self, exam, answers):
+        questions = exam["questions"]
+        self.question_ids = [str(question["id"]) for question in questions]
+        self.positions = {question_id: i for i, question_id in enumerate(self.question_ids)}
+        self.question_texts = [question["text"] for question in questions]
+        self.option_ids = []  # Per question: option id -> option position
+        self.option_labels = []  # Per question: option id -> "A. option text"
+        for question in questions:
+            ids, labels = {}, {}
+            for position, option in enumerate(question["options"]):
+                ids.setdefault(option["id"], position)
+                labels.setdefault(option["id"], f"{option['id'].upper()}. {option['text']}")
+            self.option_ids.append(ids)
+            self.option_labels.append(labels)
+        self.report_lines = [
+            f"\n<b>Q{question_id}:</b> {text}\n"
+            for question_id, text in zip(self.question_ids, self.question_texts)
+        ]
+        # Only questions covered by the key are graded
+        self.key = pack_answers(answers[:len(questions)], NO_KEY)
+        self.key_labels = [
+            self.option_labels[i].get(self.key[i], "Unknown") if i < len(self.key) else "Unknown"
+            for i in range(len(questions))
+        ]
+
+    @property
+    def question_count(self) -> int:
+        return len(self.question_ids)
+
+    def pack_answers(self, answers) -> str:
+        """Pack a list of answers in question order into one character per question."""
+        row = pack_answers(answers[:self.question_count], NO_ANSWER)
+        return row.ljust(self.question_count, NO_ANSWER)
+
+    def mark(self, row: str) -> List[bool]:
+        """Compare a packed row against the key; questions without a key are never correct."""
+        marks = list(map(operator.eq, row, self.key))
+        marks.extend([False] * (self.question_count - len(marks)))
+        return marks
+
+    def score(self, marks: List[bool]):
+        """Return (correct, incorrect) over the graded questions."""
+        correct = sum(marks)
+        return correct, len(self.key) - correct
+
+    def answer_label(self, i: int, answer: str) -> str:
+        return self.option_labels[i].get(answer, "Not answered")
+
+class AnswerMatrix:
+    """
+    Every stored submission packed into one students × questions byte matrix.
+    
+    Rows are fixed-width slices of a single bytearray, one byte per question.
+    Regrading XORs the whole matrix against the key repeated once per row as
+    two big integers, then counts the zero bytes of each row, instead of
+    comparing answers one Python object at a time.
+    
+    Item-analysis counters are kept alongside and adjusted on every row
+    change: how often each option was picked per question, and a histogram
+    of scores against the current key. Reading them never scans the rows.
+    """
+
+    def __init__(self, width: int, key: str = ""):
+        self.width = width
+        self.key = key
+        self.clear()
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def _count(self, row: str, score: int, step: int):
+        for counts, answer in zip(self.option_counts, row):
+            counts[answer] = counts.get(answer, 0) + step
+        self.score_histogram[score] += step
+
+    def _score(self, row: str) -> int:
+        return sum(map(operator.eq, row, self.key))
+
+    def set(self, student_id: str, row: str):
+        """Insert or replace a student's row, packed by ExamIndex.pack_answers."""
+        packed = row.encode('latin-1')
+        score = self._score(row)
+        i = self.rows.get(student_id)
+        if i is None:
+            self.rows[student_id] = len(self.student_ids)
+            self.student_ids.append(student_id)
+            self.row_scores.append(score)
+            self.data += packed
+        else:
+            old = self.data[i * self.width:(i + 1) * self.width].decode('latin-1')
+            self._count(old, self.row_scores[i], -1)
+            self.row_scores[i] = score
+            self.data[i * self.width:(i + 1) * self.width] = packed
+        self._count(row, score, 1)
+
+    def remove(self, student_id: str):
+        """Drop a student's row by moving the last row into its place."""
+        i = self.rows.pop(student_id, None)
+        if i is None:
+            return
+        old = self.data[i * self.width:(i + 1) * self.width].decode('latin-1')
+        self._count(old, self.row_scores[i], -1)
+        last = len(self.student_ids) - 1
+        if i != last:
+            moved = self.student_ids[last]
+            self.student_ids[i] = moved
+            self.row_scores[i] = self.row_scores[last]
+            self.rows[moved] = i
+            self.data[i * self.width:(i + 1) * self.width] = self.data[last * self.width:]
+        self.student_ids.pop()
+        self.row_scores.pop()
+        del self.data[last * self.width:]
+
+    def clear(self):
+        self.student_ids = []
+        self.rows = {}
+        self.row_scores = []  # Score of each row against self.key
+        self.data = bytearray()
+        self.option_counts = [{} for _ in range(self.width)]  # Per question: packed answer -> students
+        self.score_histogram = [0] * (self.width + 1)
 
-async def handle_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Handle PDF file uploads and extract questions.
+    def set_key(self, key: str):
+        """Switch to a new answer key and rescore every row in one pass."""
+        self.key = key
+        self.row_scores = list(self.scores(key).values())
+        self.score_histogram = [0] * (self.width + 1)
+        for score in self.row_scores:
+            self.score_histogram[score] += 1
+
+    def matches(self, key: str) -> bytes:
+        """XOR every row with the key; a zero byte marks a correct answer."""
+        key_row = key.encode('latin-1').ljust(self.width, NO_KEY.encode('latin-1'))
+        size = len(self.data)
+        matrix = int.from_bytes(self.data, 'big')
+        keys = int.from_bytes(key_row * len(self.student_ids), 'big')
+        return (matrix ^ keys).to_bytes(size, 'big')
+
+    def scores(self, key: str) -> Dict[str, int]:
+        """Number of correct answers of every student against `key`."""
+        matches = self.matches(key)
+        width = self.width
+        return {
+            student_id: matches.count(0, i * width, (i + 1) * width)
+            for i, student_id in enumerate(self.student_ids)
+        }
+
+# Id of the exam of single-exam installs; it keeps their storage collections and asset names
+DEFAULT_EXAM_ID = "default"
+EXAM_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,32}")
+
+class Exam:
     """
-    user_id = update.effective_user.id
-    chat_id = update.effective_chat.id
-    
-    
-    if user_id not in verified_admins and chat_id != ADMIN_CHAT_ID_INT:
-        logger.warning(f"Unauthorized PDF upload attempt by user {user_id} in chat {chat_id}")
-        await update.message.reply_text("You are not authorized to upload PDFs.")
-        return
+    One exam: its source PDF, answer key, time limit, student results,
+    attempts and the draft answers of attempts in progress.
     
+    Results and attempts are always in memory. The parsed questions and what
+    is compiled from them (the /api/exam payload, the grading index and the
+    answer matrix) are only held while the exam is among the registry's
+    recently used ones; `parsed` is None otherwise.
+    """
 
-    if not update.message.document or not update.message.document.mime_type == 'application/pdf':
-        await update.message.reply_text("Please upload a PDF file.")
-        return
-    
-    try:
-     
-        os.makedirs("uploads", exist_ok=True)
-        
+    def __init__(self, exam_id: str, title: Optional[str] = None, pdf_path: Optional[str] = None,
+                 digest: Optional[str] = None, answers: Optional[List[str]] = None,
+                 created_at: Optional[str] = None, time_limit: Optional[int] = None):
+        self.exam_id = exam_id
+        self.title = title or exam_id
+        self.pdf_path = pdf_path
+        self.digest = digest  # SHA-256 of the PDF, naming its parse cache sidecar
+        self.correct_answers = answers or []
+        self.created_at = created_at or datetime.datetime.now().isoformat()
+        self.time_limit = time_limit  # Seconds per attempt, None if the exam is not timed
+        self.results = {}  # student_id -> result
+        self.attempts = {}  # student_id -> attempt
+        self.drafts = {}  # student_id -> answers saved while the attempt is open
+        self.unload()
+
+    def collection(self, name: str) -> str:
+        """Name of one of this exam's storage collections."""
+        return name if self.exam_id == DEFAULT_EXAM_ID else f"{name}:{self.exam_id}"
+
+    def asset_name(self, name: str) -> str:
+        """Name of one of this exam's published assets."""
+        if self.exam_id == DEFAULT_EXAM_ID:
+            return name
+        stem, ext = os.path.splitext(name)
+        return f"{stem}-{self.exam_id}{ext}"
+
+    @property
+    def loaded(self) -> bool:
+        return self.parsed is not None
+
+    def load(self, parsed):
+        """Hold the parsed questions and compile the payload, index and answer matrix."""
+        self.parsed = parsed
+        self.payload = build_exam_payload(parsed)  # Pre-encoded public /api/exam response
+        self.index = ExamIndex(parsed, self.correct_answers)
+        self.matrix = AnswerMatrix(self.index.question_count, self.index.key)
+        for student_id, result in self.results.items():
+            self.matrix.set(student_id, self.index.pack_answers(result.get("answers", [])))
+
+    def unload(self):
+        self.parsed = None
+        self.payload = None
+        self.index = None  # ExamIndex of the questions and answer key, used for grading and rendering
+        self.matrix = AnswerMatrix(0)  # Answers of every stored result
+
+    def set_correct_answers(self, answers):
+        """Replace and persist the answer key."""
+        self.apply_answers(answers)
+        self.save()
+
+    def apply_answers(self, answers):
+        """Replace the answer key and recompile the index against it."""
+        self.correct_answers = answers
+        if self.parsed:
+            self.index = ExamIndex(self.parsed, answers)
+            self.matrix.set_key(self.index.key)
+
+    def update(self, record: Dict[str, Any]) -> bool:
+        """Take over this exam's record as saved by another worker; True if its questions changed."""
+        replaced = (record["pdf_path"], record["digest"]) != (self.pdf_path, self.digest)
+        self.title, self.pdf_path, self.digest = record["title"], record["pdf_path"], record["digest"]
+        self.created_at = record["created_at"]
+        self.time_limit = record.get("time_limit")
+        if replaced:
+            self.correct_answers = record["answers"]
+            self.unload()
+        elif record["answers"] != self.correct_answers:
+            self.apply_answers(record["answers"])
+        return replaced
+
+    def put_result(self, student_id: str, result: Dict[str, Any]):
+        self.apply_result(student_id, result)
+        storage.put(self.collection("student_results"), student_id, result)
+
+    def apply_result(self, student_id: Optional[str], result: Optional[Dict[str, Any]]):
+        """Store, remove (result None) or clear (student_id None) results in memory only."""
+        if student_id is None:
+            self.results.clear()
+            self.matrix.clear()
+        elif result is None:
+            if self.results.pop(student_id, None) is not None:
+                self.matrix.remove(student_id)
+        else:
+            self.results[student_id] = result
+            if self.index:
+                self.matrix.set(student_id, self.index.pack_answers(result.get("answers", [])))
+
+    def remove_result(self, student_id: str):
+        if self.results.pop(student_id, None) is not None:
+            storage.delete(self.collection("student_results"), student_id)
+            self.matrix.remove(student_id)
+
+    def clear_results(self):
+        self.results.clear()
+        storage.clear(self.collection("student_results"))
+        self.matrix.clear()
+
+    def put_attempt(self, student_id: str):
+        storage.put(self.collection("student_attempts"), student_id, self.attempts[student_id])
+        track_deadline(self, student_id)
+
+    def apply_attempt(self, student_id: Optional[str], attempt: Optional[Dict[str, Any]]):
+        """Store, remove (attempt None) or clear (student_id None) attempts in memory only."""
+        if student_id is None:
+            self.attempts.clear()
+            deadline_scheduler.cancel_exam(self.exam_id)
+            return
+        if attempt is None:
+            self.attempts.pop(student_id, None)
+        else:
+            self.attempts[student_id] = attempt
+        track_deadline(self, student_id)
+
+    def drop_draft(self, student_id: str):
+        draft_buffer.discard(self.exam_id, student_id)
+        if self.drafts.pop(student_id, None) is not None:
+            storage.delete(self.collection("exam_drafts"), student_id)
+
+    def apply_draft(self, student_id: Optional[str], answers: Optional[Dict[str, Any]]):
+        """Store, remove (answers None) or clear (student_id None) drafts in memory only."""
+        if student_id is None:
+            self.drafts.clear()
+        elif answers is None:
+            self.drafts.pop(student_id, None)
+        else:
+            self.drafts[student_id] = answers
+
+    def restore(self):
+        """Read this exam's results, attempts and drafts back from storage and schedule its deadlines."""
+        self.results.update(storage.load(self.collection("student_results")))
+        self.attempts.update(storage.load(self.collection("student_attempts")))
+        self.drafts.update(storage.load(self.collection("exam_drafts")))
+        for student_id in self.attempts:
+            track_deadline(self, student_id)
+
+    def save(self):
+        storage.put("exams", self.exam_id, {
+            "title": self.title,
+            "pdf_path": self.pdf_path,
+            "digest": self.digest,
+            "answers": self.correct_answers,
+            "created_at": self.created_at,
+            "time_limit": self.time_limit
+        })
+
+class ExamRegistry:
+    """
+    Every exam by id, with the parsed form of at most `capacity` of them in memory.
     
-        os.makedirs("static/js", exist_ok=True)
+    load() marks an exam as recently used. When more than `capacity` exams
+    are parsed, the least recently used one is unloaded; it is read back from
+    its parse cache sidecar (or the PDF is parsed again if the sidecar is
+    gone) the next time it is used. Requests that name no exam get the
+    default one, the latest upload.
+    """
 
-        file = await context.bot.get_file(update.message.document.file_id)
-        pdf_path = os.path.join("uploads", update.message.document.file_name)
-        await file.download_to_drive(pdf_path)
-        
-        logger.info(f"PDF downloaded to: {pdf_path}")
-        
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.exams = {}  # exam_id -> Exam
+        self.default_id = None
+        self._recent = OrderedDict()  # Ids of parsed exams, least recently used first
+        self._load_locks = {}  # exam_id -> lock, so concurrent requests load an exam only once
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page_num, page in enumerate(doc):
-            page_text = page.get_text()
-            text += page_text
-            logger.info(f"Extracted text from page {page_num+1}, length: {len(page_text)}")
-        
-        logger.info(f"Total extracted text length: {len(text)}")
-        
+    def get(self, exam_id: Optional[str] = None) -> Optional[Exam]:
+        """The exam with this id, or the default exam for None, parsed or not."""
+        return self.exams.get(exam_id or self.default_id)
 
-        global current_exam
-        questions = extract_questions_from_text(text)
-        current_exam = {
-            "raw_text": text,
-            "questions": questions
-        }
-        
+    def add(self, exam: Exam):
+        """Register and persist a new exam and make it the default."""
+        self.exams[exam.exam_id] = exam
+        self.default_id = exam.exam_id
+        exam.save()
 
-        questions_file = os.path.join("static", "js", "exam-questions.js")
-        with open(questions_file, 'w', encoding='utf-8') as f:
-            f.write(f"const examQuestions = {json.dumps(questions, ensure_ascii=False, indent=2)};")
-        
-        logger.info(f"Saved {len(questions)} questions to {questions_file}")
+    def remove(self, exam_id: str) -> Optional[Exam]:
+        exam = self._forget(exam_id)
+        if exam is not None:
+            storage.delete("exams", exam_id)
+        return exam
 
-        await update.message.reply_text(f"PDF processed successfully. Found {len(questions)} questions.")
-        
+    def _forget(self, exam_id: str) -> Optional[Exam]:
+        exam = self.exams.pop(exam_id, None)
+        if exam is None:
+            return None
+        self._recent.pop(exam_id, None)
+        self._load_locks.pop(exam_id, None)
+        deadline_scheduler.cancel_exam(exam_id)
+        if self.default_id == exam_id:
+            self._pick_default()
+        exam.unload()
+        return exam
 
-        logger.info(f"Processed PDF: {update.message.document.file_name}, found {len(questions)} questions")
-        
-    except Exception as e:
-        logger.error(f"Error processing PDF: {str(e)}")
-        await update.message.reply_text(f"Error processing PDF: {str(e)}")
+    def _pick_default(self):
+        latest = max(self.exams.values(), key=lambda exam: exam.created_at, default=None)
+        self.default_id = latest.exam_id if latest else None
 
-def extract_questions_from_text(text):
+    def apply(self, exam_id: str, record: Optional[Dict[str, Any]]):
+        """Mirror an exam another worker added, changed or deleted."""
+        if record is None:
+            self._forget(exam_id)
+            return
+        exam = self.exams.get(exam_id)
+        if exam is None:
+            exam = self.exams[exam_id] = Exam(exam_id, **record)
+            exam.restore()
+        elif exam.update(record):
+            self._recent.pop(exam_id, None)
+        self._pick_default()
+
+    def restore(self):
+        """Recreate every exam from storage, unparsed."""
+        self.exams.clear()
+        self._recent.clear()
+        for exam_id, record in storage.load("exams").items():
+            exam = Exam(exam_id, **record)
+            exam.restore()
+            self.exams[exam_id] = exam
+        self._pick_default()
+
+    def touch(self, exam: Exam):
+        """Mark a parsed exam as recently used, unloading the least recently used beyond capacity."""
+        self._recent[exam.exam_id] = None
+        self._recent.move_to_end(exam.exam_id)
+        while len(self._recent) > self.capacity:
+            exam_id, _ = self._recent.popitem(last=False)
+            evicted = self.exams.get(exam_id)
+            if evicted:
+                evicted.unload()
+                self.evictions += 1
+                logger.info(f"Unloaded exam {exam_id} from memory")
+
+    async def load(self, exam: Exam) -> Exam:
+        """Return `exam` parsed, reading it back from its parse cache if it was unloaded."""
+        if exam.loaded:
+            self.hits += 1
+            self.touch(exam)
+            return exam
+        lock = self._load_locks.setdefault(exam.exam_id, asyncio.Lock())
+        async with lock:
+            if not exam.loaded:
+                self.misses += 1
+                if not exam.pdf_path or not os.path.exists(exam.pdf_path):
+                    raise FileNotFoundError(f"The PDF of exam {exam.exam_id} is missing")
+                exam.load(await load_parsed_exam(exam.pdf_path, digest=exam.digest))
+                logger.info(f"Loaded exam {exam.exam_id} with {exam.index.question_count} questions")
+            self.touch(exam)
+        return exam
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "exams": len(self.exams),
+            "parsed": len(self._recent),
+            "capacity": self.capacity,
+            "default": self.default_id,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+exam_registry = ExamRegistry(EXAM_CACHE_SIZE)
+
+async def load_exam(exam_id: Optional[str] = None) -> Optional[Exam]:
     """
-    Extract questions from the PDF text and generate multiple-choice options if needed.
+    The exam with this id, or the default exam, parsed and ready to serve;
+    None if there is no such exam or it cannot be loaded.
     """
-    logger.info("Starting question extraction from text")
+    exam = exam_registry.get(exam_id)
+    if exam is None:
+        return None
+    try:
+        return await exam_registry.load(exam)
+    except Exception as e:
+        logger.error(f"Error loading exam {exam.exam_id}: {str(e)}")
+        return None
+
+def exam_url(path: str, exam_id: Optional[str]) -> str:
+    """Add the exam_id query parameter to a URL, when there is an exam id."""
+    if not exam_id:
+        return path
+    return f"{path}{'&' if '?' in path else '?'}exam_id={urllib.parse.quote(exam_id)}"
+
+templates.env.globals["exam_url"] = exam_url
+
+def regrade_results(exam: Exam):
+    """
+    Recompute every stored score of a parsed exam against its answer key.
     
-    # Clean the text by normalizing line endings
-    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    Returns (student_id, old_correct, new_correct) for each result whose
+    score changed; the changed results are persisted.
+    """
+    index, matrix = exam.index, exam.matrix
+    if index is None or not matrix:
+        return []
+    graded = len(index.key)
+    changes = []
+    now = datetime.datetime.now().isoformat()
+    for student_id, correct in zip(matrix.student_ids, matrix.row_scores):
+        result = exam.results[student_id]
+        if result.get("correct") == correct and result.get("incorrect") == graded - correct:
+            continue
+        changes.append((student_id, result.get("correct", 0), correct))
+        result["correct"] = correct
+        result["incorrect"] = graded - correct
+        result["updated_at"] = now
+        storage.put(exam.collection("student_results"), student_id, result)
+    return changes
+
+def format_regrade_report(exam: Exam, changes, limit: int = 50) -> str:
+    """Summarize regrade score changes for the admin chat."""
+    total = exam.index.question_count
+    # Results graded for the first time may only gain an incorrect count
+    changes = [change for change in changes if change[1] != change[2]]
+    lines = [
+        f"♻️ Regraded {len(exam.matrix)} submissions of exam {exam.exam_id} against the new answers: "
+        f"{len(changes)} scores changed."
+    ]
+    for student_id, old, new in sorted(changes, key=lambda change: change[2] - change[1])[:limit]:
+        student = approved_students.get(student_id, {})
+        name = f"{student.get('name', '')} {student.get('surname', '')}".strip() or "Unknown"
+        lines.append(f"{name} ({student_id}): {old}/{total} → {new}/{total} ({new - old:+d})")
+    if len(changes) > limit:
+        lines.append(f"... and {len(changes) - limit} more")
+    return "\n".join(lines)
+
+def exam_statistics(exam: Exam) -> Dict[str, Any]:
+    """
+    Item analysis of a parsed exam's results, read from the AnswerMatrix counters.
     
-    # Split into lines and remove empty lines
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    logger.info(f"Found {len(lines)} lines in the text")
+    Cost depends on the number of questions and options only, not on the
+    number of submissions.
+    """
+    index = exam.index
+    matrix = exam.matrix
+    submissions = len(matrix)
+    if index is None:
+        return {"exam_id": exam.exam_id, "submissions": 0, "questions": []}
     
     questions = []
-    current_question = None
-    current_options = []
-    option_letters = ['a', 'b', 'c', 'd', 'e', 'f', 'g']
-    question_id = 1
-    
-    for i, line in enumerate(lines):
-        # Check if line is a question (starts with a number)
-        if any(line.startswith(f"{num}.") or line.startswith(f"{num})") for num in range(1, 100)):
-            # If we have a previous question, save it
-            if current_question and current_options:
-                questions.append({
-                    "id": question_id,
-                    "text": current_question,
-                    "options": current_options
-                })
-                logger.info(f"Found question {question_id} with {len(current_options)} options")
-                question_id += 1
-            
-            # Start new question
-            current_question = line
-            current_options = []
-            continue
-        
-        # Check if line is an option
-        is_option = False
-        for opt in option_letters:
-            if line.lower().startswith(f"{opt}.") or line.lower().startswith(f"{opt})"):
-                # Check if this is really an option and not the start of a new question
-                # by looking at the content after the option identifier
-                option_content = line[2:].strip()
-                if option_content and not any(option_content.startswith(f"{num}.") or option_content.startswith(f"{num})") 
-                                           for num in range(1, 100)):
-                    current_options.append({
-                        "id": opt,
-                        "text": option_content
-                    })
-                    is_option = True
-                    break
-        
-        # If line is not an option and we have a current question with options,
-        # and the line looks like it might be the start of a new question,
-        # save the current question and start a new one
-        if not is_option and current_question and current_options:
-            if (i + 1 < len(lines) and 
-                any(lines[i + 1].lower().startswith(f"{opt}.") or lines[i + 1].lower().startswith(f"{opt})") 
-                    for opt in option_letters[:2])):  # Check if next line starts with 'a.' or 'b.'
-                questions.append({
-                    "id": question_id,
-                    "text": current_question,
-                    "options": current_options
-                })
-                logger.info(f"Found question {question_id} with {len(current_options)} options")
-                question_id += 1
-                current_question = line
-                current_options = []
-    
-    # Add the last question if there is one
-    if current_question and current_options:
+    for i, question_id in enumerate(index.question_ids):
+        counts = matrix.option_counts[i]
+        key = index.key[i] if i < len(index.key) and index.key[i] != NO_KEY else None
+        options = {option_id: counts.get(option_id, 0) for option_id in index.option_ids[i]}
+        distractors = {option_id: count for option_id, count in options.items() if option_id != key and count}
+        correct = counts.get(key, 0) if key else None
         questions.append({
             "id": question_id,
-            "text": current_question,
-            "options": current_options
+            "correct_option": key,
+            "answered": submissions - counts.get(NO_ANSWER, 0),
+            "correct": correct,
+            # Share of students who got the question right; lower is harder
+            "difficulty": round(correct / submissions, 3) if key and submissions else None,
+            "options": options,
+            "top_distractor": max(distractors, key=distractors.get) if key and distractors else None
         })
-        logger.info(f"Found final question {question_id} with {len(current_options)} options")
     
-    # Validate questions and their options
-    validated_questions = []
-    for q in questions:
-        # Only include questions that have at least 2 options
-        if len(q["options"]) >= 2:
-            # Sort options by their ID to ensure they're in the correct order
-            q["options"] = sorted(q["options"], key=lambda x: x["id"])
-            validated_questions.append(q)
-            logger.info(f"Question {q['id']} validated with {len(q['options'])} options")
-        else:
-            logger.warning(f"Skipping question {q['id']} due to insufficient options ({len(q['options'])})")
+    total_score = sum(score * count for score, count in enumerate(matrix.score_histogram))
+    return {
+        "exam_id": exam.exam_id,
+        "submissions": submissions,
+        "graded_questions": len(index.key),
+        "mean_score": round(total_score / submissions, 2) if submissions else None,
+        "score_histogram": matrix.score_histogram,
+        "questions": questions
+    }
+
+def format_statistics_report(stats: Dict[str, Any], hardest: int = 10) -> str:
+    """Render exam_statistics() as a Telegram message."""
+    if not stats["submissions"]:
+        return f"No student results available for exam {html.escape(stats['exam_id'])}."
+    total = len(stats["questions"])
+    lines = [
+        f"📈 <b>Exam Statistics: {html.escape(stats['exam_id'])}</b>\n",
+        f"Submissions: {stats['submissions']}",
+        f"Mean score: {stats['mean_score']}/{total}\n",
+        "<b>Score distribution:</b>"
+    ]
+    # Group the histogram into at most ten score bands
+    band = max(1, -(-(total + 1) // 10))
+    histogram = stats["score_histogram"]
+    peak = max(histogram) or 1
+    for low in range(0, total + 1, band):
+        high = min(total, low + band - 1)
+        count = sum(histogram[low:high + 1])
+        label = f"{low}" if low == high else f"{low}-{high}"
+        lines.append(f"<code>{label:>7}</code> {'█' * round(count / peak * 12)} {count}")
     
-    # If no valid questions were found, create a default question
-    if not validated_questions:
-        logger.warning("No valid questions found in the PDF, creating a default question")
-        validated_questions.append({
-            "id": 1,
-            "text": "No valid questions found in the PDF. Please upload a different file.",
-            "options": [
-                {"id": "a", "text": "Option A"},
-                {"id": "b", "text": "Option B"}
-            ]
-        })
+    graded = [question for question in stats["questions"] if question["difficulty"] is not None]
+    if graded:
+        lines.append("\n<b>Hardest questions:</b>")
+        for question in sorted(graded, key=lambda q: q["difficulty"])[:hardest]:
+            line = f"Q{question['id']}: {question['difficulty'] * 100:.0f}% correct"
+            if question["top_distractor"]:
+                picked = question["options"][question["top_distractor"]]
+                line += f", most picked wrong option {question['top_distractor'].upper()} ({picked})"
+            lines.append(line)
+    else:
+        lines.append("\nSet the correct answers with /answer to see question difficulty.")
+    return "\n".join(lines)
+
+def publish_exam(exam: Exam, parsed):
+    """
+    Give `exam` freshly parsed questions: rebuild its /api/exam payload, index
+    and questions asset, and mark it as recently used.
+    """
+    exam.load(parsed)
+    exam_registry.touch(exam)
+    publish_asset(
+        exam.asset_name("exam-questions.js"),
+        f"const examQuestions = {json.dumps(parsed['questions'], ensure_ascii=False, indent=2)};"
+    )
+
+def load_asset_manifest():
+    """Load the asset manifest from storage, importing the manifest file of older versions."""
+    asset_manifest.update(storage.load("assets"))
+    if asset_manifest:
+        return
+    try:
+        with open(ASSET_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            asset_manifest.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable asset manifest: {str(e)}")
+    for name, filename in asset_manifest.items():
+        storage.put("assets", name, filename)
+
+def asset_versions(name):
+    """Return the hashed file names in ASSETS_DIR that belong to a logical asset."""
+    stem, ext = os.path.splitext(name)
+    pattern = re.compile(re.escape(stem) + r"\.[0-9a-f]{16}" + re.escape(ext))
+    return [f for f in os.listdir(ASSETS_DIR) if pattern.fullmatch(f)]
+
+def remove_asset_file(filename):
+    for suffix in ("", ".gz", ".br"):
+        path = os.path.join(ASSETS_DIR, filename + suffix)
+        if os.path.exists(path):
+            os.remove(path)
+
+def publish_asset(name, content):
+    """
+    Publish an asset under a content-hashed file name and point the manifest at it.
     
-    logger.info(f"Extracted {len(validated_questions)} valid questions from the text")
-    return validated_questions
+    The file and its precompressed variants are written atomically, variants
+    first, so a hashed file that exists is always complete. The version being
+    replaced is kept for clients that are still loading a page referencing it;
+    older ones are removed.
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    stem, ext = os.path.splitext(name)
+    filename = f"{stem}.{hashlib.sha256(content).hexdigest()[:16]}{ext}"
+    path = os.path.join(ASSETS_DIR, filename)
+    
+    if not os.path.exists(path):
+        write_file_atomic(path + ".gz", gzip.compress(content, compresslevel=9))
+        if brotli:
+            write_file_atomic(path + ".br", brotli.compress(content, quality=11))
+        write_file_atomic(path, content)
+    
+    previous = asset_manifest.get(name)
+    asset_manifest[name] = filename
+    storage.put("assets", name, filename)
+    
+    for old_filename in asset_versions(name):
+        if old_filename not in (filename, previous):
+            remove_asset_file(old_filename)
+    logger.info(f"Published {name} as {filename}")
+    return filename
+
+def unpublish_asset(name):
+    """Remove an asset from the manifest and delete all of its versions."""
+    if asset_manifest.pop(name, None):
+        storage.delete("assets", name)
+    for filename in asset_versions(name):
+        remove_asset_file(filename)
+        logger.info(f"Deleted asset file: {filename}")
+
+def asset_path(name):
+    """Return the path of the current version of an asset, or None."""
+    filename = asset_manifest.get(name)
+    return os.path.join(ASSETS_DIR, filename) if filename else None
+
+def asset_url(name):
+    """Return the URL of the current version of an asset, or None. Available in templates."""
+    filename = asset_manifest.get(name)
+    return f"/assets/{filename}" if filename else None
+
+templates.env.globals["asset_url"] = asset_url
+
+def publish_static_assets():
+    """Publish the hand-written static files under content-hashed names."""
+    for name, source in STATIC_ASSET_SOURCES.items():
+        try:
+            with open(source, 'rb') as f:
+                publish_asset(name, f.read())
+        except OSError as e:
+            logger.error(f"Failed to publish {source}: {str(e)}")
 
 def generate_multiple_choice_options(question_text):
     """
@@ -437,13 +3122,18 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
         student_id = query.data.split(':')[1]
         if student_id in pending_students:
             try:
-                # Move student to approved list
-                approved_students[student_id] = pending_students[student_id]
-                del pending_students[student_id]
+                # Move student to approved list, with a session token for the browser that registered
+                approved = pending_students.pop(student_id)
+                approved["session_token"] = session_tokens.issue(student_id, approved.get("claim"))
+                approved_students[student_id] = approved
                 # Remove from rejected list if they were previously rejected
                 rejected_students.discard(student_id)
+                storage.put("approved_students", student_id, approved_students[student_id])
+                storage.delete("pending_students", student_id)
+                storage.delete("rejected_students", student_id)
                 
                 logger.info(f"Student {student_id} approved successfully")
+                student_events.publish(student_id, "approval", approval_status(student_id))
                 await query.edit_message_text(f"Student {student_id} has been approved! ✅")
                 return  # Return after successful approval
             except Exception as e:
@@ -470,8 +3160,11 @@ async def handle_rejection(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 # Add to rejected list and remove from pending
                 rejected_students.add(student_id)
                 del pending_students[student_id]
+                storage.put("rejected_students", student_id)
+                storage.delete("pending_students", student_id)
                 
                 logger.info(f"Student {student_id} rejected successfully")
+                student_events.publish(student_id, "approval", approval_status(student_id))
                 await query.edit_message_text(f"Student {student_id} has been rejected. ❌")
             except Exception as e:
                 logger.error(f"Error rejecting student {student_id}: {str(e)}")
@@ -496,27 +3189,35 @@ async def answer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("You need admin access to use this command.")
         return
     
+    exam, args = split_exam_arg(context.args or [])
+    if len(args) > 1:
+        await update.message.reply_text(f"Unknown exam: {args[0]}. Use /exams to list the exams.")
+        return
+    
     # Check if there's an exam loaded
-    if not current_exam or not current_exam.get("questions"):
+    exam = await load_exam(exam.exam_id) if exam else None
+    if not exam or not exam.parsed.get("questions"):
         await update.message.reply_text("No exam is currently loaded. Please upload a PDF first.")
         return
+    questions = exam.parsed["questions"]
     
     # Get the answers from the command
-    if not context.args:
+    if not args:
         await update.message.reply_text(
             "Please provide the correct answers for each question.\n"
-            "Example: /answer abcabcabcabc (one letter per question)"
+            "Example: /answer abcabcabcabc (one letter per question), "
+            "or /answer <exam id> abcabcabcabc for another exam than the latest"
         )
         return
     
     # Get the answers string
-    answers_str = context.args[0].lower()
+    answers_str = args[0].lower()
     
     # Check if the number of answers matches the number of questions
-    if len(answers_str) != len(current_exam["questions"]):
+    if len(answers_str) != len(questions):
         await update.message.reply_text(
-            f"The number of answers ({len(answers_str)}) does not match the number of questions ({len(current_exam['questions'])}).\n"
-            f"Please provide exactly {len(current_exam['questions'])} answers."
+            f"The number of answers ({len(answers_str)}) does not match the number of questions ({len(questions)}) of exam {exam.exam_id}.\n"
+            f"Please provide exactly {len(questions)} answers."
         )
         return
     
@@ -529,20 +3230,20 @@ async def answer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Store the correct answers
-    global correct_answers
-    correct_answers = list(answers_str)
+    exam.set_correct_answers(list(answers_str))
     
     # Save the answers to a file
     try:
-        answers_file = os.path.join("static", "js", "exam-answers.js")
-        with open(answers_file, 'w', encoding='utf-8') as f:
-            f.write(f"const examAnswers = {json.dumps(correct_answers, ensure_ascii=False, indent=2)};")
+        publish_asset(
+            exam.asset_name("exam-answers.js"),
+            f"const examAnswers = {json.dumps(exam.correct_answers, ensure_ascii=False, indent=2)};"
+        )
         
-        logger.info(f"Saved {len(correct_answers)} answers to {answers_file}")
+        logger.info(f"Saved {len(exam.correct_answers)} answers for exam {exam.exam_id}")
         
         # Send confirmation messages to both chats
         confirmation = (
-            f"✅ Correct answers set successfully for {len(correct_answers)} questions.\n"
+            f"✅ Correct answers of exam {exam.exam_id} set successfully for {len(exam.correct_answers)} questions.\n"
             f"Answers: {answers_str}"
         )
         
@@ -552,57 +3253,84 @@ async def answer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Send to group chat if command was used in individual chat
         if telegram_app and ADMIN_CHAT_ID_INT and update.effective_chat.id != ADMIN_CHAT_ID_INT:
             try:
-                await telegram_app.bot.send_message(
-                    chat_id=ADMIN_CHAT_ID_INT,
-                    text=f"Admin {update.effective_user.first_name} set answers:\n{confirmation}"
+                telegram_dispatcher.enqueue(
+                    ADMIN_CHAT_ID_INT,
+                    f"Admin {update.effective_user.first_name} set answers:\n{confirmation}"
                 )
-            except Exception as e:
-                logger.error(f"Failed to send group notification: {str(e)}")
+            except asyncio.QueueFull:
+                logger.error("Telegram queue is full, dropping group notification")
+        
+        # Regrade results already submitted against the previous key
+        if exam.matrix:
+            changes = regrade_results(exam)
+            logger.info(f"Regraded {len(exam.matrix)} results of exam {exam.exam_id}, {len(changes)} changed")
+            try:
+                telegram_dispatcher.enqueue(
+                    ADMIN_CHAT_ID_INT,
+                    format_regrade_report(exam, changes)
+                )
+            except asyncio.QueueFull:
+                logger.error("Telegram queue is full, dropping regrade report")
                 
     except Exception as e:
         logger.error(f"Error saving answers: {str(e)}")
         await update.message.reply_text(f"Error saving answers: {str(e)}")
 
+def delete_exam(exam: Exam):
+    """Remove an exam with its results, attempts, drafts, queued submissions, files and assets."""
+    exam_registry.remove(exam.exam_id)
+    exam.clear_results()
+    exam.attempts.clear()
+    storage.clear(exam.collection("student_attempts"))
+    exam.drafts.clear()
+    storage.clear(exam.collection("exam_drafts"))
+    submission_queue.clear(exam.exam_id)
+    
+    # Delete the PDF and its cached parses unless another exam uses the same file
+    others = exam_registry.exams.values()
+    if exam.pdf_path and os.path.exists(exam.pdf_path) and all(other.pdf_path != exam.pdf_path for other in others):
+        os.remove(exam.pdf_path)
+        logger.info(f"Deleted PDF file: {exam.pdf_path}")
+    if exam.digest and os.path.exists(PARSE_CACHE_DIR) and all(other.digest != exam.digest for other in others):
+        for file in os.listdir(PARSE_CACHE_DIR):
+            if file.startswith(f"{exam.digest}."):
+                os.remove(os.path.join(PARSE_CACHE_DIR, file))
+                logger.info(f"Deleted cached parse: {file}")
+    
+    unpublish_asset(exam.asset_name("exam-questions.js"))
+    unpublish_asset(exam.asset_name("exam-answers.js"))
+    
+    # Delete files written by older versions under fixed names
+    if exam.exam_id == DEFAULT_EXAM_ID:
+        for legacy_file in ("exam-questions.js", "exam-answers.js"):
+            legacy_path = os.path.join("static", "js", legacy_file)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+                logger.info(f"Deleted legacy file: {legacy_path}")
+
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Handle the /delete command to remove existing exam PDFs and answers.
+    Handle the /delete command to remove an exam with its PDF, answers and results.
     """
     user_id = update.effective_user.id
     if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
         await update.message.reply_text("You need admin access to use this command.")
         return
     
+    exam, args = split_exam_arg(context.args or [])
+    if args:
+        await update.message.reply_text(f"Unknown exam: {args[0]}. Use /exams to list the exams.")
+        return
+    if exam is None:
+        await update.message.reply_text("There is no exam to delete.")
+        return
+    
     try:
-        # Clear global variables
-        global current_exam, correct_answers, student_results
-        current_exam = None
-        correct_answers = []
-        student_results.clear()  # Also clear student results when deleting exam
-        
-        # Delete PDF files in uploads directory
-        uploads_dir = "uploads"
-        if os.path.exists(uploads_dir):
-            for file in os.listdir(uploads_dir):
-                if file.lower().endswith('.pdf'):
-                    file_path = os.path.join(uploads_dir, file)
-                    os.remove(file_path)
-                    logger.info(f"Deleted PDF file: {file_path}")
-        
-        # Delete exam questions file
-        questions_file = os.path.join("static", "js", "exam-questions.js")
-        if os.path.exists(questions_file):
-            os.remove(questions_file)
-            logger.info(f"Deleted questions file: {questions_file}")
-        
-        # Delete exam answers file
-        answers_file = os.path.join("static", "js", "exam-answers.js")
-        if os.path.exists(answers_file):
-            os.remove(answers_file)
-            logger.info(f"Deleted answers file: {answers_file}")
+        delete_exam(exam)
         
         # Send confirmation to both chats
         confirmation = (
-            "✅ All exam files and student results have been deleted successfully.\n"
+            f"✅ Exam {exam.exam_id} with its files and student results has been deleted successfully.\n"
             "You can now upload a new exam using the /upload command."
         )
         
@@ -612,12 +3340,12 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Send to group chat if command was used in individual chat
         if telegram_app and ADMIN_CHAT_ID_INT and update.effective_chat.id != ADMIN_CHAT_ID_INT:
             try:
-                await telegram_app.bot.send_message(
-                    chat_id=ADMIN_CHAT_ID_INT,
-                    text=f"Admin {update.effective_user.first_name} deleted all exam files and results."
+                telegram_dispatcher.enqueue(
+                    ADMIN_CHAT_ID_INT,
+                    f"Admin {update.effective_user.first_name} deleted exam {exam.exam_id} and its results."
                 )
-            except Exception as e:
-                logger.error(f"Failed to send group notification: {str(e)}")
+            except asyncio.QueueFull:
+                logger.error("Telegram queue is full, dropping group notification")
                 
     except Exception as e:
         logger.error(f"Error in delete_command: {str(e)}")
@@ -633,9 +3361,13 @@ async def init_telegram_bot():
     # Add command handlers
     telegram_app.add_handler(CommandHandler("start", start))
     telegram_app.add_handler(CommandHandler("upload", upload_command))
+    telegram_app.add_handler(CommandHandler("exams", exams_command))
     telegram_app.add_handler(CommandHandler("answer", answer_command))
+    telegram_app.add_handler(CommandHandler("timer", timer_command))
+    telegram_app.add_handler(CommandHandler("extend", extend_command))
     telegram_app.add_handler(CommandHandler("delete", delete_command))
     telegram_app.add_handler(CommandHandler("studentlist", studentlist_command))
+    telegram_app.add_handler(CommandHandler("stats", stats_command))
     telegram_app.add_handler(CommandHandler("deletelist", deletelist_command))
     
     # Add callback query handlers
@@ -643,6 +3375,7 @@ async def init_telegram_bot():
     telegram_app.add_handler(CallbackQueryHandler(handle_rejection, pattern="^reject:"))
     telegram_app.add_handler(CallbackQueryHandler(handle_retake_approval, pattern="^retake_approve:"))
     telegram_app.add_handler(CallbackQueryHandler(handle_retake_rejection, pattern="^retake_reject:"))
+    telegram_app.add_handler(CallbackQueryHandler(handle_studentlist_page, pattern="^studentlist:"))
     
     # Add document handler for PDF files
     telegram_app.add_handler(MessageHandler(filters.Document.PDF, handle_pdf))
@@ -650,23 +3383,57 @@ async def init_telegram_bot():
     # Add message handler for secret key verification
     telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
-    # Start the bot
+    # Start the bot; every worker can send, only the leader polls for updates
     await telegram_app.initialize()
     await telegram_app.start()
-    await telegram_app.updater.start_polling()
+    await sync_telegram_polling()
     
     logger.info("Telegram bot started successfully")
 
+telegram_polling_lock = asyncio.Lock()
+
+async def sync_telegram_polling():
+    """Start or stop polling Telegram for updates as this worker gains or loses leadership."""
+    async with telegram_polling_lock:
+        if telegram_app is None or not telegram_app.running:
+            return  # init_telegram_bot calls this again once the bot is up
+        polling = telegram_app.updater.running
+        if is_leader() and not polling:
+            await telegram_app.updater.start_polling()
+            logger.info("Polling Telegram for updates")
+        elif not is_leader() and polling:
+            await telegram_app.updater.stop()
+            logger.info("Stopped polling Telegram for updates")
+
+async def fresh_state():
+    """
+    Route dependency for pages and status checks that follow an event: apply
+    what other workers committed since the last change log poll, so a browser
+    sent here by one worker's event finds the state that caused it.
+    """
+    await change_feed.catch_up()
+
+async def share_writes():
+    """
+    In multi-worker mode, commit this request's writes before answering; the
+    browser's next request may reach another worker, which only sees
+    committed state.
+    """
+    if MULTI_WORKER:
+        await storage.sync()
+
 # Routes
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+async def home(request: Request, exam_id: Optional[str] = None):
+    return templates.TemplateResponse("index.html", {"request": request, "exam_id": exam_id})
 
 @app.post("/submit-student")
 async def submit_student(
+    request: Request,
     student_id: str = Form(...),
     name: str = Form(...),
-    surname: str = Form(...)
+    surname: str = Form(...),
+    exam_id: Optional[str] = Form(None)
 ):
     try:
         # Validate required fields
@@ -676,18 +3443,24 @@ async def submit_student(
                 detail="All fields are required. Please fill in all the information."
             )
         
-        if student_id in approved_students:
-            return RedirectResponse(url="/exam", status_code=303)
+        # A student approved in another browser, or whose session expired, asks again
+        if student_id in approved_students and authorized(request, student_id):
+            return RedirectResponse(url=exam_url("/exam", exam_id), status_code=303)
         
         if student_id in rejected_students:
             rejected_students.remove(student_id)  # Clear rejection status
+            storage.delete("rejected_students", student_id)
         
-        # Add to pending list
+        # Add to pending list. The claim cookie marks this browser as the one
+        # the session token issued on approval is good for.
+        claim = secrets.token_urlsafe(24)
         pending_students[student_id] = {
             "name": name,
             "surname": surname,
-            "student_id": student_id
+            "student_id": student_id,
+            "claim": claim_hash(claim)
         }
+        storage.put("pending_students", student_id, pending_students[student_id])
         
         # Send Telegram notification with Accept and Reject buttons
         keyboard = [
@@ -700,34 +3473,46 @@ async def submit_student(
         
         message = f"New Student Login Request:\nName: {name}\nSurname: {surname}\nStudent ID: {student_id}"
         
+        def approval_request_failed():
+            # The admin never saw the request; drop it so the student can submit again
+            if pending_students.pop(student_id, None) is not None:
+                storage.delete("pending_students", student_id)
+                student_events.publish(student_id, "approval", {"status": "not_found"})
+        
         # Use the global telegram_app instead of creating a new one
         if telegram_app:
             try:
-                await telegram_app.bot.send_message(
-                    chat_id=ADMIN_CHAT_ID_INT,
-                    text=message,
-                    reply_markup=reply_markup
+                telegram_dispatcher.enqueue(
+                    ADMIN_CHAT_ID_INT,
+                    message,
+                    reply_markup=reply_markup,
+                    on_failure=approval_request_failed
                 )
-                logger.info(f"Sent approval request to admin for student {student_id}")
-            except Exception as e:
-                logger.error(f"Failed to send Telegram message: {str(e)}")
+                logger.info(f"Queued approval request to admin for student {student_id}")
+            except asyncio.QueueFull:
+                logger.error("Telegram queue is full")
                 # Remove from pending since we couldn't notify admin
                 del pending_students[student_id]
+                storage.delete("pending_students", student_id)
                 raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to send approval request: {str(e)}"
+                    status_code=503,
+                    detail="Too many requests are waiting for approval. Please try again shortly."
                 )
         else:
             logger.error("Telegram bot not initialized")
             # Remove from pending since we can't notify admin
             del pending_students[student_id]
+            storage.delete("pending_students", student_id)
             raise HTTPException(
                 status_code=500,
                 detail="System is not ready to accept requests. Please try again later."
             )
         
         # Redirect to loading page
-        return RedirectResponse(url=f"/loading/{student_id}", status_code=303)
+        await share_writes()
+        response = RedirectResponse(url=exam_url(f"/loading/{student_id}", exam_id), status_code=303)
+        response.set_cookie(CLAIM_COOKIE, claim, max_age=SESSION_TOKEN_TTL, httponly=True, samesite="lax")
+        return response
         
     except HTTPException:
         raise  # Re-raise HTTP exceptions
@@ -739,36 +3524,73 @@ async def submit_student(
         )
 
 @app.get("/loading/{student_id}", response_class=HTMLResponse)
-async def loading_page(request: Request, student_id: str):
+async def loading_page(request: Request, student_id: str, exam_id: Optional[str] = None):
     return templates.TemplateResponse("loading.html", {
         "request": request,
-        "student_id": student_id
+        "student_id": student_id,
+        "exam_id": exam_id
     })
 
-@app.get("/check-approval/{student_id}")
+@app.get("/session")
+async def start_session(request: Request, token: str, exam_id: Optional[str] = None):
+    """
+    Store the token issued on approval as the session cookie and continue to
+    the exam, provided this is the browser that registered.
+    """
+    student_id = session_tokens.verify(token, request.cookies.get(CLAIM_COOKIE))
+    if student_id is None:
+        return templates.TemplateResponse(
+            "error.html",
+            {"request": request, "error": "This approval has expired or was issued to another browser. Please register again."}
+        )
+    response = RedirectResponse(
+        url=exam_url(f"/exam?student_id={urllib.parse.quote(student_id)}", exam_id), status_code=303
+    )
+    response.set_cookie(SESSION_COOKIE, token, max_age=SESSION_TOKEN_TTL, httponly=True, samesite="lax")
+    return response
+
+def approval_status(student_id: str) -> Optional[Dict[str, str]]:
+    """
+    Return a student's registration status, or None if the student is unknown.
+    
+    An approved status carries the session token, which only the browser
+    holding the matching claim cookie can use. A student registering again
+    while approved shows as pending until the new request is decided.
+    """
+    if student_id in pending_students:
+        return {"status": "pending", "message": "Waiting for admin approval"}
+    elif student_id in approved_students:
+        status = {"status": "approved", "message": "Your request has been approved"}
+        token = approved_students[student_id].get("session_token")
+        if token:
+            status["token"] = token
+        return status
+    elif student_id in rejected_students:
+        return {"status": "rejected", "message": "Your request has been rejected"}
+    return None
+
+@app.get("/check-approval/{student_id}", dependencies=[Depends(fresh_state)])
 async def check_approval(student_id: str):
     try:
-        # Log the current state for debugging
-        logger.debug(f"Checking status for student {student_id}")
-        logger.debug(f"Pending students: {list(pending_students.keys())}")
-        logger.debug(f"Approved students: {list(approved_students.keys())}")
-        logger.debug(f"Rejected students: {list(rejected_students)}")
+        # Log the current state for debugging (only materialize the lists when it is shown)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Checking status for student {student_id}")
+            logger.debug(f"Pending students: {list(pending_students.keys())}")
+            logger.debug(f"Approved students: {list(approved_students.keys())}")
+            logger.debug(f"Rejected students: {list(rejected_students)}")
         
-        if student_id in approved_students:
-            logger.info(f"Status check: Student {student_id} is approved")
-            return {"status": "approved", "message": "Your request has been approved"}
-        elif student_id in rejected_students:
-            logger.info(f"Status check: Student {student_id} is rejected")
-            return {"status": "rejected", "message": "Your request has been rejected"}
-        elif student_id in pending_students:
-            logger.info(f"Status check: Student {student_id} is pending")
-            return {"status": "pending", "message": "Waiting for admin approval"}
+        status = approval_status(student_id)
+        if status:
+            logger.info(f"Status check: Student {student_id} is {status['status']}")
+            return status
         else:
             logger.warning(f"Status check: Student {student_id} not found in any list")
             raise HTTPException(
                 status_code=404, 
                 detail="Student not found. Please submit the form again."
             )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error checking approval status for student {student_id}: {str(e)}")
         raise HTTPException(
@@ -776,6 +3598,56 @@ async def check_approval(student_id: str):
             detail="An error occurred while checking your status. Please try again."
         )
 
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/events/{student_id}", dependencies=[Depends(fresh_state)])
+async def student_event_stream(request: Request, student_id: str, exam_id: Optional[str] = None):
+    """
+    Stream a student's approval and retake status changes as Server-Sent Events.
+    
+    The current status is sent as soon as the stream opens, then an `approval`
+    or `retake` event whenever an admin decides, and a `result` event when a
+    queued submission is graded. Retake and result events of other exams than
+    `exam_id` (the default exam if omitted) are left out, and so are all retake
+    and result events unless the request carries the student's session. The
+    waiting pages fall back to polling the check endpoints if the stream
+    cannot be used.
+    """
+    exam = exam_registry.get(exam_id)
+    exam_id = exam.exam_id if exam else None
+    private = authorized(request, student_id)
+    # Subscribe before reading the current status so no decision is missed in between
+    queue = student_events.subscribe(student_id)
+    
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            yield format_sse("approval", approval_status(student_id) or {
+                "status": "not_found",
+                "message": "Student not found. Please submit the form again."
+            })
+            if private:
+                yield format_sse("retake", retake_status(exam, student_id))
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=EVENT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if data.get("exam_id", exam_id) != exam_id or (event != "approval" and not private):
+                    continue
+                yield format_sse(event, data)
+        finally:
+            student_events.unsubscribe(student_id, queue)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/error")
 async def error_page(request: Request, message: str = Query(..., description="Error message to display")):
     """
@@ -793,31 +3665,34 @@ async def error_page(request: Request, message: str = Query(..., description="Er
         {"request": request, "error_message": message}
     )
 
-@app.get("/exam")
-async def exam_page(request: Request, student_id: Optional[str] = None):
+@app.get("/exam", dependencies=[Depends(fresh_state)])
+async def exam_page(request: Request, student_id: Optional[str] = None, exam_id: Optional[str] = None):
     """
-    Display the exam page for a student.
+    Display an exam page for a student; the latest exam unless `exam_id` names another.
     """
     try:
         # Check if there's an exam available
-        if not current_exam:
-            # Try to load an existing PDF
-            await load_existing_pdf()
-            
-            if not current_exam:
-                return templates.TemplateResponse(
-                    "error.html",
-                    {"request": request, "error": "No exam is currently available. Please check back later."}
-                )
+        exam = await load_exam(exam_id)
+        if exam is None:
+            return templates.TemplateResponse(
+                "error.html",
+                {"request": request, "error": "No exam is currently available. Please check back later."}
+            )
         
-        # If no student ID is provided, show the login form
+        # If no student ID is provided, use the session's or show the login form
+        student_id = student_id or session_student(request)
         if not student_id:
             return templates.TemplateResponse(
                 "login.html",
-                {"request": request}
+                {"request": request, "exam_id": exam.exam_id}
             )
         
         # Validate student ID
+        if not authorized(request, student_id):
+            return templates.TemplateResponse(
+                "error.html",
+                {"request": request, "error": "Your session has expired or belongs to another student. Please register again."}
+            )
         if student_id not in approved_students:
             return templates.TemplateResponse(
                 "error.html",
@@ -825,46 +3700,60 @@ async def exam_page(request: Request, student_id: Optional[str] = None):
             )
         
         # Check if student has already taken the exam
-        if student_id in student_attempts and student_attempts[student_id].get("completed", False):
+        retake_url = exam_url(f"/retake-loading/{student_id}", exam.exam_id)
+        if student_id in exam.attempts and exam.attempts[student_id].get("completed", False):
             # Get student information
             student = approved_students[student_id]
             
             # If there's a pending retake request, redirect to loading page
-            if student_attempts[student_id].get("retake_pending", False):
-                return RedirectResponse(url=f"/retake-loading/{student_id}", status_code=303)
+            if exam.attempts[student_id].get("retake_pending", False):
+                return RedirectResponse(url=retake_url, status_code=303)
             
             # Send retake request to admin group
             keyboard = [
                 [
-                    InlineKeyboardButton("Allow Retake ✅", callback_data=f"retake_approve:{student_id}"),
-                    InlineKeyboardButton("Reject Retake ❌", callback_data=f"retake_reject:{student_id}")
+                    InlineKeyboardButton("Allow Retake ✅", callback_data=f"retake_approve:{student_id}:{exam.exam_id}"),
+                    InlineKeyboardButton("Reject Retake ❌", callback_data=f"retake_reject:{student_id}:{exam.exam_id}")
                 ]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             message = (
                 "🔄 <b>Exam Retake Request</b>\n\n"
-                f"Student is attempting to retake the exam:\n"
+                f"Student is attempting to retake exam {exam.exam_id}:\n"
                 f"Name: {student['name']}\n"
                 f"Surname: {student['surname']}\n"
                 f"Student ID: {student_id}\n\n"
-                f"Previous attempt score: {student_results.get(student_id, {}).get('correct', 0)}/{len(current_exam['questions'])}"
+                f"Previous attempt score: {exam.results.get(student_id, {}).get('correct', 0)}/{exam.index.question_count}"
             )
             
+            def retake_request_failed():
+                # Clear the pending flag so reloading the exam page asks again
+                attempts = exam.attempts.get(student_id)
+                if attempts and attempts.get("retake_pending"):
+                    attempts["retake_pending"] = False
+                    attempts["retake_failed"] = True
+                    exam.put_attempt(student_id)
+                    student_events.publish(student_id, "retake", retake_status(exam, student_id))
+            
             if telegram_app:
                 try:
-                    await telegram_app.bot.send_message(
-                        chat_id=ADMIN_CHAT_ID_INT,
-                        text=message,
+                    telegram_dispatcher.enqueue(
+                        ADMIN_CHAT_ID_INT,
+                        message,
+                        parse_mode='HTML',
                         reply_markup=reply_markup,
-                        parse_mode='HTML'
+                        on_failure=retake_request_failed
                     )
                     # Mark that there's a pending retake request
-                    student_attempts[student_id]["retake_pending"] = True
+                    exam.attempts[student_id]["retake_pending"] = True
+                    exam.attempts[student_id].pop("retake_failed", None)
+                    exam.put_attempt(student_id)
                     # Redirect to retake loading page
-                    return RedirectResponse(url=f"/retake-loading/{student_id}", status_code=303)
-                except Exception as e:
-                    logger.error(f"Failed to send retake request: {str(e)}")
+                    await share_writes()
+                    return RedirectResponse(url=retake_url, status_code=303)
+                except asyncio.QueueFull:
+                    logger.error("Failed to queue retake request: Telegram queue is full")
             
             return templates.TemplateResponse(
                 "error.html",
@@ -874,6 +3763,9 @@ async def exam_page(request: Request, student_id: Optional[str] = None):
         # Get student information
         student = approved_students[student_id]
         
+        # Start the clock of a timed exam on the first visit
+        deadline = await start_attempt(exam, student_id)
+        
         # Return the exam page
         return templates.TemplateResponse(
             "exam.html",
@@ -881,7 +3773,16 @@ async def exam_page(request: Request, student_id: Optional[str] = None):
                 "request": request,
                 "student_id": student_id,
                 "student_name": student["name"],
-                "student_surname": student["surname"]
+                "student_surname": student["surname"],
+                # The page stays on this exam even if a newer one is uploaded meanwhile
+                "exam_id": exam.exam_id,
+                # The page counts down against the server clock
+                "deadline": deadline,
+                "server_time": time.time(),
+                # Answers autosaved before the page was reloaded
+                "draft": exam.drafts.get(student_id, {}),
+                # Idempotency key: every resend of this page's form carries the same one
+                "submission_id": uuid.uuid4().hex
             }
         )
     except Exception as e:
@@ -891,13 +3792,22 @@ async def exam_page(request: Request, student_id: Optional[str] = None):
             {"request": request, "error": f"An error occurred: {str(e)}"}
         )
 
-@app.get("/retake-loading/{student_id}", response_class=HTMLResponse)
-async def retake_loading_page(request: Request, student_id: str):
+@app.get("/exam/benchmark", response_class=HTMLResponse)
+async def exam_benchmark_page(request: Request):
+    """
+    Browser benchmark of the exam page: click-to-paint latency on a synthetic
+    exam, rendered with the exam page's own script and styles.
+    """
+    return templates.TemplateResponse("exam-benchmark.html", {"request": request})
+
+@app.get("/retake-loading/{student_id}", response_class=HTMLResponse, dependencies=[Depends(fresh_state)])
+async def retake_loading_page(request: Request, student_id: str, exam_id: Optional[str] = None):
     """
     Display the loading page while waiting for retake approval.
     """
     try:
-        if student_id not in approved_students:
+        exam = exam_registry.get(exam_id)
+        if not authorized(request, student_id) or student_id not in approved_students or exam is None:
             return templates.TemplateResponse(
                 "error.html",
                 {"request": request, "error": "Invalid student ID."}
@@ -908,6 +3818,7 @@ async def retake_loading_page(request: Request, student_id: str):
             "retake-loading.html",
             {
                 "request": request,
+                "exam_id": exam.exam_id,
                 "student_id": student_id,
                 "student_name": student["name"],
                 "student_surname": student["surname"]
@@ -920,51 +3831,195 @@ async def retake_loading_page(request: Request, student_id: str):
             {"request": request, "error": f"An error occurred: {str(e)}"}
         )
 
-@app.get("/check-retake-approval/{student_id}")
-async def check_retake_approval(student_id: str):
+def retake_status(exam: Optional[Exam], student_id: str) -> Dict[str, str]:
+    """
+    Return the status of a student's retake request for an exam.
+    """
+    if exam is None or student_id not in exam.attempts:
+        return {"status": "error", "message": "Student not found"}
+    
+    student_attempt = exam.attempts[student_id]
+    
+    if student_attempt.get("retake_failed", False):
+        # The request never reached the admins
+        status = {"status": "error", "message": "Failed to send retake request. Please try again later."}
+    elif not student_attempt.get("retake_pending", False) and not student_attempt.get("completed", True):
+        # Retake was approved (retake_pending is False and completed is False)
+        status = {"status": "approved", "message": "Your retake request has been approved"}
+    elif not student_attempt.get("retake_pending", False) and student_attempt.get("completed", True):
+        # Retake was rejected (retake_pending is False but completed is still True)
+        status = {"status": "rejected", "message": "Your retake request has been rejected"}
+    else:
+        # Still pending
+        status = {"status": "pending", "message": "Waiting for admin approval"}
+    status["exam_id"] = exam.exam_id
+    return status
+
+@app.get("/check-retake-approval/{student_id}", dependencies=[Depends(fresh_state)])
+async def check_retake_approval(request: Request, student_id: str, exam_id: Optional[str] = None):
     """
     Check if a student's retake request has been approved.
     """
     try:
-        if student_id not in student_attempts:
-            return {"status": "error", "message": "Student not found"}
-        
-        student_attempt = student_attempts[student_id]
-        
-        if not student_attempt.get("retake_pending", False) and not student_attempt.get("completed", True):
-            # Retake was approved (retake_pending is False and completed is False)
-            return {"status": "approved", "message": "Your retake request has been approved"}
-        elif not student_attempt.get("retake_pending", False) and student_attempt.get("completed", True):
-            # Retake was rejected (retake_pending is False but completed is still True)
-            return {"status": "rejected", "message": "Your retake request has been rejected"}
-        else:
-            # Still pending
-            return {"status": "pending", "message": "Waiting for admin approval"}
-            
+        if not authorized(request, student_id):
+            return {"status": "error", "message": "Your session has expired. Please register again."}
+        return retake_status(exam_registry.get(exam_id), student_id)
     except Exception as e:
         logger.error(f"Error checking retake approval for student {student_id}: {str(e)}")
         return {"status": "error", "message": "An error occurred while checking your status"}
 
-@app.get("/api/exam")
-async def get_exam():
+def accepted_encodings(accept_encoding: str):
+    """Return the content-codings a client accepts, from an Accept-Encoding header."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                pass
+        if coding:
+            accepted.add(coding.lower())
+    return accepted
+
+def encoded_response(payload, request: Request, media_type: str):
+    """
+    Serve a pre-encoded payload, honouring Accept-Encoding and If-None-Match.
+    
+    `payload` holds a content digest and the body in each available encoding.
+    Every encoding gets its own strong ETag, but any of them validates.
+    """
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    encoding = next((e for e in ("br", "gzip") if e in accepted and e in payload["encodings"]), "identity")
+    etag = f'"{payload["digest"]}"' if encoding == "identity" else f'"{payload["digest"]}-{encoding}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding"
+    }
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    client_tags = {tag.strip().removeprefix("W/").strip('"').split("-")[0] for tag in if_none_match.split(",")}
+    if payload["digest"] in client_tags or "*" in client_tags:
+        return Response(status_code=304, headers=headers)
+    
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=payload["encodings"][encoding], media_type=media_type, headers=headers)
+
+def exam_page_payload(payload, offset: int, end: int):
+    """
+    Questions `offset` to `end` of a pre-encoded exam as a page payload for
+    encoded_response, with the position of the next page (None after the last).
+    
+    Pages are sent uncompressed; clients that want compression fetch the
+    whole exam, which is compressed once in advance.
+    """
+    body, bounds = payload["encodings"]["identity"], payload["bounds"]
+    total = len(bounds) - 1
+    questions = body[bounds[offset]:bounds[end] - 1] if end > offset else b""
+    tail = json.dumps({"offset": offset, "total": total, "next": end if end < total else None}, separators=(',', ':'))
+    page = b'{"questions":[' + questions + b'],' + tail[1:].encode('utf-8')
+    return {"digest": f'{payload["digest"]}.{offset}.{end}', "encodings": {"identity": page}}
+
+def iter_exam_lines(payload, offset: int, end: int):
+    """
+    Yield questions `offset` to `end` of a pre-encoded exam as NDJSON.
+    
+    The first question is sent on its own so the page can show it at once;
+    the rest follow in chunks of about EXAM_STREAM_CHUNK bytes.
+    """
+    body, bounds = payload["encodings"]["identity"], payload["bounds"]
+    view = memoryview(body)
+    lines, size = [], 0
+    for index in range(offset, end):
+        line = view[bounds[index]:bounds[index + 1] - 1]
+        lines.append(line)
+        size += len(line) + 1
+        if index == offset or size >= EXAM_STREAM_CHUNK:
+            yield b"\n".join(lines) + b"\n"
+            lines, size = [], 0
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+@app.get("/assets/{filename}")
+async def get_asset(request: Request, filename: str):
+    """
+    Serve a content-hashed asset with long-lived immutable caching.
+    
+    Precompressed variants are served to clients that accept them.
+    """
+    if filename != os.path.basename(filename) or not re.fullmatch(r"[\w-]+\.[0-9a-f]{16}\.\w+", filename):
+        raise HTTPException(status_code=404, detail="Asset not found")
+    path = os.path.join(ASSETS_DIR, filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Asset not found")
+    
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding"
+    }
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if encoding in accepted and os.path.isfile(path + suffix):
+            headers["Content-Encoding"] = encoding
+            return FileResponse(path + suffix, media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@app.get("/api/exam", dependencies=[Depends(fresh_state)])
+async def get_exam(
+    request: Request,
+    exam_id: Optional[str] = None,
+    offset: Optional[int] = Query(None, ge=0, description="First question of a page"),
+    limit: Optional[int] = Query(None, ge=1, description=f"Questions per page, at most {EXAM_PAGE_LIMIT}"),
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
     """
-    Get the current exam questions.
+    Get the questions of an exam, the latest one unless `exam_id` names another.
+    
+    The response body is serialized and compressed once when the exam is
+    loaded; clients revalidate it with If-None-Match. With `offset` or
+    `limit` a page of questions is returned along with the total and the
+    offset of the next page. `format=ndjson` streams the questions one per
+    line instead, from `offset` and up to `limit` questions if given.
     
     Returns:
-        Dict: The current exam questions or an error message
+        Response: The exam questions or an error message
     """
     try:
-        if not current_exam:
-            # Try to load an existing PDF
-            await load_existing_pdf()
-            
-            if not current_exam:
-                return JSONResponse(
-                    status_code=404,
-                    content={"error": "No exam is currently available. Please check back later."}
-                )
+        exam = await load_exam(exam_id)
+        if exam is None:
+            return JSONResponse(
+                status_code=404,
+                content={"error": "No exam is currently available. Please check back later."}
+            )
+        
+        payload = exam.payload
+        total = len(payload["bounds"]) - 1
+        start = min(offset or 0, total)
+        if response_format == "ndjson":
+            end = min(start + limit, total) if limit else total
+            headers = {
+                "ETag": f'"{payload["digest"]}.{start}.{end}.ndjson"',
+                "Cache-Control": "no-cache",
+                "X-Total-Count": str(total)
+            }
+            client_tags = {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}
+            if headers["ETag"] in client_tags:
+                return Response(status_code=304, headers=headers)
+            return StreamingResponse(
+                iter_exam_lines(payload, start, end),
+                media_type="application/x-ndjson",
+                headers=headers
+            )
+        if offset is not None or limit is not None:
+            end = min(start + min(limit or EXAM_PAGE_LIMIT, EXAM_PAGE_LIMIT), total)
+            return encoded_response(exam_page_payload(payload, start, end), request, "application/json")
         
-        return current_exam
+        return encoded_response(payload, request, "application/json")
     except Exception as e:
         logger.error(f"Error in get_exam: {str(e)}")
         return JSONResponse(
@@ -972,26 +4027,216 @@ async def get_exam():
             content={"error": f"An error occurred while retrieving the exam: {str(e)}"}
         )
 
-async def send_telegram_message(message: str):
-    """Send a message to the admin chat via Telegram."""
+@app.get("/api/exam/deadline", dependencies=[Depends(fresh_state)])
+async def get_exam_deadline(request: Request, student_id: str, exam_id: Optional[str] = None):
+    """
+    The deadline of a student's timed attempt, in epoch seconds (None if the
+    exam is not timed), with the server's clock to count down against.
+    """
+    if not authorized(request, student_id):
+        raise HTTPException(
+            status_code=403,
+            detail="Your session has expired or belongs to another student. Please register again."
+        )
+    exam = exam_registry.get(exam_id)
+    if exam is None:
+        raise HTTPException(status_code=404, detail="Exam not found.")
+    attempt = exam.attempts.get(student_id, {})
+    return {
+        "exam_id": exam.exam_id,
+        "deadline": attempt.get("deadline"),
+        "completed": attempt.get("completed", False),
+        "server_time": time.time()
+    }
+
+@app.post("/api/exam/draft", status_code=204, dependencies=[Depends(fresh_state)])
+async def save_draft(request: Request, delta: DraftDelta, student_id: str, exam_id: Optional[str] = None):
+    """
+    Autosave the answers of an attempt in progress.
+    
+    The body holds only the questions changed since the last save. They are
+    merged into the student's draft, which the exam page restores when it is
+    reopened and which is submitted if a timed attempt runs out; drafts are
+    written to storage in batches (see DraftBuffer).
+    """
+    if not authorized(request, student_id):
+        raise HTTPException(
+            status_code=403,
+            detail="Your session has expired or belongs to another student. Please register again."
+        )
+    if student_id not in approved_students:
+        raise HTTPException(
+            status_code=403,
+            detail="Your Student ID is not approved for this exam. Please contact your administrator."
+        )
+    
+    exam = await load_exam(exam_id)
+    index = exam.index if exam else None
+    if index is None:
+        raise HTTPException(status_code=404, detail="No exam is currently available.")
+    for question_id, option_id in delta.answers.items():
+        position = index.positions.get(question_id)
+        if position is None or (option_id is not None and option_id not in index.option_ids[position]):
+            raise HTTPException(status_code=400, detail="Invalid answer format. Please try again.")
+    
+    # No await from here on, so the checks and the update cannot interleave with a submission
+    if exam.attempts.get(student_id, {}).get("completed", False):
+        raise HTTPException(status_code=409, detail="This exam has already been submitted.")
+    if deadline_passed(exam, student_id):
+        raise HTTPException(status_code=409, detail="The time for this exam is up.")
+    draft_buffer.update(exam, student_id, delta.answers)
+    return Response(status_code=204)
+
+def send_telegram_message(message: str):
+    """Queue a message to the admin chat via Telegram."""
     try:
-        await telegram_app.bot.send_message(
-            chat_id=ADMIN_CHAT_ID_INT,
-            text=message,
-            parse_mode='HTML'
+        telegram_dispatcher.enqueue(ADMIN_CHAT_ID_INT, message, parse_mode='HTML')
+    except asyncio.QueueFull:
+        # The result is already stored; losing the notification must not fail the request
+        logger.error("Telegram queue is full, dropping admin notification")
+
+def require_admin_key(authorization: Optional[str] = Header(None)):
+    """Accept requests carrying `Authorization: Bearer <SECRET_KEY>`."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), SECRET_KEY.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="Admin key required.",
+            headers={"WWW-Authenticate": "Bearer"}
         )
-        logger.info("Telegram message sent successfully")
-    except Exception as e:
-        logger.error(f"Failed to send Telegram message: {str(e)}")
-        raise
 
-@app.post("/submit-exam")
+@app.get("/api/stats", dependencies=[Depends(require_admin_key)])
+async def get_stats(exam_id: Optional[str] = None):
+    """Per-question difficulty, option popularity and score distribution of an exam."""
+    exam = await load_exam(exam_id)
+    if exam is None:
+        raise HTTPException(status_code=404, detail="Exam not found.")
+    return exam_statistics(exam)
+
+async def iter_results_export(collection: str, since: Optional[int], until: int, export_format: str):
+    """
+    Yield the results export of a collection: the results written or deleted
+    after the `since` cursor, up to `until`, or every stored result if `since`
+    is None. Rows are read from storage RESULT_EXPORT_CHUNK at a time as the
+    export is consumed and student details are joined row by row. A deleted
+    result is a JSON Lines record `{"student_id": ..., "deleted": true}`, or a
+    CSV row with action "delete".
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(RESULT_EXPORT_FIELDS + ["action"])
+    position = -1 if since is None else since
+    while True:
+        rows = await asyncio.to_thread(storage.changed_since, collection, position, until, RESULT_EXPORT_CHUNK)
+        for position, student_id, result in rows:
+            if result is None and since is None:
+                continue
+            if export_format == "csv":
+                if result is None:
+                    writer.writerow([student_id] + [""] * (len(RESULT_EXPORT_FIELDS) - 1) + ["delete"])
+                else:
+                    writer.writerow(result_export_row(student_id, result) + ["upsert"])
+            else:
+                if result is None:
+                    record = {"student_id": student_id, "deleted": True}
+                else:
+                    record = result_export_record(student_id, result)
+                buffer.write(json.dumps(record, ensure_ascii=False))
+                buffer.write("\n")
+        if buffer.tell():
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if len(rows) < RESULT_EXPORT_CHUNK:
+            return
+
+@app.get("/api/results/export", dependencies=[Depends(require_admin_key)])
+async def export_results(
+    export_format: str = Query("csv", alias="format", pattern="^(csv|jsonl)$"),
+    since: Optional[int] = Query(None, ge=0, description="Only results changed after this export cursor"),
+    exam_id: Optional[str] = Query(None, description="Exam to export; the latest one if omitted")
+):
+    """
+    Stream the stored results of an exam as CSV or JSON Lines, oldest change first.
+    
+    For incremental pulls, pass the X-Export-Cursor header of the previous
+    response back as `since`: only results submitted, regraded or deleted
+    (by a retake or /deletelist) after it are sent. The cursor is the storage
+    sequence number of the last change sent, not a time, so results committed
+    late with an older timestamp, from another worker or across a clock step,
+    are still sent next time. A full export leaves deleted results out.
+    
+    The cursor is taken before the export is read and the export stops at
+    it; anything committed while it streams comes with the next pull.
+    """
+    exam = exam_registry.get(exam_id)
+    if exam is None:
+        raise HTTPException(status_code=404, detail="Exam not found.")
+    # Read what is committed, including this worker's queued writes; later
+    # writes take higher sequence numbers and come with the next pull
+    await storage.sync()
+    until = await asyncio.to_thread(storage.last_seq)
+    
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        iter_results_export(exam.collection("student_results"), since, until, export_format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="student-results-{exam.exam_id}.{export_format}"',
+            "X-Export-Cursor": str(max(until, since or 0)),
+            "Cache-Control": "no-store"
+        }
+    )
+
+@app.get("/api/submissions/{receipt}", dependencies=[Depends(fresh_state)])
+async def submission_status(receipt: str):
+    """Status of a queued submission, with the score once it is graded."""
+    status = submission_queue.status(receipt)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown submission receipt.")
+    return status
+
+@app.get("/metrics", dependencies=[Depends(require_admin_key)])
+async def get_metrics():
+    """Operational counters for the background workers."""
+    return {
+        "telegram": telegram_dispatcher.metrics(),
+        "grading": submission_queue.metrics(),
+        "deadlines": deadline_scheduler.metrics(),
+        "drafts": draft_buffer.metrics(),
+        "rate_limit": rate_limiter.metrics(),
+        "sessions": session_tokens.metrics(),
+        "exams": exam_registry.metrics(),
+        "event_streams": student_events.subscriber_count(),
+        "workers": {
+            "workers": WORKERS,
+            "worker": storage.origin,
+            "leader": is_leader(),
+            "change_feed": change_feed.metrics()
+        }
+    }
+
+@app.post("/submit-exam", dependencies=[Depends(fresh_state)])
 async def submit_exam(
+    request: Request,
     student_id: str = Form(...),
-    answers: str = Form(...)
+    answers: str = Form(...),
+    submission_id: Optional[str] = Form(None),
+    exam_id: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
     Submit exam answers for a student.
+    
+    Submissions are idempotent: a resend with the same submission_id form
+    field (or Idempotency-Key header), or any further submission once the
+    attempt is completed, gets the stored result back without regrading or
+    notifying the admins again.
+    
+    With ASYNC_GRADING the submission is queued durably instead of graded:
+    API clients get 202 with a receipt to poll at /api/submissions/{receipt},
+    browsers are redirected to the results page, which waits for the grade.
     """
     try:
         # Validate required fields
@@ -1001,17 +4246,24 @@ async def submit_exam(
                 detail="Student ID and answers are required."
             )
         
+        if not authorized(request, student_id):
+            raise HTTPException(
+                status_code=403,
+                detail="Your session has expired or belongs to another student. Please register again."
+            )
         if student_id not in approved_students:
             raise HTTPException(
                 status_code=403,
                 detail="Your Student ID is not approved for this exam. Please contact your administrator."
             )
         
-        # Mark the exam as completed for this student
-        if student_id not in student_attempts:
-            student_attempts[student_id] = {}
-        student_attempts[student_id]["completed"] = True
-        student_attempts[student_id]["retake_pending"] = False
+        exam = await load_exam(exam_id)
+        index = exam.index if exam else None
+        if index is None:
+            raise HTTPException(
+                status_code=400,
+                detail="No exam is currently available."
+            )
         
         # Parse the JSON answers
         try:
@@ -1021,81 +4273,35 @@ async def submit_exam(
                 status_code=400,
                 detail="Invalid answer format. Please try again."
             )
+        if not isinstance(answers_data, dict):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid answer format. Please try again."
+            )
         
-        # Get student information
-        student = approved_students[student_id]
-        
-        # Check answers if correct_answers are available
-        correct_count = 0
-        incorrect_count = 0
-        student_answers = []
-        
-        if correct_answers and current_exam and current_exam.get("questions"):
-            for i, question in enumerate(current_exam["questions"]):
-                question_id = str(question["id"])
-                student_answer = answers_data.get(question_id, "")
-                student_answers.append(student_answer)  # Store the actual answer
-                
-                # Check if the answer is correct
-                is_correct = False
-                if i < len(correct_answers):
-                    is_correct = student_answer == correct_answers[i]
-                    if is_correct:
-                        correct_count += 1
-                    else:
-                        incorrect_count += 1
-        
-        # Store the results including the actual answers
-        global student_results
-        student_results[student_id] = {
-            "correct": correct_count,
-            "incorrect": incorrect_count,
-            "total": len(current_exam["questions"]),
-            "answers": student_answers,  # Store the actual answers
-            "timestamp": datetime.datetime.now().isoformat()
-        }
-        
-        # Format answers for Telegram message
-        formatted_answers = "📝 <b>Exam Submission Received</b>\n\n"
-        formatted_answers += f"👤 <b>Student Information:</b>\n"
-        formatted_answers += f"Name: {student['name']}\n"
-        formatted_answers += f"Surname: {student['surname']}\n"
-        formatted_answers += f"Student ID: {student_id}\n\n"
-        
-        # Add score information if available
-        if correct_answers:
-            formatted_answers += f"📊 <b>Score:</b> {correct_count}/{len(current_exam['questions'])} ({correct_count/len(current_exam['questions'])*100:.1f}%)\n\n"
-        
-        formatted_answers += "📋 <b>Answers:</b>\n"
-        
-        # Add each question and answer to the formatted message
-        for i, question in enumerate(current_exam["questions"]):
-            question_id = str(question["id"])
-            student_answer = answers_data.get(question_id, "")
-            
-            # Find the answer text
-            answer_text = "Not answered"
-            for opt in question["options"]:
-                if opt["id"] == student_answer:
-                    answer_text = f"{opt['id'].upper()}. {opt['text']}"
-                    break
-            
-            # Check if the answer is correct
-            is_correct = False
-            if i < len(correct_answers):
-                is_correct = student_answer == correct_answers[i]
-            
-            formatted_answers += f"\n<b>Q{question_id}:</b> {question['text']}\n"
-            formatted_answers += f"<b>A:</b> {answer_text} {'✅' if is_correct else '❌'}\n"
-        
-        # Send notification to admin
-        await send_telegram_message(formatted_answers)
-        
-        # Return success with redirect to results page
-        return RedirectResponse(
-            url=f"/results/{student_id}?correct={correct_count}&incorrect={incorrect_count}",
-            status_code=303
-        )
+        submission_key = idempotency_key or submission_id
+        async with student_locks.hold(student_id):
+            duplicate = duplicate_submission_response(request, exam, student_id, submission_key)
+            if duplicate:
+                return duplicate
+            if deadline_passed(exam, student_id):
+                # Too late: what was saved before the deadline counts, not these answers
+                logger.warning(f"Late submission from student {student_id} in exam {exam.exam_id}, grading the draft")
+                answers_data = exam.drafts.get(student_id, {})
+            try:
+                result, receipt = await record_submission(exam, student_id, answers_data, submission_key, index)
+            except Exception as e:
+                # Nothing was committed, so a resend is graded as a new submission
+                logger.error(f"Failed to commit the submission of {student_id}: {str(e)}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Your submission could not be saved yet. Please submit again."
+                )
+            if result is None and receipt is None:
+                return await submitted_elsewhere_response(request, exam, student_id, submission_key)
+            if receipt is None:
+                return results_redirect(exam, student_id, result)
+            return receipt_response(request, exam, student_id, receipt)
     except HTTPException:
         raise
     except Exception as e:
@@ -1105,23 +4311,298 @@ async def submit_exam(
             detail=f"An error occurred while submitting your exam: {str(e)}"
         )
 
+def results_redirect(exam: Exam, student_id: str, result: Dict[str, Any]) -> RedirectResponse:
+    return RedirectResponse(
+        url=exam_url(
+            f"/results/{student_id}?correct={result['correct']}&incorrect={result['incorrect']}", exam.exam_id
+        ),
+        status_code=303
+    )
+
+def wants_html(request: Request) -> bool:
+    return "text/html" in request.headers.get("accept", "")
+
+def receipt_response(request: Request, exam: Exam, student_id: str, receipt: str):
+    """202 with the receipt for API clients; browsers go to the results page to wait."""
+    if wants_html(request):
+        return RedirectResponse(url=exam_url(f"/results/{student_id}", exam.exam_id), status_code=303)
+    return JSONResponse(
+        status_code=202,
+        content={
+            "receipt": receipt,
+            "exam_id": exam.exam_id,
+            "status": "queued",
+            "status_url": f"/api/submissions/{receipt}"
+        }
+    )
+
+def duplicate_submission_response(request: Request, exam: Exam, student_id: str, submission_key: Optional[str]):
+    """
+    Return the response for a resend or a second submission of a completed
+    attempt, or None for a new submission. Runs under
+    student_locks.hold(student_id), which settles races between requests on
+    this worker; record_submission's claim in storage settles those with
+    other workers.
+    """
+    attempt = exam.attempts.get(student_id, {})
+    is_retry = submission_key is not None and submission_key == attempt.get("submission_id")
+    if not is_retry and not attempt.get("completed", False):
+        return None
+    
+    logger.info(f"Duplicate submission from student {student_id}, returning stored result")
+    if submission_queue.is_pending(attempt.get("receipt")):
+        return receipt_response(request, exam, student_id, attempt["receipt"])
+    result = exam.results.get(student_id)
+    if result is None:
+        raise HTTPException(
+            status_code=409,
+            detail="This exam has already been submitted."
+        )
+    return results_redirect(exam, student_id, result)
+
+async def record_submission(exam: Exam, student_id: str, answers_data: Dict[str, Any],
+                            submission_key: Optional[str], index: ExamIndex):
+    """
+    Grade a submission, or with ASYNC_GRADING queue it, and return (result,
+    None) or (None, receipt). Both the submit form and the deadline
+    auto-submission go through here, under student_locks.hold(student_id).
+    
+    The completed attempt is committed together with the result or the queue
+    entry, and only if the stored attempt is not completed already: of two
+    workers submitting the same attempt, one grades it and notifies the
+    admins, the other gets (None, None) and nothing is changed.
+    """
+    attempt = submitted_attempt(exam, student_id, submission_key)
+    if not ASYNC_GRADING:
+        result, report = grade_answers(exam, student_id, answers_data, index)
+        writes = [(exam.collection("student_results"), student_id, result)]
+    else:
+        # Accept now, grade in the background
+        attempt["receipt"] = uuid.uuid4().hex
+        entry = submission_queue.entry(attempt["receipt"], exam.exam_id, student_id, answers_data, submission_key)
+        writes = [("submission_queue", attempt["receipt"], entry)]
+    
+    attempts = exam.collection("student_attempts")
+    taken = await storage.claim(
+        attempts, student_id, lambda stored: stored.get("completed", False),
+        [(attempts, student_id, attempt)] + writes
+    )
+    if taken is not None:
+        logger.info(f"Attempt of student {student_id} at exam {exam.exam_id} was already submitted on another worker")
+        return None, None
+    
+    exam.apply_attempt(student_id, attempt)
+    exam.drop_draft(student_id)
+    if not ASYNC_GRADING:
+        exam.apply_result(student_id, result)
+        send_telegram_message(report)
+        return result, None
+    submission_queue.add(entry)
+    return None, attempt["receipt"]
+
+async def submitted_elsewhere_response(request: Request, exam: Exam, student_id: str, submission_key: Optional[str]):
+    """
+    Answer a submission whose attempt another worker completed first: take
+    over what that worker committed and reply as to a resend.
+    """
+    await change_feed.catch_up()
+    response = duplicate_submission_response(request, exam, student_id, submission_key)
+    if response is None:
+        raise HTTPException(
+            status_code=409,
+            detail="This exam has already been submitted."
+        )
+    return response
+
+def submitted_attempt(exam: Exam, student_id: str, submission_key: Optional[str],
+                      receipt: Optional[str] = None) -> Dict[str, Any]:
+    """A copy of the student's attempt, completed by the submission with this key."""
+    attempt = dict(exam.attempts.get(student_id, {}))
+    attempt.pop("failed_receipt", None)
+    attempt["completed"] = True
+    attempt["retake_pending"] = False
+    attempt["submission_id"] = submission_key
+    if receipt:
+        attempt["receipt"] = receipt
+    return attempt
+
+def mark_submitted(exam: Exam, student_id: str, submission_key: Optional[str], receipt: Optional[str] = None):
+    """Mark the student's attempt at an exam as completed by the submission with this key."""
+    exam.attempts[student_id] = submitted_attempt(exam, student_id, submission_key, receipt)
+    exam.put_attempt(student_id)
+    exam.drop_draft(student_id)
+
+async def start_attempt(exam: Exam, student_id: str) -> Optional[float]:
+    """
+    Start the clock of a timed exam when the student first opens it. Returns
+    the attempt's deadline in epoch seconds, or None if it is not timed.
+    """
+    attempt = exam.attempts.get(student_id, {})
+    if attempt.get("deadline") or not exam.time_limit:
+        return attempt.get("deadline")
+    async with student_locks.hold(student_id):
+        attempt = exam.attempts.setdefault(student_id, {})
+        if not attempt.get("deadline"):
+            attempt["started_at"] = datetime.datetime.now().isoformat()
+            attempt["deadline"] = round(time.time() + exam.time_limit, 3)
+            attempt["completed"] = False
+            exam.put_attempt(student_id)
+            await share_writes()
+        return attempt["deadline"]
+
+def deadline_passed(exam: Exam, student_id: str) -> bool:
+    """Whether the student's timed attempt is past its deadline and grace period."""
+    deadline = exam.attempts.get(student_id, {}).get("deadline")
+    return bool(deadline) and time.time() > deadline + DEADLINE_GRACE
+
+def track_deadline(exam: Exam, student_id: str):
+    """Schedule the auto-submission of an open timed attempt, or drop it once submitted."""
+    attempt = exam.attempts.get(student_id)
+    if attempt and attempt.get("deadline") and not attempt.get("completed", False):
+        deadline_scheduler.schedule(exam.exam_id, student_id, attempt["deadline"] + DEADLINE_GRACE)
+    else:
+        deadline_scheduler.cancel(exam.exam_id, student_id)
+
+async def submit_on_deadline(exam_id: str, student_id: str) -> bool:
+    """
+    Submit a timed-out attempt with the student's latest draft, as if the
+    student had sent it. Returns False if the exam cannot be loaded right now.
+    
+    Only the leader runs this, under its own student lock; a late submit of
+    the same attempt on another worker is settled by record_submission's
+    claim in storage, so the attempt is graded once either way.
+    """
+    exam = exam_registry.exams.get(exam_id)
+    if exam is None:
+        return True  # Deleted meanwhile
+    try:
+        await exam_registry.load(exam)
+    except Exception as e:
+        logger.error(f"Cannot load exam {exam_id} to submit timed-out attempts: {str(e)}")
+        return False
+    async with student_locks.hold(student_id):
+        attempt = exam.attempts.get(student_id, {})
+        if attempt.get("completed", False) or not attempt.get("deadline") or exam.index is None:
+            return True
+        if not deadline_passed(exam, student_id):
+            # Extended while it waited
+            track_deadline(exam, student_id)
+            return True
+        if student_id not in approved_students:
+            return True
+        logger.info(f"Time is up for student {student_id} in exam {exam_id}, submitting their draft")
+        await record_submission(exam, student_id, exam.drafts.get(student_id, {}), None, exam.index)
+    return True
+
+def grade_submission(exam: Exam, student_id: str, answers_data: Dict[str, Any], submission_key: Optional[str],
+                     index: ExamIndex, receipt: Optional[str] = None) -> Dict[str, Any]:
+    """Grade, store and report a queued submission; returns the stored result."""
+    result, report = grade_answers(exam, student_id, answers_data, index)
+    mark_submitted(exam, student_id, submission_key, receipt)
+    exam.put_result(student_id, result)
+    
+    # Queue notification to admin
+    send_telegram_message(report)
+    
+    return result
+
+def grade_answers(exam: Exam, student_id: str, answers_data: Dict[str, Any], index: ExamIndex):
+    """Grade a submission without storing anything; returns the result and the admin report."""
+    # Grade the answers against the key in one pass
+    student = approved_students[student_id]
+    student_answers = [answers_data.get(question_id, "") for question_id in index.question_ids]
+    row = index.pack_answers(student_answers)
+    marks = index.mark(row)
+    correct_count, incorrect_count = index.score(marks)
+    
+    # The result, including the actual answers
+    submitted_at = datetime.datetime.now().isoformat()
+    result = {
+        "correct": correct_count,
+        "incorrect": incorrect_count,
+        "total": index.question_count,
+        "answers": student_answers,  # Store the actual answers
+        "timestamp": submitted_at,
+        "updated_at": submitted_at  # Changed again when the result is regraded
+    }
+    
+    # Format answers for Telegram message
+    formatted_answers = "📝 <b>Exam Submission Received</b>\n\n"
+    formatted_answers += f"📚 <b>Exam:</b> {exam.exam_id}\n\n"
+    formatted_answers += f"👤 <b>Student Information:</b>\n"
+    formatted_answers += f"Name: {student['name']}\n"
+    formatted_answers += f"Surname: {student['surname']}\n"
+    formatted_answers += f"Student ID: {student_id}\n\n"
+    
+    # Add score information if available
+    if index.key:
+        formatted_answers += f"📊 <b>Score:</b> {correct_count}/{index.question_count} ({correct_count/index.question_count*100:.1f}%)\n\n"
+    
+    formatted_answers += "📋 <b>Answers:</b>\n"
+    
+    # Add each question and answer to the formatted message
+    formatted_answers += "".join(
+        f"{index.report_lines[i]}<b>A:</b> {index.answer_label(i, answer)} {'✅' if is_correct else '❌'}\n"
+        for i, (answer, is_correct) in enumerate(zip(row, marks))
+    )
+    
+    return result, formatted_answers
+
 # Startup event to initialize the Telegram bot
 @app.on_event("startup")
 async def startup_event():
-    # Start the Telegram bot in the background
+    # Restore persisted state
+    storage.open()
+    if MULTI_WORKER:
+        # Log this worker's changes for the others, and take the change log
+        # position before loading so nothing committed meanwhile is missed
+        storage.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        change_feed.begin()
+        student_events.relay = lambda student_id, event, data: storage.send(
+            EVENTS_COLLECTION, student_id, [event, data]
+        )
+    load_persisted_state()
+    
+    # Publish hashed static assets
+    load_asset_manifest()
+    publish_static_assets()
+    
+    # Register the exam of an install that predates exam ids
+    if not exam_registry.exams:
+        await register_existing_exam()
+    
+    # Start the write-behind flusher
+    submission_queue.restore()
+    storage.start()
+    
+    # Follow the other workers and find out whether this one leads
+    if MULTI_WORKER:
+        change_feed.start()
+        await leader_lease.renew()
+        leader_lease.start()
+    
+    # Start the Telegram bot and the outbound message dispatcher in the background
     asyncio.create_task(init_telegram_bot())
+    telegram_dispatcher.start()
     
-    # Load any existing PDF from the uploads folder
-    await load_existing_pdf()
+    # Parse the latest exam now rather than on its first request
+    await load_exam()
     
-    # Load any existing answers
-    await load_existing_answers()
+    # Grade queued submissions, including any left over from the last run
+    submission_queue.start()
+    
+    # Submit timed attempts as their deadlines pass; those that passed while
+    # the server was down are submitted right away
+    deadline_scheduler.start()
+    draft_buffer.start()
     
     logger.info("Application startup complete")
 
-async def load_existing_pdf():
+async def register_existing_exam():
     """
-    Load any existing PDF from the uploads folder on startup.
+    Register the PDF, answers and results of an install that predates exam
+    ids as the default exam, which keeps their storage collections and asset
+    names.
     """
     try:
         # Check if the uploads directory exists
@@ -1140,71 +4621,146 @@ async def load_existing_pdf():
         pdf_file = pdf_files[-1]  # Get the last file (most recent)
         pdf_path = os.path.join("uploads", pdf_file)
         
-        logger.info(f"Loading existing PDF: {pdf_path}")
-        
-        # Extract text from the PDF
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page_num, page in enumerate(doc):
-            page_text = page.get_text()
-            text += page_text
-            logger.info(f"Extracted text from page {page_num+1}, length: {len(page_text)}")
-        
-        logger.info(f"Total extracted text length: {len(text)}")
-        
-        # Extract questions from the text
-        global current_exam
-        questions = extract_questions_from_text(text)
-        current_exam = {
-            "raw_text": text,
-            "questions": questions
-        }
-        
-        # Save the questions to a JSON file for the frontend
-        questions_file = os.path.join("static", "js", "exam-questions.js")
-        with open(questions_file, 'w', encoding='utf-8') as f:
-            f.write(f"const examQuestions = {json.dumps(questions, ensure_ascii=False, indent=2)};")
-        
-        logger.info(f"Saved {len(questions)} questions to {questions_file}")
-        logger.info(f"Loaded PDF: {pdf_file}, found {len(questions)} questions")
+        exam = Exam(
+            DEFAULT_EXAM_ID,
+            title=pdf_file,
+            pdf_path=pdf_path,
+            digest=await asyncio.to_thread(hash_file, pdf_path),
+            answers=load_existing_answers()
+        )
+        exam.restore()
+        exam_registry.add(exam)
+        logger.info(f"Registered existing PDF {pdf_file} as exam {exam.exam_id} with {len(exam.results)} results")
         
     except Exception as e:
-        logger.error(f"Error loading existing PDF: {str(e)}")
+        logger.error(f"Error registering existing PDF: {str(e)}")
+
+def load_persisted_state():
+    """
+    Populate the in-memory dicts from the SQLite storage.
+    """
+    pending_students.update(storage.load("pending_students"))
+    approved_students.update(storage.load("approved_students"))
+    rejected_students.update(storage.load("rejected_students"))
+    verified_admins.update(int(user_id) for user_id in storage.load("verified_admins"))
+    exam_registry.restore()
+    logger.info(
+        f"Restored state: {len(pending_students)} pending, {len(approved_students)} approved, "
+        f"{len(exam_registry.exams)} exams"
+    )
+
+def reload_shared_state():
+    """
+    Reload all in-memory state from storage, for a worker that fell so far
+    behind that the change log no longer covers what it missed.
+    """
+    for container in (pending_students, approved_students, rejected_students, verified_admins, asset_manifest,
+                      deadline_scheduler):
+        container.clear()
+    load_persisted_state()
+    draft_buffer.reapply()
+    asset_manifest.update(storage.load("assets"))
+    submission_queue.restore()
+
+def apply_shared_change(collection: str, key: Optional[str], value):
+    """
+    Apply an entry of another worker's change log: a put, a delete (value
+    None) or a clear (key None) of a storage collection, or a student event.
+    """
+    if collection == EVENTS_COLLECTION:
+        event, data = value
+        student_events.deliver(key, event, data)
+    elif collection == "exams":
+        exam_registry.apply(key, value)
+    elif collection == "submission_queue":
+        submission_queue.apply(key, value)
+    elif collection in ("pending_students", "approved_students", "assets"):
+        mapping = {"pending_students": pending_students, "approved_students": approved_students,
+                   "assets": asset_manifest}[collection]
+        if key is None:
+            mapping.clear()
+        elif value is None:
+            mapping.pop(key, None)
+        else:
+            mapping[key] = value
+    elif collection in ("rejected_students", "verified_admins"):
+        members = rejected_students if collection == "rejected_students" else verified_admins
+        member = int(key) if collection == "verified_admins" and key is not None else key
+        if key is None:
+            members.clear()
+        elif value is None:
+            members.discard(member)
+        else:
+            members.add(member)
+    else:
+        # Per-exam collections: "student_results" of the default exam, "student_results:<id>" of others
+        name, _, exam_id = collection.partition(":")
+        exam = exam_registry.exams.get(exam_id or DEFAULT_EXAM_ID)
+        if exam is None:
+            return  # Deleted meanwhile
+        if name == "student_results":
+            exam.apply_result(key, value)
+        elif name == "student_attempts":
+            exam.apply_attempt(key, value)
+        elif name == "exam_drafts":
+            draft_buffer.apply(exam, key, value)
 
 # Add a function to load correct answers on startup
-async def load_existing_answers():
+def load_existing_answers() -> List[str]:
     """
-    Load any existing answers from the answers file on startup.
+    Load the answers of an install that predates exam ids from its answers file.
     """
     try:
-        answers_file = os.path.join("static", "js", "exam-answers.js")
+        # Fall back to the fixed-name file written by older versions
+        answers_file = asset_path("exam-answers.js") or os.path.join("static", "js", "exam-answers.js")
         if os.path.exists(answers_file):
             with open(answers_file, 'r', encoding='utf-8') as f:
                 content = f.read()
                 # Extract the answers array from the JavaScript file
-                import re
                 match = re.search(r'const examAnswers = (\[.*?\]);', content, re.DOTALL)
                 if match:
-                    answers_str = match.group(1)
-                    global correct_answers
-                    correct_answers = json.loads(answers_str)
-                    logger.info(f"Loaded {len(correct_answers)} answers from {answers_file}")
+                    answers = json.loads(match.group(1))
+                    logger.info(f"Loaded {len(answers)} answers from {answers_file}")
+                    return answers
     except Exception as e:
         logger.error(f"Error loading existing answers: {str(e)}")
+    return []
 
 # Shutdown event to stop the Telegram bot
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Ungraded submissions stay in storage and are graded on the next start
+    await submission_queue.close()
+    await deadline_scheduler.close()
+    # Write the autosaved answers still buffered
+    await draft_buffer.close()
+    
+    # Hand leadership over at once rather than when the lease expires
+    await leader_lease.close()
+    await change_feed.close()
+    
+    # Let queued notifications go out while the bot is still running
+    await telegram_dispatcher.close()
+    
     if telegram_app:
+        if telegram_app.updater.running:
+            await telegram_app.updater.stop()
         await telegram_app.stop()
         await telegram_app.shutdown()
         logger.info("Telegram bot stopped")
+    
+    # Commit any writes still queued
+    await storage.close()
+    
+    if pdf_executor:
+        pdf_executor.shutdown(cancel_futures=True)
 
 # Add a route for the results page
-@app.get("/results/{student_id}")
+@app.get("/results/{student_id}", dependencies=[Depends(fresh_state)])
 async def results_page(
     request: Request,
     student_id: str,
+    exam_id: Optional[str] = None,
     correct: int = Query(0),
     incorrect: int = Query(0)
 ):
@@ -1213,6 +4769,11 @@ async def results_page(
     """
     try:
         # Check if the student is approved
+        if not authorized(request, student_id):
+            return templates.TemplateResponse(
+                "error.html",
+                {"request": request, "error": "Your session has expired or belongs to another student. Please register again."}
+            )
         if student_id not in approved_students:
             return templates.TemplateResponse(
                 "error.html",
@@ -1223,50 +4784,48 @@ async def results_page(
         student = approved_students[student_id]
         
         # Check if there's an exam available
-        if not current_exam or not current_exam.get("questions"):
+        exam = await load_exam(exam_id)
+        index = exam.index if exam else None
+        if index is None or not index.question_count:
             return templates.TemplateResponse(
                 "error.html",
                 {"request": request, "error": "No exam is currently available."}
             )
         
-        # Get the questions and answers
-        questions = current_exam["questions"]
-        total_questions = len(questions)
+        total_questions = index.question_count
+        
+        # A queued submission is still being graded, or could not be; the
+        # grading page waits for it or says so
+        attempt = exam.attempts.get(student_id, {})
+        receipt = attempt.get("receipt") or attempt.get("failed_receipt")
+        if student_id not in exam.results and (submission_queue.is_pending(receipt) or "failed_receipt" in attempt):
+            return templates.TemplateResponse(
+                "grading.html",
+                {
+                    "request": request,
+                    "exam_id": exam.exam_id,
+                    "student_id": student_id,
+                    "student_name": student["name"],
+                    "student_surname": student["surname"],
+                    "receipt": receipt
+                }
+            )
         
         # Get student's results from stored data
-        student_result = student_results.get(student_id, {})
-        student_answers = student_result.get("answers", [])
+        student_result = exam.results.get(student_id, {})
+        row = index.pack_answers(student_result.get("answers", []))
+        marks = index.mark(row)
         
         # Prepare question details for display
-        question_details = []
-        for i, question in enumerate(questions):
-            question_id = str(question["id"])
-            
-            # Get the student's actual answer and answer text
-            student_answer = "Not answered"
-            correct_answer = "Unknown"
-            is_correct = False
-            
-            # Get student's actual answer for this question
-            if i < len(student_answers):
-                answer_id = student_answers[i]
-                # Find the answer text for both student's answer and correct answer
-                for opt in question["options"]:
-                    # For student's answer
-                    if opt["id"] == answer_id:
-                        student_answer = f"{opt['id'].upper()}. {opt['text']}"
-                    # For correct answer
-                    if i < len(correct_answers) and opt["id"] == correct_answers[i]:
-                        correct_answer = f"{opt['id'].upper()}. {opt['text']}"
-                        if answer_id == correct_answers[i]:
-                            is_correct = True
-            
-            question_details.append({
-                "text": question["text"],
-                "student_answer": student_answer,
-                "correct_answer": correct_answer,
+        question_details = [
+            {
+                "text": index.question_texts[i],
+                "student_answer": index.answer_label(i, answer),
+                "correct_answer": index.key_labels[i],
                 "is_correct": is_correct
-            })
+            }
+            for i, (answer, is_correct) in enumerate(zip(row, marks))
+        ]
         
         # Return the results page
         return templates.TemplateResponse(
@@ -1276,8 +4835,9 @@ async def results_page(
                 "student_id": student_id,
                 "student_name": student["name"],
                 "student_surname": student["surname"],
-                "correct_answers": correct,
-                "incorrect_answers": incorrect,
+                # Stored scores reflect regrading; the query values are a fallback
+                "correct_answers": student_result.get("correct", correct),
+                "incorrect_answers": student_result.get("incorrect", incorrect),
                 "total_questions": total_questions,
                 "questions": question_details
             }
@@ -1289,9 +4849,110 @@ async def results_page(
             {"request": request, "error": f"An error occurred: {str(e)}"}
         )
 
+def sorted_result_ids(exam: Exam, sort: str) -> List[str]:
+    """Student IDs with results in an exam, by ID or by best score first (ties by ID)."""
+    results = exam.results
+    if sort == "id":
+        return sorted(results)
+    return sorted(results, key=lambda student_id: (-results[student_id]["correct"], student_id))
+
+def score_percentage(result: Dict[str, Any]) -> float:
+    return result["correct"] / result["total"] * 100 if result.get("total") else 0.0
+
+def render_studentlist_page(exam: Exam, sort: str, page: int):
+    """
+    Return the text and navigation keyboard of one /studentlist page.
+    
+    Only the requested page is formatted, so the message stays well below
+    Telegram's length limit however many students there are.
+    """
+    student_ids = sorted_result_ids(exam, sort)
+    pages = max(1, -(-len(student_ids) // STUDENTLIST_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    
+    message = (
+        f"📊 <b>Student Exam Results: {html.escape(exam.exam_id)}</b>\n"
+        f"{len(student_ids)} students, sorted by {STUDENTLIST_SORTS[sort]} (page {page}/{pages})\n\n"
+    )
+    for student_id in student_ids[(page - 1) * STUDENTLIST_PAGE_SIZE:page * STUDENTLIST_PAGE_SIZE]:
+        result = exam.results[student_id]
+        student = approved_students.get(student_id, {})
+        name = html.escape(f"{student.get('name', 'N/A')} {student.get('surname', 'N/A')}")
+        message += f"👤 <b>{name}</b>\n"
+        message += f"ID: {html.escape(student_id)}\n"
+        message += f"Score: {result['correct']}/{result['total']} ({score_percentage(result):.1f}%)\n"
+        message += f"Correct: {result['correct']} | Incorrect: {result['incorrect']}\n\n"
+    
+    navigation = []
+    if page > 1:
+        navigation.append(InlineKeyboardButton("◀️ Prev", callback_data=f"studentlist:{exam.exam_id}:{sort}:{page - 1}"))
+    if page < pages:
+        navigation.append(InlineKeyboardButton("Next ▶️", callback_data=f"studentlist:{exam.exam_id}:{sort}:{page + 1}"))
+    other_sort = "id" if sort == "score" else "score"
+    keyboard = [navigation] if navigation else []
+    keyboard.append([
+        InlineKeyboardButton(
+            f"Sort by {STUDENTLIST_SORTS[other_sort]}",
+            callback_data=f"studentlist:{exam.exam_id}:{other_sort}:1"
+        )
+    ])
+    return message, InlineKeyboardMarkup(keyboard)
+
+def result_updated_at(result: Dict[str, Any]) -> str:
+    # Results stored before updated_at existed were last changed on submission
+    return result.get("updated_at") or result.get("timestamp", "")
+
+def result_export_record(student_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """One exported result, keyed by RESULT_EXPORT_FIELDS."""
+    student = approved_students.get(student_id, {})
+    answers = "".join(
+        answer if isinstance(answer, str) and len(answer) == 1 else "-"
+        for answer in result.get("answers", [])
+    )
+    return {
+        "student_id": student_id,
+        "name": student.get("name", ""),
+        "surname": student.get("surname", ""),
+        "correct": result["correct"],
+        "incorrect": result["incorrect"],
+        "total": result["total"],
+        "percentage": round(score_percentage(result), 1),
+        "submitted_at": result.get("timestamp", ""),
+        "updated_at": result_updated_at(result),
+        "answers": answers
+    }
+
+def result_export_row(student_id: str, result: Dict[str, Any]) -> List[Any]:
+    """One exported result, in RESULT_EXPORT_FIELDS order."""
+    record = result_export_record(student_id, result)
+    return [record[field] for field in RESULT_EXPORT_FIELDS]
+
+def write_results_csv(exam: Exam, student_ids) -> tempfile.SpooledTemporaryFile:
+    """
+    Write results as CSV into a spooled temporary file, rewound for reading.
+    
+    Rows are written one at a time and the file moves to disk past 1 MB, so
+    the export never exists as one string. The UTF-8 BOM lets spreadsheet
+    programs detect the encoding of non-ASCII names.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    text = io.TextIOWrapper(spool, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(RESULT_EXPORT_FIELDS)
+    for student_id in student_ids:
+        result = exam.results.get(student_id)
+        if result is not None:
+            writer.writerow(result_export_row(student_id, result))
+    text.flush()
+    text.detach()
+    spool.seek(0)
+    return spool
+
 async def studentlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Handle the /studentlist command to display all student results.
+    Handle the /studentlist command to display student results.
+    
+    Usage: /studentlist [exam] [score|id] [page], or /studentlist [exam] csv for a file.
     """
     user_id = update.effective_user.id
     if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
@@ -1299,32 +4960,170 @@ async def studentlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     try:
-        if not student_results:
+        exam, args = split_exam_arg(context.args or [])
+        if exam is None or not exam.results:
             await update.message.reply_text("No student results available.")
             return
         
-        # Format the student list message
-        message = "📊 <b>Student Exam Results</b>\n\n"
+        args = [arg.lower() for arg in args]
+        sort, page = "score", 1
+        for arg in args:
+            if arg in STUDENTLIST_SORTS:
+                sort = arg
+            elif arg.isdigit():
+                page = int(arg)
         
-        for student_id, result in student_results.items():
-            student = approved_students.get(student_id, {})
-            message += f"👤 <b>Student Information:</b>\n"
-            message += f"Name: {student.get('name', 'N/A')} {student.get('surname', 'N/A')}\n"
-            message += f"ID: {student_id}\n"
-            message += f"Score: {result['correct']}/{result['total']} ({(result['correct']/result['total']*100):.1f}%)\n"
-            message += f"Correct: {result['correct']}\n"
-            message += f"Incorrect: {result['incorrect']}\n"
-            message += "------------------------\n\n"
+        if "csv" in args:
+            spool = await asyncio.to_thread(write_results_csv, exam, sorted_result_ids(exam, sort))
+            with spool:
+                await update.message.reply_document(
+                    document=spool,
+                    filename=f"student-results-{exam.exam_id}-{datetime.date.today().isoformat()}.csv",
+                    caption=f"📊 Results of {len(exam.results)} students in exam {exam.exam_id}"
+                )
+            return
         
-        await update.message.reply_text(message, parse_mode='HTML')
+        message, reply_markup = render_studentlist_page(exam, sort, page)
+        await update.message.reply_text(message, parse_mode='HTML', reply_markup=reply_markup)
         
     except Exception as e:
         logger.error(f"Error in studentlist_command: {str(e)}")
         await update.message.reply_text(f"❌ Error retrieving student list: {str(e)}")
 
+async def handle_studentlist_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show another page or sort order of a /studentlist message."""
+    query = update.callback_query
+    if query.from_user.id not in verified_admins and query.message.chat.id != ADMIN_CHAT_ID_INT:
+        await query.answer("You need admin access to use this command.")
+        return
+    await query.answer()
+    
+    try:
+        parts = query.data.split(':')
+        # Buttons sent before exams had ids carry none
+        exam_id, sort, page = parts[1:] if len(parts) == 4 else (DEFAULT_EXAM_ID, *parts[1:])
+        if sort not in STUDENTLIST_SORTS:
+            sort = "score"
+        exam = exam_registry.exams.get(exam_id)
+        if exam is None or not exam.results:
+            await query.edit_message_text("No student results available.")
+            return
+        message, reply_markup = render_studentlist_page(exam, sort, int(page))
+        await query.edit_message_text(message, parse_mode='HTML', reply_markup=reply_markup)
+    except Exception as e:
+        logger.error(f"Error in handle_studentlist_page: {str(e)}")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle the /stats command to show item analysis of the exam results.
+    """
+    user_id = update.effective_user.id
+    if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
+        await update.message.reply_text("You need admin access to use this command.")
+        return
+    
+    try:
+        exam, _ = split_exam_arg(context.args or [])
+        exam = await load_exam(exam.exam_id) if exam else None
+        if exam is None:
+            await update.message.reply_text("No exam is currently loaded. Please upload a PDF first.")
+            return
+        await update.message.reply_text(format_statistics_report(exam_statistics(exam)), parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Error in stats_command: {str(e)}")
+        await update.message.reply_text(f"❌ Error computing statistics: {str(e)}")
+
+async def exams_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle the /exams command to list the exams.
+    """
+    user_id = update.effective_user.id
+    if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
+        await update.message.reply_text("You need admin access to use this command.")
+        return
+    
+    if not exam_registry.exams:
+        await update.message.reply_text("No exams have been uploaded yet. Use /upload to add one.")
+        return
+    
+    lines = ["📚 <b>Exams</b>\n"]
+    for exam in sorted(exam_registry.exams.values(), key=lambda exam: exam.created_at):
+        default = " (default)" if exam.exam_id == exam_registry.default_id else ""
+        questions = f"{exam.index.question_count} questions" if exam.loaded else "not in memory"
+        time_limit = f"{exam.time_limit // 60} minutes" if exam.time_limit else "untimed"
+        lines.append(
+            f"<b>{html.escape(exam.exam_id)}</b>{default}: {html.escape(exam.title)}\n"
+            f"{questions}, {time_limit}, answers {'set' if exam.correct_answers else 'not set'}, "
+            f"{len(exam.results)} results"
+        )
+    await update.message.reply_text("\n".join(lines), parse_mode='HTML')
+
+async def timer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle the /timer command to set the time limit of an exam.
+    """
+    user_id = update.effective_user.id
+    if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
+        await update.message.reply_text("You need admin access to use this command.")
+        return
+    
+    exam, args = split_exam_arg(context.args or [])
+    if len(args) != 1 or not args[0].isdigit():
+        await update.message.reply_text(
+            "Please provide the time limit in minutes.\n"
+            "Example: /timer 45, /timer <exam id> 45, or /timer 0 to remove the limit"
+        )
+        return
+    if exam is None:
+        await update.message.reply_text("No exam is currently loaded. Please upload a PDF first.")
+        return
+    
+    # Attempts already started keep their deadline
+    minutes = int(args[0])
+    exam.time_limit = minutes * 60 or None
+    exam.save()
+    if minutes:
+        await update.message.reply_text(f"✅ Exam {exam.exam_id} now has a time limit of {minutes} minutes per attempt.")
+    else:
+        await update.message.reply_text(f"✅ Exam {exam.exam_id} is no longer timed.")
+
+async def extend_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle the /extend command to give a student more time on a timed exam.
+    """
+    user_id = update.effective_user.id
+    if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
+        await update.message.reply_text("You need admin access to use this command.")
+        return
+    
+    exam, args = split_exam_arg(context.args or [])
+    if len(args) != 2 or not args[1].isdigit() or not int(args[1]):
+        await update.message.reply_text(
+            "Please provide the student ID and the extra minutes.\n"
+            "Example: /extend 12345 10, or /extend <exam id> 12345 10"
+        )
+        return
+    if exam is None:
+        await update.message.reply_text("No exam is currently loaded. Please upload a PDF first.")
+        return
+    
+    student_id, minutes = args[0], int(args[1])
+    async with student_locks.hold(student_id):
+        attempt = exam.attempts.get(student_id, {})
+        if not attempt.get("deadline") or attempt.get("completed", False):
+            await update.message.reply_text(f"Student {student_id} has no timed attempt in progress on exam {exam.exam_id}.")
+            return
+        # Counted from now if the deadline already passed but the attempt is not submitted yet
+        attempt["deadline"] = round(max(attempt["deadline"], time.time()) + minutes * 60, 3)
+        exam.put_attempt(student_id)
+    remaining = math.ceil((attempt["deadline"] - time.time()) / 60)
+    await update.message.reply_text(
+        f"✅ Student {student_id} has {minutes} more minutes on exam {exam.exam_id} ({remaining} minutes left)."
+    )
+
 async def deletelist_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Handle the /deletelist command to clear all student results.
+    Handle the /deletelist command to clear the student results of an exam.
     """
     user_id = update.effective_user.id
     if user_id not in verified_admins and update.effective_chat.id != ADMIN_CHAT_ID_INT:
@@ -1332,16 +5131,29 @@ async def deletelist_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     try:
+        exam, args = split_exam_arg(context.args or [])
+        if args:
+            await update.message.reply_text(f"Unknown exam: {args[0]}. Use /exams to list the exams.")
+            return
+        if exam is None:
+            await update.message.reply_text("No student results available.")
+            return
+        
         # Clear the student results
-        global student_results
-        student_results.clear()
+        exam.clear_results()
         
-        await update.message.reply_text("✅ All student results have been deleted successfully.")
+        await update.message.reply_text(f"✅ All student results of exam {exam.exam_id} have been deleted successfully.")
         
     except Exception as e:
         logger.error(f"Error in deletelist_command: {str(e)}")
         await update.message.reply_text(f"❌ Error deleting student results: {str(e)}")
 
+def retake_callback_target(data: str):
+    """The exam and student ID of a retake button; buttons sent before exams had ids carry none."""
+    parts = data.split(':')
+    exam_id = parts[2] if len(parts) > 2 else DEFAULT_EXAM_ID
+    return exam_registry.exams.get(exam_id), parts[1]
+
 # Add these new handlers to init_telegram_bot()
 async def handle_retake_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle approval of exam retake requests."""
@@ -1349,17 +5161,23 @@ async def handle_retake_approval(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
     
     try:
-        student_id = query.data.split(':')[1]
-        if student_id in student_attempts:
-            # Clear the previous attempt
-            student_attempts[student_id]["completed"] = False
-            student_attempts[student_id]["retake_pending"] = False
-            # Optionally clear previous results
-            if student_id in student_results:
-                del student_results[student_id]
+        exam, student_id = retake_callback_target(query.data)
+        if exam and student_id in exam.attempts:
+            # Reopen the attempt atomically with respect to in-flight submissions
+            async with student_locks.hold(student_id):
+                # Clear the previous attempt
+                exam.attempts[student_id]["completed"] = False
+                exam.attempts[student_id]["retake_pending"] = False
+                # A timed exam's clock starts again when the retake is opened
+                exam.attempts[student_id].pop("started_at", None)
+                exam.attempts[student_id].pop("deadline", None)
+                exam.put_attempt(student_id)
+                # Optionally clear previous results
+                exam.remove_result(student_id)
+            student_events.publish(student_id, "retake", retake_status(exam, student_id))
             
             await query.edit_message_text(
-                f"Retake approved for student {student_id}. ✅\n"
+                f"Retake of exam {exam.exam_id} approved for student {student_id}. ✅\n"
                 "They can now take the exam again."
             )
         else:
@@ -1374,11 +5192,13 @@ async def handle_retake_rejection(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     
     try:
-        student_id = query.data.split(':')[1]
-        if student_id in student_attempts:
-            student_attempts[student_id]["retake_pending"] = False
+        exam, student_id = retake_callback_target(query.data)
+        if exam and student_id in exam.attempts:
+            exam.attempts[student_id]["retake_pending"] = False
+            exam.put_attempt(student_id)
+            student_events.publish(student_id, "retake", retake_status(exam, student_id))
             await query.edit_message_text(
-                f"Retake rejected for student {student_id}. ❌\n"
+                f"Retake of exam {exam.exam_id} rejected for student {student_id}. ❌\n"
                 "They will not be allowed to take the exam again."
             )
         else:
@@ -1389,4 +5209,8 @@ async def handle_retake_rejection(update: Update, context: ContextTypes.DEFAULT_
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
+    if MULTI_WORKER:
+        # Each worker process imports the app itself
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000) 
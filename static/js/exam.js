@@ -1,181 +1,400 @@
-// Exam functionality
-document.addEventListener('DOMContentLoaded', function() {
-    // Store user answers
-    const userAnswers = {};
-    
-    // Update progress bar
-    function updateProgress() {
-        const totalQuestions = examQuestions.length;
-        const answeredCount = Object.keys(userAnswers).length;
-        const progressPercentage = (answeredCount / totalQuestions) * 100;
-        
-        document.getElementById('progress-fill').style.width = `${progressPercentage}%`;
-        document.getElementById('answered-count').textContent = answeredCount;
-        document.getElementById('total-questions').textContent = totalQuestions;
-    }
-    
-    // Generate the exam questions
-    function generateExam() {
-        const container = document.getElementById('questions-container');
-        
-        examQuestions.forEach(question => {
-            const questionElement = document.createElement('div');
-            questionElement.className = 'question-container unanswered';
-            questionElement.id = `question-${question.id}`;
-            
-            const questionText = document.createElement('div');
-            questionText.className = 'question-text';
-            questionText.textContent = `${question.id}. ${question.text}`;
-            
-            const optionsContainer = document.createElement('div');
-            optionsContainer.className = 'options-container';
-            
-            question.options.forEach(option => {
-                const optionItem = document.createElement('div');
-                optionItem.className = 'option-item';
-                optionItem.dataset.questionId = question.id;
-                optionItem.dataset.optionId = option.id;
-                
-                const radio = document.createElement('input');
-                radio.type = 'radio';
-                radio.name = `question-${question.id}`;
-                radio.value = option.id;
-                radio.className = 'option-radio';
-                radio.id = `option-${question.id}-${option.id}`;
-                
-                const label = document.createElement('label');
-                label.htmlFor = `option-${question.id}-${option.id}`;
-                label.textContent = `${option.id}. ${option.text}`;
-                
-                optionItem.appendChild(radio);
-                optionItem.appendChild(label);
-                
-                // Add click event to select the option
-                optionItem.addEventListener('click', () => {
-                    // Unselect all options for this question
-                    document.querySelectorAll(`input[name="question-${question.id}"]`).forEach(input => {
-                        input.checked = false;
-                        input.parentElement.classList.remove('selected');
-                    });
-                    
-                    // Select the clicked option
-                    radio.checked = true;
-                    optionItem.classList.add('selected');
-                    
-                    // Store the answer
-                    userAnswers[question.id] = option.id;
-                    
-                    // Update the question container class
-                    questionElement.classList.remove('unanswered');
-                    questionElement.classList.add('answered');
-                    
-                    // Update progress
-                    updateProgress();
-                });
-                
-                optionsContainer.appendChild(optionItem);
-            });
-            
-            questionElement.appendChild(questionText);
-            questionElement.appendChild(optionsContainer);
-            container.appendChild(questionElement);
+// Exam page client. The first questions are streamed from /api/exam and the
+// rest taken from the compressed exam document. Questions are rendered as
+// they arrive and then in batches as the student scrolls down, and answering
+// only toggles classes on the two options involved instead of re-rendering
+// the list. Answers are autosaved and, on a timed exam, submitted when the
+// countdown runs out.
+(function () {
+    'use strict';
+
+    // Questions rendered per batch, and how far below the viewport the next
+    // batch is added so that scrolling does not reach the end of the list
+    const RENDER_BATCH = 20;
+    const RENDER_AHEAD = '1500px';
+
+    // Questions streamed uncompressed so the page fills at once; the rest
+    // come with the exam document, which the server keeps compressed and
+    // the browser revalidates with its ETag
+    const FIRST_QUESTIONS = RENDER_BATCH;
+
+    // Autosave: changed answers are collected and sent together once the
+    // student pauses, or every few seconds while they keep clicking
+    const DRAFT_DEBOUNCE_MS = 1000;
+    const DRAFT_MAX_WAIT_MS = 5000;
+
+    function createQuestion(question, number, selected) {
+        const element = document.createElement('div');
+        element.className = 'question';
+        element.dataset.question = question.id;
+
+        const text = document.createElement('div');
+        text.className = 'question-text';
+        text.textContent = `${number}. ${question.text}`;
+
+        const options = document.createElement('div');
+        options.className = 'options';
+        options.setAttribute('role', 'radiogroup');
+        question.options.forEach(opt => {
+            const isSelected = opt.id === selected;
+            const option = document.createElement('div');
+            option.className = isSelected ? 'option selected' : 'option';
+            option.dataset.option = opt.id;
+            option.tabIndex = 0;
+            option.setAttribute('role', 'radio');
+            option.setAttribute('aria-checked', String(isSelected));
+            option.textContent = `${opt.id}. ${opt.text}`;
+            options.appendChild(option);
         });
-        
-        // Initialize progress
-        updateProgress();
+
+        element.append(text, options);
+        return element;
     }
-    
-    // Validate answers before submission
-    function validateAnswers() {
-        const validationMessage = document.getElementById('validation-message');
-        const unansweredQuestions = [];
-        
-        // Check if all questions are answered
-        examQuestions.forEach(question => {
-            if (!userAnswers[question.id]) {
-                unansweredQuestions.push(question.id);
-                document.getElementById(`question-${question.id}`).classList.add('unanswered');
-                document.getElementById(`question-${question.id}`).classList.remove('answered');
-            }
-        });
-        
-        if (unansweredQuestions.length > 0) {
-            // Show error message
-            validationMessage.textContent = `Please answer all questions! Unanswered questions: ${unansweredQuestions.join(', ')}`;
-            validationMessage.className = 'validation-message error';
-            
-            // Scroll to the first unanswered question
-            document.getElementById(`question-${unansweredQuestions[0]}`).scrollIntoView({
-                behavior: 'smooth',
-                block: 'center'
+
+    // The questions of an exam, rendered into `container` a batch at a time.
+    // One click listener on the container serves every option, including
+    // those of batches rendered later; `onSelect(questionId, optionId)` is
+    // called when the student picks a different option. A list created with
+    // `loading` set takes the rest of its questions through append() and
+    // finish() as they arrive.
+    class QuestionList {
+        constructor(container, questions, answers, onSelect, loading = false) {
+            this.container = container;
+            this.questions = questions;
+            this.answers = answers;
+            this.onSelect = onSelect;
+            this.loading = loading;
+            this.rendered = 0;
+            // How many questions should be on the page once they have arrived
+            this.wanted = 0;
+            this.sentinel = document.createElement('div');
+            this.sentinel.className = 'questions-sentinel';
+            container.replaceChildren(this.sentinel);
+
+            container.addEventListener('click', event => this.handle(event));
+            container.addEventListener('keydown', event => {
+                if ((event.key === 'Enter' || event.key === ' ') && this.handle(event)) {
+                    event.preventDefault();
+                }
             });
-            
-            return false;
-        } else {
-            // Show success message
-            validationMessage.textContent = 'All questions answered! You can now submit the exam.';
-            validationMessage.className = 'validation-message success';
+
+            this.renderUpTo(RENDER_BATCH);
+            if ('IntersectionObserver' in window) {
+                this.observer = new IntersectionObserver(entries => {
+                    // While the wanted questions are still arriving, append()
+                    // watches again once they are on the page
+                    if (entries.some(entry => entry.isIntersecting) && this.rendered >= this.wanted) {
+                        this.renderUpTo(this.rendered + RENDER_BATCH);
+                        this.watch();
+                    }
+                }, {rootMargin: `0px 0px ${RENDER_AHEAD} 0px`});
+                this.observer.observe(this.sentinel);
+            } else {
+                this.renderUpTo(Infinity);
+            }
+        }
+
+        // Observe the sentinel again: if it is still in range, say on a tall
+        // screen, that reports it once more for the next batch
+        watch() {
+            if (this.observer) {
+                this.observer.unobserve(this.sentinel);
+                this.observer.observe(this.sentinel);
+            }
+        }
+
+        append(questions) {
+            const rendered = this.rendered;
+            this.questions.push(...questions);
+            this.renderUpTo(this.wanted);
+            if (this.rendered > rendered) {
+                this.watch();
+            }
+        }
+
+        finish() {
+            this.loading = false;
+            this.renderUpTo(this.wanted);
+        }
+
+        renderUpTo(count) {
+            this.wanted = Math.max(this.wanted, count);
+            const end = Math.min(count, this.questions.length);
+            if (end <= this.rendered) {
+                this.disconnectWhenDone();
+                return;
+            }
+            const fragment = document.createDocumentFragment();
+            for (let i = this.rendered; i < end; i++) {
+                const question = this.questions[i];
+                fragment.appendChild(createQuestion(question, i + 1, this.answers[question.id]));
+            }
+            this.container.insertBefore(fragment, this.sentinel);
+            this.rendered = end;
+            this.disconnectWhenDone();
+        }
+
+        disconnectWhenDone() {
+            if (!this.loading && this.rendered === this.questions.length && this.observer) {
+                this.observer.disconnect();
+                this.observer = null;
+            }
+        }
+
+        handle(event) {
+            const option = event.target.closest('.option');
+            if (!option || !this.container.contains(option)) {
+                return false;
+            }
+            this.select(option.closest('.question'), option);
             return true;
         }
+
+        select(questionElement, option) {
+            const previous = questionElement.querySelector('.option.selected');
+            if (previous === option) {
+                return;
+            }
+            if (previous) {
+                previous.classList.remove('selected');
+                previous.setAttribute('aria-checked', 'false');
+            }
+            option.classList.add('selected');
+            option.setAttribute('aria-checked', 'true');
+            this.onSelect(questionElement.dataset.question, option.dataset.option);
+        }
+
+        // Render up to the question at `index` if needed and scroll to it
+        scrollTo(index) {
+            this.renderUpTo(index + 1);
+            this.container.children[index].scrollIntoView({behavior: 'smooth', block: 'center'});
+        }
     }
-    
-    // Handle form submission
-    async function handleSubmit(event) {
-        event.preventDefault();
-        
-        // Validate answers first
-        if (!validateAnswers()) {
+
+    // Read an NDJSON response, passing the items of each complete line to
+    // `onItems` as they arrive
+    async function readLines(response, onItems) {
+        const decoder = new TextDecoder();
+        let rest = '';
+        function parse(text, final) {
+            const lines = (rest + text).split('\n');
+            rest = final ? '' : lines.pop();
+            const items = lines.filter(line => line).map(line => JSON.parse(line));
+            if (items.length) {
+                onItems(items);
+            }
+        }
+
+        if (!response.body || !response.body.getReader) {
+            parse(await response.text(), true);
             return;
         }
-        
-        const formData = new FormData(event.target);
-        
-        // Add answers to form data
-        formData.append('answers', JSON.stringify(userAnswers));
-        
-        try {
-            const response = await fetch('/submit-exam', {
-                method: 'POST',
-                body: formData
-            });
-            
-            // Try to parse the response as JSON
-            let data;
+        const reader = response.body.getReader();
+        for (;;) {
+            const {done, value} = await reader.read();
+            if (done) {
+                break;
+            }
+            parse(decoder.decode(value, {stream: true}), false);
+        }
+        parse(decoder.decode(), true);
+    }
+
+    function startExamPage(config) {
+        const form = document.getElementById('exam-form');
+        const answersInput = document.getElementById('answers-input');
+        const submitButton = document.getElementById('submit-btn');
+        // Restored from the autosaved draft when the page is reopened
+        const answers = config.draft || {};
+        let questions = [];
+        let list = null;
+
+        let draftDelta = {};
+        let draftTimer = null;
+        let draftSince = 0;
+        let draftSaving = false;
+        let draftClosed = false;
+
+        function queueDraft(questionId, optionId) {
+            draftDelta[questionId] = optionId;
+            const now = Date.now();
+            if (!draftTimer) {
+                draftSince = now;
+            }
+            scheduleDraft(Math.min(DRAFT_DEBOUNCE_MS, draftSince + DRAFT_MAX_WAIT_MS - now));
+        }
+
+        function scheduleDraft(delay) {
+            clearTimeout(draftTimer);
+            draftTimer = setTimeout(saveDraft, Math.max(0, delay));
+        }
+
+        async function saveDraft() {
+            if (draftSaving) {
+                // One save at a time, so deltas arrive in order
+                scheduleDraft(200);
+                return;
+            }
+            draftTimer = null;
+            const delta = draftDelta;
+            if (draftClosed || Object.keys(delta).length === 0) {
+                return;
+            }
+            draftDelta = {};
+            draftSaving = true;
             try {
-                data = await response.json();
-            } catch (e) {
-                console.error('Failed to parse response as JSON:', e);
-                throw new Error('Server returned an invalid response format');
-            }
-            
-            // Handle different response statuses
-            if (!response.ok) {
-                // Server returned an error with a message
-                const errorMessage = data.detail || data.message || `Server error: ${response.status}`;
-                console.error('Server error:', errorMessage);
-                alert(`Error: ${errorMessage}`);
+                const response = await fetch(config.draftUrl, {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({answers: delta}),
+                    keepalive: true
+                });
+                if (response.status === 409) {
+                    // Submitted or out of time; nothing more to save
+                    draftClosed = true;
+                } else if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+            } catch (error) {
+                // Keep the unsaved answers, newer ones first, and try again later
+                console.error('Error saving answers:', error);
+                draftDelta = Object.assign(delta, draftDelta);
+                if (!draftTimer) {
+                    draftSince = Date.now();
+                    scheduleDraft(DRAFT_MAX_WAIT_MS);
+                }
+            } finally {
+                draftSaving = false;
+            }
+        }
+
+        // Save right away when the student leaves the tab or closes it
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden' && draftTimer) {
+                saveDraft();
+            }
+        });
+
+        function selectOption(questionId, optionId) {
+            answers[questionId] = optionId;
+            answersInput.value = JSON.stringify(answers);
+            queueDraft(questionId, optionId);
+        }
+
+        function submitOnTimeout() {
+            answersInput.value = JSON.stringify(answers);
+            submitButton.disabled = true;
+            form.submit();
+        }
+
+        // Count down against the server clock; the server submits the saved
+        // draft if this page does not submit in time
+        if (config.deadline) {
+            let deadline = config.deadline;
+            const clockOffset = config.serverTime - Date.now() / 1000;
+            const timeLeft = document.getElementById('time-left');
+
+            async function checkDeadline() {
+                try {
+                    const response = await fetch(config.deadlineUrl);
+                    const data = await response.json();
+                    if (data.deadline && data.deadline > deadline && !data.completed) {
+                        // An administrator extended the attempt
+                        deadline = data.deadline;
+                        return false;
+                    }
+                } catch (error) {
+                    console.error('Error checking the deadline:', error);
+                }
+                return true;
+            }
+
+            async function tick() {
+                const remaining = Math.max(0, Math.ceil(deadline - (Date.now() / 1000 + clockOffset)));
+                timeLeft.textContent = `${Math.floor(remaining / 60)}:${String(remaining % 60).padStart(2, '0')}`;
+                timeLeft.classList.toggle('running-out', remaining < 60);
+                if (remaining > 0) {
+                    setTimeout(tick, 1000);
+                } else if (await checkDeadline()) {
+                    submitOnTimeout();
+                } else {
+                    tick();
+                }
+            }
+
+            tick();
+        }
+
+        form.addEventListener('submit', (e) => {
+            if (loadFailed) {
+                // Without the questions there is nothing to submit but an empty answer sheet
+                e.preventDefault();
+                alert('The questions did not load. Please load them again before submitting.');
                 return;
             }
-            
-            // Handle successful response
-            if (data.status === 'success') {
-                alert('Your exam has been submitted successfully!');
-                window.location.href = '/';
-            } else {
-                console.log('Unexpected response:', data);
-                alert('Your exam was submitted, but received an unexpected response from the server.');
+            if (!list || list.loading) {
+                e.preventDefault();
+                alert('The questions are still loading. Please try again in a moment.');
+                return;
+            }
+            const unanswered = questions.findIndex(question => !answers[question.id]);
+            if (unanswered !== -1) {
+                e.preventDefault();
+                alert('Please answer all questions before submitting.');
+                list.scrollTo(unanswered);
+                return;
+            }
+
+            answersInput.value = JSON.stringify(answers);
+            // Avoid double submissions; the server also treats resends as duplicates
+            submitButton.disabled = true;
+        });
+
+        const loadError = document.getElementById('questions-error');
+        let loadFailed = false;
+        let total = Infinity;
+
+        // Load the questions that are not on the page yet; the retry button
+        // calls it again after a failure
+        async function loadQuestions() {
+            loadFailed = false;
+            loadError.hidden = true;
+            try {
+                if (!list) {
+                    // One question per line, so the first ones show before the
+                    // whole exam has downloaded
+                    const response = await fetch(`${config.streamUrl}&limit=${FIRST_QUESTIONS}`);
+                    if (!response.ok) {
+                        throw new Error((await response.json()).error);
+                    }
+                    total = Number(response.headers.get('X-Total-Count') || Infinity);
+                    list = new QuestionList(document.getElementById('questions-container'), questions, answers, selectOption, true);
+                    await readLines(response, items => list.append(items));
+                }
+                if (questions.length < total) {
+                    const rest = await fetch(config.examUrl);
+                    const data = await rest.json();
+                    if (!rest.ok) {
+                        throw new Error(data.error);
+                    }
+                    list.append(data.questions.slice(questions.length));
+                }
+                list.finish();
+            } catch (error) {
+                console.error('Error loading questions:', error);
+                document.getElementById('questions-error-message').textContent = 'Failed to load the questions.';
+                loadFailed = true;
+                loadError.hidden = false;
             }
-        } catch (error) {
-            // Handle network errors or other exceptions
-            console.error('Error during exam submission:', error);
-            alert(`Error: ${error.message || 'Network error. Please check your connection and try again.'}`);
         }
+
+        document.getElementById('questions-retry').addEventListener('click', loadQuestions);
+        loadQuestions();
+    }
+
+    window.ExamClient = {createQuestion, QuestionList, readLines};
+
+    const configElement = document.getElementById('exam-config');
+    if (configElement) {
+        startExamPage(JSON.parse(configElement.textContent));
     }
-    
-    // Add event listeners
-    document.getElementById('examForm').addEventListener('submit', handleSubmit);
-    document.getElementById('validate-btn').addEventListener('click', validateAnswers);
-    
-    // Initialize the exam
-    generateExam();
-}); 
\ No newline at end of file
+})();
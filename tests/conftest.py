@@ -0,0 +1,123 @@
+"""
+Shared fixtures.
+
+Every test runs main.py in a temporary directory with its own SQLite
+database. `make_worker` loads a fresh copy of the module per call, so two
+copies sharing one database behave like two server workers. Telegram is
+replaced by recorders: admin notifications end up in `worker.notifications`.
+"""
+import asyncio
+import importlib.util
+import itertools
+import os
+import time
+import types
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_module_ids = itertools.count()
+
+def load_main(name: str):
+    spec = importlib.util.spec_from_file_location(name, ROOT / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def fake_telegram(worker):
+    """Keep the worker off the network and record what it would send."""
+    async def noop(*args, **kwargs):
+        pass
+
+    sent = []
+
+    async def send_message(**kwargs):
+        sent.append(kwargs)
+
+    worker.init_telegram_bot = noop
+    worker.telegram_app = types.SimpleNamespace(
+        bot=types.SimpleNamespace(send_message=send_message, sent=sent),
+        updater=types.SimpleNamespace(running=False),
+        running=False,
+        stop=noop,
+        shutdown=noop
+    )
+    worker.notifications = []
+    worker.send_telegram_message = worker.notifications.append
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A scratch copy of the app's working directory."""
+    (tmp_path / "templates").symlink_to(ROOT / "templates")
+    (tmp_path / "static").symlink_to(ROOT / "static")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def make_worker(workdir, monkeypatch):
+    """
+    Load main.py with the given settings, e.g. make_worker(WORKERS="2").
+    Sessions and rate limits are off unless a test turns them on.
+    """
+    def make(**settings):
+        env = {
+            "TELEGRAM_BOT_TOKEN": "123:test",
+            "ADMIN_CHAT_ID": "-100",
+            "SECRET_KEY": "test-secret",
+            "DATABASE_PATH": str(workdir / "exam.db"),
+            "STUDENT_SESSIONS": "false",
+            "RATE_LIMIT_ENABLED": "false",
+            "PDF_WORKERS": "1"
+        }
+        env.update(settings)
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        worker = load_main(f"exam_worker_{next(_module_ids)}")
+        fake_telegram(worker)
+        return worker
+
+    return make
+
+@pytest.fixture
+def worker(make_worker):
+    return make_worker()
+
+@pytest.fixture
+def client(worker):
+    with TestClient(worker.app) as test_client:
+        yield test_client
+
+def add_exam(worker, exam_id: str, question_count: int = 3, answers=None):
+    """Publish a synthetic exam with `question_count` four-option questions."""
+    parsed = {
+        "questions": [
+            {"id": i, "text": f"{exam_id} question {i}", "options": [{"id": o, "text": o} for o in "abcd"]}
+            for i in range(1, question_count + 1)
+        ],
+        "page_offsets": [0]
+    }
+    pdf_path = os.path.join("uploads", f"{exam_id}.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(exam_id.encode())
+    digest = worker.hash_file(pdf_path)
+    worker.write_parse_cache(worker.parse_cache_path(digest), parsed)
+    exam = worker.Exam(exam_id, title=exam_id, pdf_path=pdf_path, digest=digest, answers=answers)
+    worker.exam_registry.add(exam)
+    worker.publish_exam(exam, parsed)
+    return exam
+
+def approve(worker, student_id: str):
+    student = {"student_id": student_id, "name": "Name", "surname": "Surname"}
+    worker.approved_students[student_id] = student
+    worker.storage.put("approved_students", student_id, student)
+
+def wait_until(client, condition, timeout: float = 5):
+    """Let the worker behind `client` run until `condition()` holds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the workers to agree")
+        client.portal.call(asyncio.sleep, 0.01)
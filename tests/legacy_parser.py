@@ -0,0 +1,115 @@
+"""
+The question parser as it was before the single-pass tokenizer, kept verbatim
+as the reference for the regression corpus. Do not fix it: the new parser
+must match its output for questions numbered below 100.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+logger.disabled = True  # It logs every question; only its output is compared
+
+def extract_questions_from_text(text):
+    """
+    Extract questions from the PDF text and generate multiple-choice options if needed.
+    """
+    logger.info("Starting question extraction from text")
+    
+    # Clean the text by normalizing line endings
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    
+    # Split into lines and remove empty lines
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    logger.info(f"Found {len(lines)} lines in the text")
+    
+    questions = []
+    current_question = None
+    current_options = []
+    option_letters = ['a', 'b', 'c', 'd', 'e', 'f', 'g']
+    question_id = 1
+    
+    for i, line in enumerate(lines):
+        # Check if line is a question (starts with a number)
+        if any(line.startswith(f"{num}.") or line.startswith(f"{num})") for num in range(1, 100)):
+            # If we have a previous question, save it
+            if current_question and current_options:
+                questions.append({
+                    "id": question_id,
+                    "text": current_question,
+                    "options": current_options
+                })
+                logger.info(f"Found question {question_id} with {len(current_options)} options")
+                question_id += 1
+            
+            # Start new question
+            current_question = line
+            current_options = []
+            continue
+        
+        # Check if line is an option
+        is_option = False
+        for opt in option_letters:
+            if line.lower().startswith(f"{opt}.") or line.lower().startswith(f"{opt})"):
+                # Check if this is really an option and not the start of a new question
+                # by looking at the content after the option identifier
+                option_content = line[2:].strip()
+                if option_content and not any(option_content.startswith(f"{num}.") or option_content.startswith(f"{num})") 
+                                           for num in range(1, 100)):
+                    current_options.append({
+                        "id": opt,
+                        "text": option_content
+                    })
+                    is_option = True
+                    break
+        
+        # If line is not an option and we have a current question with options,
+        # and the line looks like it might be the start of a new question,
+        # save the current question and start a new one
+        if not is_option and current_question and current_options:
+            if (i + 1 < len(lines) and 
+                any(lines[i + 1].lower().startswith(f"{opt}.") or lines[i + 1].lower().startswith(f"{opt})") 
+                    for opt in option_letters[:2])):  # Check if next line starts with 'a.' or 'b.'
+                questions.append({
+                    "id": question_id,
+                    "text": current_question,
+                    "options": current_options
+                })
+                logger.info(f"Found question {question_id} with {len(current_options)} options")
+                question_id += 1
+                current_question = line
+                current_options = []
+    
+    # Add the last question if there is one
+    if current_question and current_options:
+        questions.append({
+            "id": question_id,
+            "text": current_question,
+            "options": current_options
+        })
+        logger.info(f"Found final question {question_id} with {len(current_options)} options")
+    
+    # Validate questions and their options
+    validated_questions = []
+    for q in questions:
+        # Only include questions that have at least 2 options
+        if len(q["options"]) >= 2:
+            # Sort options by their ID to ensure they're in the correct order
+            q["options"] = sorted(q["options"], key=lambda x: x["id"])
+            validated_questions.append(q)
+            logger.info(f"Question {q['id']} validated with {len(q['options'])} options")
+        else:
+            logger.warning(f"Skipping question {q['id']} due to insufficient options ({len(q['options'])})")
+    
+    # If no valid questions were found, create a default question
+    if not validated_questions:
+        logger.warning("No valid questions found in the PDF, creating a default question")
+        validated_questions.append({
+            "id": 1,
+            "text": "No valid questions found in the PDF. Please upload a different file.",
+            "options": [
+                {"id": "a", "text": "Option A"},
+                {"id": "b", "text": "Option B"}
+            ]
+        })
+    
+    logger.info(f"Extracted {len(validated_questions)} valid questions from the text")
+    return validated_questions
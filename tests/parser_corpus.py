@@ -0,0 +1,34 @@
+"""
+Generated exam texts for the parser tests and benchmarks.
+
+`corpus()` mixes well-formed questions with the lines the parser has to get
+right: unnumbered questions followed by options, options whose text looks
+like a question number, upper-case and unknown option letters, decimals,
+stray text and every line-ending convention. It is seeded, so every run
+checks the same documents.
+"""
+import random
+
+LINES = [
+    "{n}. Question text {n}", "{n}) Another question", "  {n}. indented", "a) option", "b. option",
+    "C) upper case", "d.", "e) 5. looks numbered", "f) 12) numbered", "g. last letter", "h) not an option",
+    "continuation text", "  ", "", "0. zero", "01. leading zero", "A.", "a)   ", "b) 99. x", "1.5 decimal",
+    "9)", "B) x", "\t tab a) x", "a)x", "b)y", "Z) z", "ä) x", "Q without a number", "12a. weird", "-1. negative"
+]
+
+def random_exam_text(rng: random.Random, max_lines: int = 40) -> str:
+    lines = [rng.choice(LINES).format(n=rng.randint(1, 99)) for _ in range(rng.randint(0, max_lines))]
+    return rng.choice(["\n", "\r\n", "\r"]).join(lines) + rng.choice(["", "\n"])
+
+def corpus(count: int = 2000, seed: int = 1):
+    """`count` random documents, numbered below 100 like the old parser requires."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield random_exam_text(rng)
+
+def numbered_exam_text(question_count: int, first: int = 1) -> str:
+    """A well-formed exam of `question_count` questions with four options each."""
+    lines = []
+    for n in range(first, first + question_count):
+        lines += [f"{n}. What is item {n} about?", "a) first", "b) second", "c) third", "d) fourth"]
+    return "\n".join(lines)
@@ -0,0 +1,49 @@
+import types
+
+from conftest import add_exam, wait_until
+
+ADMIN = {"Authorization": "Bearer test-secret"}
+
+def test_metrics_need_the_admin_key(client):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers=ADMIN)
+    assert response.status_code == 200
+    assert "telegram" in response.json()
+
+def private_chat_update(worker, user_id=7):
+    """A command from a verified admin in a private chat, collecting the bot's replies."""
+    worker.verified_admins.add(user_id)
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    return types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=user_id, first_name="Ada"),
+        effective_chat=types.SimpleNamespace(id=user_id),
+        message=types.SimpleNamespace(reply_text=reply_text),
+        replies=replies
+    )
+
+def test_group_chat_notices_go_through_the_dispatcher(worker, client, monkeypatch):
+    queued = []
+    enqueue = worker.telegram_dispatcher.enqueue
+
+    def record(chat_id, text, **kwargs):
+        queued.append((chat_id, text))
+        enqueue(chat_id, text, **kwargs)
+
+    monkeypatch.setattr(worker.telegram_dispatcher, "enqueue", record)
+    add_exam(worker, "math")
+
+    update = private_chat_update(worker)
+    client.portal.call(worker.answer_command, update, types.SimpleNamespace(args=["math", "abc"]))
+    assert "set successfully" in update.replies[-1]
+    client.portal.call(worker.delete_command, update, types.SimpleNamespace(args=["math"]))
+    assert "deleted successfully" in update.replies[-1]
+
+    assert [chat_id for chat_id, _ in queued] == [worker.ADMIN_CHAT_ID_INT] * 2
+    assert queued[0][1].startswith("Admin Ada set answers")
+    assert queued[1][1] == "Admin Ada deleted exam math and its results."
+    wait_until(client, lambda: len(worker.telegram_app.bot.sent) == 2)
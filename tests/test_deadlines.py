@@ -0,0 +1,80 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+from conftest import add_exam, approve, wait_until
+from test_submission import stored, submit
+
+def open_attempt(worker, exam, student_id, deadline):
+    exam.attempts[student_id] = {"started_at": "2024-01-01T00:00:00", "deadline": deadline, "completed": False}
+    exam.put_attempt(student_id)
+
+def test_deadline_and_late_submit_on_different_workers_grade_once(make_worker):
+    # Worker A leads and submits timed-out attempts; B gets the late submits
+    a = make_worker(WORKERS="2", DEADLINE_GRACE="0")
+    b = make_worker(WORKERS="2", DEADLINE_GRACE="0")
+    students = [f"s{i}" for i in range(20)]
+    with TestClient(a.app) as client_a, TestClient(b.app) as client_b:
+        assert a.is_leader() and not b.is_leader()
+        exam = add_exam(a, "math", answers=list("abc"))
+        due = time.time() + 1
+        for student_id in students:
+            approve(a, student_id)
+            exam.drafts[student_id] = {"1": "a"}
+            a.storage.put(exam.collection("exam_drafts"), student_id, exam.drafts[student_id])
+            open_attempt(a, exam, student_id, due)
+        client_a.portal.call(a.storage.sync)
+        wait_until(client_b, lambda: "math" in b.exam_registry.exams
+                   and set(students) <= set(b.exam_registry.exams["math"].attempts))
+
+        def late_submit(student_id):
+            time.sleep(max(0, due - time.time()))
+            return submit(client_b, student_id, accept="text/html")
+
+        with ThreadPoolExecutor(len(students)) as pool:
+            responses = list(pool.map(late_submit, students))
+        assert {r.status_code for r in responses} == {303}
+
+        wait_until(client_a, lambda: set(students) <= set(exam.results))
+        assert len(a.notifications) + len(b.notifications) == len(students)
+        results = stored(a, "student_results:math")
+        # Late answers never count: every student is graded on the draft
+        assert {s: results[s]["correct"] for s in students} == {s: 1 for s in students}
+
+def test_late_submit_on_a_lagging_follower_after_the_deadline_submission(make_worker):
+    a = make_worker(WORKERS="2", DEADLINE_GRACE="0")
+    b = make_worker(WORKERS="2", DEADLINE_GRACE="0")
+    with TestClient(a.app) as client_a, TestClient(b.app) as client_b:
+        exam = add_exam(a, "math", answers=list("abc"))
+        approve(a, "s1")
+        exam.drafts["s1"] = {"1": "a"}
+        open_attempt(a, exam, "s1", time.time() + 0.5)
+        client_a.portal.call(a.storage.sync)
+        wait_until(client_b, lambda: "math" in b.exam_registry.exams
+                   and "s1" in b.exam_registry.exams["math"].attempts)
+
+        # B stops reading the change log, so it never learns of the auto-submission
+        async def lagging():
+            pass
+        b.change_feed.catch_up = lagging
+        wait_until(client_a, lambda: "s1" in exam.results)
+        time.sleep(0.1)
+
+        response = submit(client_b, "s1", {"1": "a", "2": "b", "3": "c"}, accept="text/html")
+        assert response.status_code == 409
+        assert len(a.notifications) == 1 and b.notifications == []
+        assert stored(a, "student_results:math")["s1"]["correct"] == 1
+
+def test_deadline_submits_draft_of_silent_student(worker, client):
+    worker.DEADLINE_GRACE = 0
+    exam = add_exam(worker, "math", answers=list("abc"))
+    approve(worker, "s1")
+    exam.drafts["s1"] = {"1": "a", "2": "b"}
+    open_attempt(worker, exam, "s1", time.time() + 0.2)
+
+    wait_until(client, lambda: "s1" in exam.results)
+    assert exam.results["s1"]["correct"] == 2
+    assert exam.attempts["s1"]["completed"]
+    assert "s1" not in exam.drafts
+    assert len(worker.notifications) == 1
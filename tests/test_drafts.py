@@ -0,0 +1,20 @@
+import json
+
+from conftest import add_exam, approve
+
+def exam_config(client, student_id):
+    page = client.get("/exam", params={"student_id": student_id, "exam_id": "math"})
+    assert page.status_code == 200
+    return json.loads(page.text.split('<script id="exam-config" type="application/json">')[1].split("</script>")[0])
+
+def test_draft_of_a_student_id_with_url_characters(worker, client):
+    exam = add_exam(worker, "math")
+    student_id = "a&b #c+d"
+    approve(worker, student_id)
+    approve(worker, "a")
+    config = exam_config(client, student_id)
+
+    response = client.post(config["draftUrl"], json={"answers": {"1": "b"}})
+    assert response.status_code == 204
+    assert exam.drafts == {student_id: {"1": "b"}}
+    assert client.get(config["deadlineUrl"]).json()["exam_id"] == "math"
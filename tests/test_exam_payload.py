@@ -0,0 +1,19 @@
+import json
+
+from conftest import add_exam, approve
+
+def test_exam_page_streams_the_first_questions_and_fetches_the_compressed_rest(worker, client):
+    add_exam(worker, "math", question_count=50)
+    approve(worker, "s1")
+    page = client.get("/exam", params={"student_id": "s1", "exam_id": "math"})
+    config = json.loads(page.text.split('<script id="exam-config" type="application/json">')[1].split("</script>")[0])
+
+    first = client.get(config["streamUrl"] + "&limit=20")
+    assert first.headers["x-total-count"] == "50"
+    assert [json.loads(line)["id"] for line in first.text.splitlines()] == list(range(1, 21))
+
+    rest = client.get(config["examUrl"], headers={"Accept-Encoding": "gzip"})
+    assert rest.headers["content-encoding"] == "gzip"
+    assert len(rest.json()["questions"]) == 50
+    revalidated = client.get(config["examUrl"], headers={"Accept-Encoding": "gzip", "If-None-Match": rest.headers["etag"]})
+    assert revalidated.status_code == 304
@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import types
+
+from fastapi.testclient import TestClient
+
+from conftest import add_exam, approve, wait_until
+from test_submission import submit
+
+def export_response(client, since=None, export_format="jsonl"):
+    params = {"format": export_format, "exam_id": "math"}
+    if since is not None:
+        params["since"] = since
+    response = client.get("/api/results/export", params=params, headers={"Authorization": "Bearer test-secret"})
+    assert response.status_code == 200
+    return response
+
+def export_records(client, since=None):
+    response = export_response(client, since)
+    return [json.loads(line) for line in response.text.splitlines()], response.headers["x-export-cursor"]
+
+def export(client, since=None):
+    records, cursor = export_records(client, since)
+    return [record["student_id"] for record in records], cursor
+
+def admin_update(worker, args=()):
+    """A Telegram command update from the admin chat, collecting the bot's replies."""
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    return types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=1),
+        effective_chat=types.SimpleNamespace(id=worker.ADMIN_CHAT_ID_INT),
+        message=types.SimpleNamespace(reply_text=reply_text),
+        replies=replies
+    ), types.SimpleNamespace(args=list(args))
+
+def approve_retake(worker, client, student_id, exam_id="math"):
+    async def noop(*args, **kwargs):
+        pass
+
+    query = types.SimpleNamespace(data=f"retake_approve:{student_id}:{exam_id}", answer=noop, edit_message_text=noop)
+    client.portal.call(worker.handle_retake_approval, types.SimpleNamespace(callback_query=query), None)
+
+def test_export_cursor_follows_writes_not_timestamps(worker, client):
+    exam = add_exam(worker, "math", answers=list("abc"))
+    for student_id in ("s1", "s2"):
+        approve(worker, student_id)
+    submit(client, "s1")
+    submit(client, "s2")
+
+    students, cursor = export(client)
+    assert students == ["s1", "s2"]
+    assert export(client, cursor) == ([], cursor)
+
+    # A regrade committed late, stamped before the previous pull
+    result = dict(exam.results["s1"], correct=3, updated_at="2000-01-01T00:00:00")
+    exam.put_result("s1", result)
+    students, next_cursor = export(client, cursor)
+    assert students == ["s1"] and int(next_cursor) > int(cursor)
+
+def test_export_includes_results_written_by_another_worker(make_worker):
+    a = make_worker(WORKERS="2")
+    b = make_worker(WORKERS="2")
+    with TestClient(a.app) as client_a, TestClient(b.app) as client_b:
+        add_exam(a, "math", answers=list("abc"))
+        approve(a, "s1")
+        approve(a, "s2")
+        client_a.portal.call(a.storage.sync)
+        wait_until(client_b, lambda: "math" in b.exam_registry.exams and "s2" in b.approved_students)
+
+        submit(client_a, "s1")
+        _, cursor = export(client_a)
+        # B's clock is behind: its result is stamped before what A already exported
+        exam_b = client_b.portal.call(b.load_exam, "math")
+        result = dict(a.exam_registry.exams["math"].results["s1"], updated_at="2000-01-01T00:00:00")
+        exam_b.put_result("s2", result)
+        client_b.portal.call(b.storage.sync)
+        assert export(client_a, cursor)[0] == ["s2"]
+
+def test_incremental_export_reports_retakes_and_deleted_lists(worker, client):
+    add_exam(worker, "math", answers=list("abc"))
+    for student_id in ("s1", "s2", "s3"):
+        approve(worker, student_id)
+        submit(client, student_id)
+    _, cursor = export(client)
+
+    # A retake removes the student's result until they submit again
+    approve_retake(worker, client, "s1")
+    records, cursor = export_records(client, cursor)
+    assert records == [{"student_id": "s1", "deleted": True}]
+    assert export(client, cursor) == ([], cursor)
+    # A full export only lists the results that exist
+    assert export(client)[0] == ["s2", "s3"]
+
+    submit(client, "s1")
+    students, cursor = export(client, cursor)
+    assert students == ["s1"]
+
+    update, context = admin_update(worker, ["math"])
+    client.portal.call(worker.deletelist_command, update, context)
+    assert "deleted successfully" in update.replies[-1]
+    records, cursor = export_records(client, cursor)
+    assert sorted(r["student_id"] for r in records) == ["s1", "s2", "s3"]
+    assert all(r == {"student_id": r["student_id"], "deleted": True} for r in records)
+    assert export(client) == ([], cursor)
+
+    # In CSV each row carries its action
+    approve_retake(worker, client, "s2")
+    submit(client, "s2")
+    response = export_response(client, cursor, export_format="csv")
+    cursor = response.headers["x-export-cursor"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["student_id"], row["correct"], row["action"]) for row in rows] == [("s2", "2", "upsert")]
+    approve_retake(worker, client, "s2")
+    rows = list(csv.DictReader(io.StringIO(export_response(client, cursor, export_format="csv").text)))
+    assert [(row["student_id"], row["correct"], row["action"]) for row in rows] == [("s2", "", "delete")]
+
+def test_export_pages_through_storage_up_to_its_cursor(worker, client, monkeypatch):
+    exam = add_exam(worker, "math", answers=list("abc"))
+    students = [f"s{i}" for i in range(5)]
+    for student_id in students:
+        approve(worker, student_id)
+        submit(client, student_id)
+    monkeypatch.setattr(worker, "RESULT_EXPORT_CHUNK", 2)
+    pages = []
+    changed_since = worker.storage.changed_since
+
+    def read_page(*args):
+        rows = changed_since(*args)
+        pages.append(len(rows))
+        if len(pages) == 1:
+            # Committed while the export streams, after its cursor was taken
+            exam.put_result("late", dict(exam.results["s0"]))
+            worker.storage.flush()
+        return rows
+
+    monkeypatch.setattr(worker.storage, "changed_since", read_page)
+    exported, cursor = export(client)
+    assert exported == students
+    assert pages == [2, 2, 1]
+    assert "x-export-count" not in export_response(client).headers
+
+    monkeypatch.setattr(worker.storage, "changed_since", changed_since)
+    assert export(client, cursor)[0] == ["late"]
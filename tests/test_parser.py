@@ -0,0 +1,40 @@
+import pickle
+import random
+import sys
+
+import legacy_parser
+from parser_corpus import corpus, numbered_exam_text
+
+def test_parser_matches_the_legacy_parser_on_the_corpus(worker):
+    for text in corpus():
+        assert worker.extract_questions_from_text(text) == legacy_parser.extract_questions_from_text(text), text
+
+def test_parser_matches_the_legacy_parser_on_a_full_exam(worker):
+    text = numbered_exam_text(99)
+    assert worker.extract_questions_from_text(text) == legacy_parser.extract_questions_from_text(text)
+
+def test_questions_numbered_past_99(worker):
+    questions = worker.extract_questions_from_text(numbered_exam_text(3, first=99))
+    assert [q["text"] for q in questions] == [
+        "99. What is item 99 about?", "100. What is item 100 about?", "101. What is item 101 about?"
+    ]
+    assert [q["id"] for q in questions] == [1, 2, 3]
+    assert all(len(q["options"]) == 4 for q in questions)
+
+def test_parallel_page_ranges_stitch_like_the_whole_document(worker, monkeypatch):
+    monkeypatch.setitem(sys.modules, worker.__name__, worker)  # For pickling its ExamParseState
+    rng = random.Random(3)
+    for text in corpus(count=1000, seed=3):
+        # Cut the text into pages anywhere, even mid-line, and group them into ranges
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 8))))
+        pages = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        monkeypatch.setattr(worker, "iter_pdf_pages", lambda path, start, end: iter(pages[start:end]))
+        step = rng.randint(1, 3)
+        state = worker.ExamParseState()
+        questions = []
+        for start in range(0, len(pages), step):
+            end = min(start + step, len(pages))
+            # Ranges come back from worker processes pickled
+            part = pickle.loads(pickle.dumps(worker.split_pdf_range("exam.pdf", start, end, end == len(pages))))
+            questions.extend(worker.stitch_pdf_range(state, part, end == len(pages)))
+        assert (questions or worker.no_questions_placeholder()) == legacy_parser.extract_questions_from_text(text), pages
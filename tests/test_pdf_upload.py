@@ -0,0 +1,75 @@
+import os
+import sys
+import types
+
+import fitz
+
+from conftest import add_exam
+
+def make_pdf(path, question_count):
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 40
+    for n in range(1, question_count + 1):
+        for line in [f"{n}. What is item {n} about?", "a) first", "b) second", "c) third", "d) fourth"]:
+            page.insert_text((40, y), line)
+            y += 14
+    doc.save(path)
+
+def upload(worker, client, exam_id, content: bytes):
+    """Send `content` to handle_pdf as the admin's PDF upload for `exam_id`; return the replies."""
+    replies = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+        async def edit_text(text):
+            pass
+        return types.SimpleNamespace(edit_text=edit_text)
+
+    async def download_to_drive(path):
+        with open(path, "wb") as f:
+            f.write(content)
+
+    async def get_file(file_id):
+        return types.SimpleNamespace(download_to_drive=download_to_drive)
+
+    update = types.SimpleNamespace(
+        effective_user=types.SimpleNamespace(id=1),
+        effective_chat=types.SimpleNamespace(id=worker.ADMIN_CHAT_ID_INT),
+        message=types.SimpleNamespace(
+            document=types.SimpleNamespace(mime_type="application/pdf", file_name=f"{exam_id}.pdf", file_id="f1"),
+            reply_text=reply_text
+        )
+    )
+    context = types.SimpleNamespace(user_data={"upload_exam_id": exam_id}, bot=types.SimpleNamespace(get_file=get_file))
+    client.portal.call(worker.handle_pdf, update, context)
+    return replies
+
+def test_bad_reupload_leaves_the_exam_as_it_was(worker, client, monkeypatch):
+    monkeypatch.setitem(sys.modules, worker.__name__, worker)
+    exam = add_exam(worker, "math", answers=list("abc"))
+    pdf_path = os.path.join("uploads", "math.pdf")
+    with open(pdf_path, "rb") as f:
+        live = f.read()
+    digest = exam.digest
+
+    replies = upload(worker, client, "math", b"not a pdf")
+
+    assert replies[-1].startswith("Error processing PDF")
+    with open(pdf_path, "rb") as f:
+        assert f.read() == live
+    assert exam.digest == digest and len(exam.parsed["questions"]) == 3
+    assert not [name for name in os.listdir("uploads") if name.endswith(".tmp")]
+
+    # A good upload replaces the PDF and the questions
+    make_pdf("good.pdf", 5)
+    with open("good.pdf", "rb") as f:
+        good = f.read()
+    replies = upload(worker, client, "math", good)
+
+    assert "Found 5 questions" in replies[-1]
+    with open(pdf_path, "rb") as f:
+        assert f.read() == good
+    assert worker.exam_registry.exams["math"].digest != digest
+    assert not [name for name in os.listdir("uploads") if name.endswith(".tmp")]
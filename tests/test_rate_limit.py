@@ -0,0 +1,50 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import add_exam, approve
+from test_submission import submit
+
+@pytest.fixture
+def limited(make_worker):
+    worker = make_worker(STUDENT_SESSIONS="true", RATE_LIMIT_ENABLED="true", RATE_LIMIT_TRUST_PROXY="true")
+    with TestClient(worker.app) as client:
+        add_exam(worker, "math", answers=list("abc"))
+        approve(worker, "s1")
+        yield worker, client
+
+def sign_in(worker, client, student_id):
+    claim = "claim-of-" + student_id
+    client.cookies.set(worker.CLAIM_COOKIE, claim)
+    client.cookies.set(worker.SESSION_COOKIE, worker.session_tokens.issue(student_id, worker.claim_hash(claim)))
+
+def test_rejected_request_takes_no_token(worker):
+    limiter = worker.RateLimiter({"rule": {"ip": (60, 5), "student": (60, 1)}}, 100)
+    clients = {"ip": "10.0.0.1", "student": "s1"}
+
+    assert limiter.check("rule", clients) == 0
+    assert limiter.check("rule", clients) > 0
+    assert limiter.check("rule", clients) > 0
+
+    assert limiter._buckets[("rule", "ip", "10.0.0.1")].tokens == pytest.approx(4, abs=0.01)
+    assert limiter.rejected == {"rule:student": 2}
+
+def test_student_bucket_only_charged_with_a_session(limited):
+    worker, client = limited
+    # Someone else naming s1 in the form only drains their own IP's bucket
+    for _ in range(10):
+        response = submit(client, "s1", **{"x-forwarded-for": "10.0.0.66"})
+        assert response.status_code in (403, 429)
+    assert worker.rate_limiter.rejected.get("submit-exam:student") is None
+
+    sign_in(worker, client, "s1")
+    response = submit(client, "s1", **{"x-forwarded-for": "10.0.0.1"})
+    assert response.status_code == 303
+
+def test_session_student_is_limited(limited):
+    worker, client = limited
+    sign_in(worker, client, "s1")
+    # The burst of the student's submit bucket is 5, across addresses
+    statuses = [submit(client, "s1", **{"x-forwarded-for": f"10.0.0.{i}"}).status_code for i in range(6)]
+    assert statuses[:5] == [303] * 5
+    assert statuses[5] == 429
+    assert worker.rate_limiter.rejected == {"submit-exam:student": 1}
@@ -0,0 +1,45 @@
+import random
+
+from conftest import add_exam, approve
+from test_submission import stored, submit
+
+def test_answer_matrix_matches_a_plain_reference(worker):
+    rng = random.Random(3)
+    width = 7
+    matrix = worker.AnswerMatrix(width)
+    reference = {}
+    for step in range(5000):
+        student_id = f"s{rng.randint(0, 40)}"
+        op = rng.random()
+        if op < 0.6:
+            row = "".join(rng.choice("abcd" + worker.NO_ANSWER) for _ in range(width))
+            reference[student_id] = row
+            matrix.set(student_id, row)
+        elif op < 0.9:
+            reference.pop(student_id, None)
+            matrix.remove(student_id)
+        else:
+            reference.clear()
+            matrix.clear()
+        if step % 50 == 0:
+            key = "".join(rng.choice("abcd") for _ in range(rng.choice([0, 3, width])))
+            matrix.set_key(key)
+            expected = {s: sum(a == k for a, k in zip(row, key)) for s, row in reference.items()}
+            assert matrix.scores(key) == expected
+            assert dict(zip(matrix.student_ids, matrix.row_scores)) == expected
+            assert sum(matrix.score_histogram) == len(reference)
+
+def test_new_answer_key_regrades_stored_results(worker, client):
+    exam = add_exam(worker, "math", answers=list("abc"))
+    for student_id, answers in (("s1", "abc"), ("s2", "abd"), ("s3", "ddd")):
+        approve(worker, student_id)
+        submit(client, student_id, dict(zip("123", answers)))
+
+    exam.set_correct_answers(list("abd"))
+    changes = worker.regrade_results(exam)
+
+    assert sorted(changes) == [("s1", 3, 2), ("s2", 2, 3), ("s3", 0, 1)]
+    results = stored(worker, "student_results:math")
+    assert {s: (r["correct"], r["incorrect"]) for s, r in results.items()} == {
+        "s1": (2, 1), "s2": (3, 0), "s3": (1, 2)
+    }
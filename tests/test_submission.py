@@ -0,0 +1,116 @@
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import add_exam, approve, wait_until
+
+ANSWERS = {"1": "a", "2": "b", "3": "d"}
+
+def submit(client, student_id, answers=ANSWERS, submission_id=None, exam_id="math", **headers):
+    data = {"student_id": student_id, "answers": json.dumps(answers), "exam_id": exam_id}
+    if submission_id:
+        data["submission_id"] = submission_id
+    return client.post("/submit-exam", data=data, headers=headers, follow_redirects=False)
+
+def stored(worker, collection):
+    """Rows of a collection as committed to the database."""
+    worker.storage.flush()
+    with sqlite3.connect(worker.DATABASE_PATH) as conn:
+        rows = conn.execute("SELECT key, value FROM kv WHERE collection = ?", (collection,)).fetchall()
+    return {key: json.loads(value) for key, value in rows}
+
+def submit_all_at_once(requests):
+    """Send (client, student_id, submission_id) submissions from as many threads, released together."""
+    barrier = threading.Barrier(len(requests))
+
+    def send(request):
+        client, student_id, submission_id = request
+        barrier.wait()
+        return submit(client, student_id, submission_id=submission_id, accept="text/html")
+
+    with ThreadPoolExecutor(len(requests)) as pool:
+        return list(pool.map(send, requests))
+
+def test_resend_returns_stored_result(worker, client):
+    add_exam(worker, "math", answers=list("abc"))
+    approve(worker, "s1")
+
+    first = submit(client, "s1", submission_id="k1")
+    resend = submit(client, "s1", {"1": "d"}, submission_id="k1")
+    other = submit(client, "s1", {"1": "d"}, submission_id="k2")
+
+    assert first.status_code == resend.status_code == other.status_code == 303
+    assert first.headers["location"] == resend.headers["location"] == other.headers["location"]
+    assert "correct=2" in first.headers["location"]
+    assert len(worker.notifications) == 1
+    assert stored(worker, "student_results:math")["s1"]["correct"] == 2
+
+def test_concurrent_submits_on_one_worker_grade_once(worker, client):
+    add_exam(worker, "math", answers=list("abc"))
+    students = [f"s{i}" for i in range(10)]
+    for student_id in students:
+        approve(worker, student_id)
+
+    responses = submit_all_at_once([(client, s, f"{s}-{n}") for s in students for n in range(4)])
+
+    assert {r.status_code for r in responses} == {303}
+    assert len(worker.notifications) == len(students)
+    assert set(stored(worker, "student_results:math")) == set(students)
+
+@pytest.mark.parametrize("async_grading", ["false", "true"])
+def test_concurrent_submits_across_workers_grade_once(make_worker, async_grading):
+    a = make_worker(WORKERS="2", ASYNC_GRADING=async_grading)
+    b = make_worker(WORKERS="2", ASYNC_GRADING=async_grading)
+    students = [f"s{i}" for i in range(12)]
+    with TestClient(a.app) as client_a, TestClient(b.app) as client_b:
+        add_exam(a, "math", answers=list("abc"))
+        for student_id in students:
+            approve(a, student_id)
+        client_a.portal.call(a.storage.sync)
+        wait_until(client_b, lambda: "math" in b.exam_registry.exams and set(students) <= set(b.approved_students))
+
+        # Double clicks and resends of every student, spread over both workers
+        requests = [((client_a, client_b)[n % 2], s, f"{s}-{n}") for s in students for n in range(6)]
+        responses = submit_all_at_once(requests)
+        assert {r.status_code for r in responses} == {303}
+
+        exam_a = a.exam_registry.exams["math"]
+        wait_until(client_a, lambda: set(students) <= set(exam_a.results), timeout=10)
+        assert len(a.notifications) + len(b.notifications) == len(students)
+        assert set(stored(a, "student_results:math")) == set(students)
+        attempts = stored(a, "student_attempts:math")
+        assert all(attempts[s]["completed"] for s in students)
+        assert stored(a, "submission_queue") == {}
+
+def test_submit_loses_to_a_completed_attempt_on_another_worker(make_worker):
+    a = make_worker(WORKERS="2")
+    b = make_worker(WORKERS="2")
+    with TestClient(a.app) as client_a, TestClient(b.app) as client_b:
+        add_exam(a, "math", answers=list("abc"))
+        approve(a, "s1")
+        client_a.portal.call(a.storage.sync)
+        wait_until(client_b, lambda: "math" in b.exam_registry.exams and "s1" in b.approved_students)
+        exam_b = client_b.portal.call(b.load_exam, "math")
+        # B stops following A, so its memory still shows the attempt as open
+        client_b.portal.call(b.change_feed.close)
+
+        assert submit(client_a, "s1", submission_id="k1").status_code == 303
+        assert not exam_b.attempts.get("s1", {}).get("completed")
+
+        async def submit_on_b():
+            async with b.student_locks.hold("s1"):
+                return await b.record_submission(exam_b, "s1", {"1": "d"}, "k2", exam_b.index)
+
+        assert client_b.portal.call(submit_on_b) == (None, None)
+        assert b.notifications == []
+        assert stored(a, "student_results:math")["s1"]["correct"] == 2
+
+        # Through the route, B takes over A's result and answers as to a resend
+        response = submit(client_b, "s1", submission_id="k2")
+        assert response.status_code == 303
+        assert "correct=2" in response.headers["location"]
+        assert len(a.notifications) == 1 and b.notifications == []
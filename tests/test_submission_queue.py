@@ -0,0 +1,63 @@
+from fastapi.testclient import TestClient
+
+from conftest import add_exam, approve, wait_until
+from test_submission import stored, submit
+
+def failing_grader(worker, failures):
+    """Make grading raise `failures` times, then grade as usual."""
+    grade_answers = worker.grade_answers
+    calls = []
+
+    def grade(*args):
+        calls.append(args)
+        if len(calls) <= failures:
+            raise RuntimeError("grader crashed")
+        return grade_answers(*args)
+
+    worker.grade_answers = grade
+    return calls
+
+def test_failed_grading_is_retried(make_worker):
+    worker = make_worker(ASYNC_GRADING="true", GRADING_MAX_ATTEMPTS="3")
+    calls = failing_grader(worker, failures=1)
+    with TestClient(worker.app) as client:
+        exam = add_exam(worker, "math", answers=list("abc"))
+        approve(worker, "s1")
+
+        receipt = submit(client, "s1").json()["receipt"]
+        wait_until(client, lambda: "s1" in exam.results)
+
+        assert len(calls) == 2
+        assert client.get(f"/api/submissions/{receipt}").json()["status"] == "graded"
+        assert worker.submission_queue.metrics()["retried"] == 1
+        assert len(worker.notifications) == 1
+
+def test_given_up_grading_reopens_the_attempt(make_worker):
+    worker = make_worker(ASYNC_GRADING="true", GRADING_MAX_ATTEMPTS="2")
+    calls = failing_grader(worker, failures=2)
+    with TestClient(worker.app) as client:
+        exam = add_exam(worker, "math", answers=list("abc"))
+        approve(worker, "s1")
+
+        receipt = submit(client, "s1", submission_id="k1").json()["receipt"]
+        wait_until(client, lambda: worker.submission_queue.metrics()["failed"] == 1)
+
+        status = client.get(f"/api/submissions/{receipt}").json()
+        assert status["status"] == "failed"
+        assert status["exam_url"] == "/exam?student_id=s1&exam_id=math"
+        assert len(calls) == 2
+        attempt = stored(worker, "student_attempts:math")["s1"]
+        assert not attempt["completed"] and attempt["failed_receipt"] == receipt
+        # The submitted answers are back as the draft, and the queue is empty
+        assert stored(worker, "exam_drafts:math")["s1"] == {"1": "a", "2": "b", "3": "d"}
+        assert stored(worker, "submission_queue") == {}
+        # The results page keeps the student on the grading page, which shows the failure
+        page = client.get("/results/s1?exam_id=math")
+        assert page.status_code == 200 and "grading-failed" in page.text
+
+        # The same submission key is a new submission now, and goes through
+        receipt = submit(client, "s1", submission_id="k1").json()["receipt"]
+        wait_until(client, lambda: "s1" in exam.results)
+        assert client.get(f"/api/submissions/{receipt}").json()["status"] == "graded"
+        assert "failed_receipt" not in stored(worker, "student_attempts:math")["s1"]
+        assert len(worker.notifications) == 1